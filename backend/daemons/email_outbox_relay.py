@@ -0,0 +1,21 @@
+# coding=utf-8
+# Runner for daemon
+import os
+
+from pyramid.paster import get_appsettings
+from pyramid.paster import setup_logging
+from tracim_backend.config import CFG
+from tracim_backend.lib.mail_notifier.daemon import EmailOutboxRelayDaemon
+from tracim_backend.lib.utils.translation import preload_translation_catalogs
+
+config_uri = os.environ['TRACIM_CONF_PATH']
+
+setup_logging(config_uri)
+settings = get_appsettings(config_uri)
+settings.update(settings.global_conf)
+app_config = CFG(settings)
+app_config.configure_filedepot()
+preload_translation_catalogs(app_config)
+
+daemon = EmailOutboxRelayDaemon(app_config, burst=False)
+daemon.run()
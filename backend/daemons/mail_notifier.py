@@ -6,6 +6,7 @@ from pyramid.paster import get_appsettings
 from pyramid.paster import setup_logging
 from tracim_backend.config import CFG
 from tracim_backend.lib.mail_notifier.daemon import MailSenderDaemon
+from tracim_backend.lib.utils.translation import preload_translation_catalogs
 
 config_uri = os.environ['TRACIM_CONF_PATH']
 
@@ -14,6 +15,7 @@ settings = get_appsettings(config_uri)
 settings.update(settings.global_conf)
 app_config = CFG(settings)
 app_config.configure_filedepot()
+preload_translation_catalogs(app_config)
 
 daemon = MailSenderDaemon(app_config, burst=False)
 daemon.run()
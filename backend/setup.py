@@ -138,6 +138,8 @@ setup(
             'user_update = tracim_backend.command.user:UpdateUserCommand',
             'db_init = tracim_backend.command.database:InitializeDBCommand',
             'db_delete = tracim_backend.command.database:DeleteDBCommand',
+            'depot_gc = tracim_backend.command.depot:DepotGarbageCollectCommand',
+            'email_outbox_stats = tracim_backend.command.email_outbox:EmailOutboxStatsCommand',
             'webdav start = tracim_backend.command.webdav:WebdavRunnerCommand',
             'caldav start = tracim_backend.command.caldav:CaldavRunnerCommand',
             'caldav_calendar_create = tracim_backend.command.caldav:CaldavCreateCalendarsCommand'
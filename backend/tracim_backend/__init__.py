@@ -32,6 +32,8 @@ from tracim_backend.lib.utils.authentification import BASIC_AUTH_WEBUI_REALM
 from tracim_backend.lib.utils.authorization import AcceptAllAuthorizationPolicy
 from tracim_backend.lib.utils.authorization import TRACIM_DEFAULT_PERM
 from tracim_backend.lib.utils.cors import add_cors_support
+from tracim_backend.lib.utils.credentials_cache import CredentialsCache
+from tracim_backend.lib.utils.translation import preload_translation_catalogs
 from tracim_backend.lib.webdav import WebdavAppFactory
 from tracim_backend.views import BASE_API_V2
 from tracim_backend.views.contents_api.html_document_controller import HTMLDocumentController  # nopep8
@@ -77,6 +79,7 @@ def web(global_config, **local_settings):
     # set CFG object
     app_config = CFG(settings)
     app_config.configure_filedepot()
+    preload_translation_catalogs(app_config)
     settings['CFG'] = app_config
     configurator = Configurator(settings=settings, autocommit=True)
     # Add AuthPolicy
@@ -102,7 +105,11 @@ def web(global_config, **local_settings):
         )
     policies.append(
         TracimBasicAuthAuthenticationPolicy(
-            realm=BASIC_AUTH_WEBUI_REALM
+            realm=BASIC_AUTH_WEBUI_REALM,
+            credentials_cache=CredentialsCache(
+                ttl=app_config.AUTH_CREDENTIALS_CACHE_TTL,
+                max_size=app_config.AUTH_CREDENTIALS_CACHE_MAX_SIZE,
+            ),
         ),
     )
     # Hack for ldap
@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+import argparse
+import datetime
+
+from pyramid.scripting import AppEnvironment
+
+from tracim_backend.command import AppContextCommand
+from tracim_backend.lib.core.blob import BlobApi
+
+
+class DepotGarbageCollectCommand(AppContextCommand):
+
+    def get_description(self) -> str:
+        return "Delete depot blobs not used anymore by any content revision"
+
+    def get_parser(self, prog_name: str) -> argparse.ArgumentParser:
+        parser = super().get_parser(prog_name)
+        parser.add_argument(
+            "--min-age",
+            help='only delete blobs older than this number of seconds',
+            dest='min_age',
+            required=False,
+            type=int,
+            default=3600,
+        )
+        parser.add_argument(
+            "--dry-run",
+            help='list unused blobs without deleting them',
+            dest='dry_run',
+            required=False,
+            action='store_true',
+            default=False,
+        )
+        return parser
+
+    def take_app_action(
+            self,
+            parsed_args: argparse.Namespace,
+            app_context: AppEnvironment
+    ) -> None:
+        self._session = app_context['request'].dbsession
+        self._app_config = app_context['registry'].settings['CFG']
+        blob_api = BlobApi(
+            current_user=None,
+            session=self._session,
+            config=self._app_config,
+        )
+        unused_blobs = blob_api.collect_garbage(
+            min_age=datetime.timedelta(seconds=parsed_args.min_age),
+            dry_run=parsed_args.dry_run,
+        )
+        freed_size = sum(blob.size for blob in unused_blobs)
+        if parsed_args.dry_run:
+            print('{} unused blobs found ({} bytes)'.format(
+                len(unused_blobs),
+                freed_size,
+            ))
+        else:
+            print('{} unused blobs deleted ({} bytes freed)'.format(
+                len(unused_blobs),
+                freed_size,
+            ))
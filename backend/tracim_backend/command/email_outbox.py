@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+import argparse
+
+from pyramid.scripting import AppEnvironment
+
+from tracim_backend.command import AppContextCommand
+from tracim_backend.lib.mail_notifier.outbox import EmailOutbox
+
+
+class EmailOutboxStatsCommand(AppContextCommand):
+
+    def get_description(self) -> str:
+        return "Show email outbox queue depth and latency"
+
+    def take_app_action(
+            self,
+            parsed_args: argparse.Namespace,
+            app_context: AppEnvironment
+    ) -> None:
+        self._session = app_context['request'].dbsession
+        self._app_config = app_context['registry'].settings['CFG']
+        metrics = EmailOutbox(self._app_config, self._session).get_metrics()
+        print('pending messages: {}'.format(metrics.pending))
+        print('retrying messages: {}'.format(metrics.retrying))
+        print('failed messages: {}'.format(metrics.failed))
+        print('oldest pending message age: {:.0f}s'.format(
+            metrics.oldest_pending_age
+        ))
@@ -23,7 +23,8 @@ from tracim_backend.models.auth import Group
 from tracim_backend.models.data import ActionDescription
 from tracim_backend.models.roles import WorkspaceRoles
 
-SECRET_ENDING_STR = ['PASSWORD', 'KEY', 'SECRET']
+# INFO - G.M - 2019-04-08 - database url may contain credentials
+SECRET_ENDING_STR = ['PASSWORD', 'KEY', 'SECRET', 'SQLALCHEMY_URL']
 
 class CFG(object):
     """Object used for easy access to config file parameters."""
@@ -132,6 +133,16 @@ class CFG(object):
                 ' list, use remote_user_header instead'
             )
         self.REMOTE_USER_HEADER = settings.get('remote_user_header', None)
+        # INFO - G.M - 2019-04-19 - verified credentials of webdav and http
+        # basic auth are cached for this number of seconds, 0 disable cache.
+        self.AUTH_CREDENTIALS_CACHE_TTL = int(settings.get(
+            'auth.credentials_cache.ttl',
+            60,
+        ))
+        self.AUTH_CREDENTIALS_CACHE_MAX_SIZE = int(settings.get(
+            'auth.credentials_cache.max_size',
+            1000,
+        ))
         # TODO - G.M - 2018-09-11 - Deprecated param
         # self.DATA_UPDATE_ALLOWED_DURATION = int(settings.get(
         #     'content.update.allowed.duration',
@@ -278,16 +289,62 @@ class CFG(object):
         self.EMAIL_NOTIFICATION_REFERENCES_EMAIL = settings.get(
             'email.notification.references.email'
         )
+        # INFO - G.M - 2019-04-09 - directory where compiled email templates
+        # are stored, if not set, templates are compiled in memory only.
+        self.EMAIL_TEMPLATE_MODULE_DIR = settings.get(
+            'email.template_module_dir',
+            None,
+        )
         # Content update notification
 
         self.EMAIL_NOTIFICATION_CONTENT_UPDATE_TEMPLATE_HTML = settings.get(
             'email.notification.content_update.template.html',
         )
+        default_content_update_recipient_template = os.path.join(
+            backend_folder,
+            'tracim_backend',
+            'templates',
+            'mail',
+            'content_update_recipient_html.mak',
+        )
+        self.EMAIL_NOTIFICATION_CONTENT_UPDATE_RECIPIENT_TEMPLATE_HTML = settings.get(  # nopep8
+            'email.notification.content_update.recipient_template.html',
+            default_content_update_recipient_template,
+        )
 
         self.EMAIL_NOTIFICATION_CONTENT_UPDATE_SUBJECT = settings.get(
             'email.notification.content_update.subject',
             _("[{website_title}] [{workspace_label}] {content_label} ({content_status_label})")  # nopep8
         )
+        # Content update digest notification
+        # INFO - G.M - 2019-04-11 - in digest mode, content update events are
+        # stored in database and notification_digest daemon send to each user
+        # one email per workspace summarizing all updated contents once
+        # workspace is quiet for quiet_period seconds, or at least every
+        # max_delay seconds for workspaces which are never quiet.
+        self.EMAIL_NOTIFICATION_DIGEST_ACTIVATED = asbool(settings.get(
+            'email.notification.digest.activated',
+            False,
+        ))
+        self.EMAIL_NOTIFICATION_DIGEST_QUIET_PERIOD = int(settings.get(
+            'email.notification.digest.quiet_period',
+            300,
+        ))
+        self.EMAIL_NOTIFICATION_DIGEST_MAX_DELAY = int(settings.get(
+            'email.notification.digest.max_delay',
+            3600,
+        ))
+        self.EMAIL_NOTIFICATION_DIGEST_CHECK_HEARTBEAT = int(settings.get(
+            'email.notification.digest.check.heartbeat',
+            60,
+        ))
+        self.EMAIL_NOTIFICATION_DIGEST_TEMPLATE_HTML = settings.get(
+            'email.notification.digest.template.html',
+        )
+        self.EMAIL_NOTIFICATION_DIGEST_SUBJECT = settings.get(
+            'email.notification.digest.subject',
+            _("[{website_title}] [{workspace_label}] {content_count} updated content(s)")  # nopep8
+        )
         # Created account notification
         self.EMAIL_NOTIFICATION_CREATED_ACCOUNT_TEMPLATE_HTML = settings.get(
             'email.notification.created_account.template.html',
@@ -306,9 +363,26 @@ class CFG(object):
             _('[{website_title}] A password reset has been requested'),
         )
 
-        # TODO - G.M - 2019-01-22 - add feature to process notification email
-        # asynchronously see issue https://github.com/tracim/tracim/issues/1345
-        self.EMAIL_NOTIFICATION_PROCESSING_MODE = 'sync'
+        self.EMAIL_NOTIFICATION_PROCESSING_MODE = settings.get(
+            'email.notification.processing_mode',
+            'sync',
+        ).upper()
+
+        if self.EMAIL_NOTIFICATION_PROCESSING_MODE not in (
+                self.CST.ASYNC,
+                self.CST.SYNC,
+        ):
+            raise Exception(
+                'email.notification.processing_mode '
+                'can ''be "{}" or "{}", not "{}"'.format(
+                    self.CST.ASYNC,
+                    self.CST.SYNC,
+                    self.EMAIL_NOTIFICATION_PROCESSING_MODE,
+                )
+            )
+        # INFO - G.M - 2019-04-08 - async notification jobs are run by
+        # mail_notifier daemon, which opens its own database connection.
+        self.SQLALCHEMY_URL = settings.get('sqlalchemy.url')
         self.EMAIL_NOTIFICATION_ACTIVATED = asbool(settings.get(
             'email.notification.activated',
         ))
@@ -325,9 +399,12 @@ class CFG(object):
         if self.EMAIL_NOTIFICATION_ACTIVATED:
             templates = {
                 'content_update notification': self.EMAIL_NOTIFICATION_CONTENT_UPDATE_TEMPLATE_HTML,
+                'content_update notification recipient': self.EMAIL_NOTIFICATION_CONTENT_UPDATE_RECIPIENT_TEMPLATE_HTML,  # nopep8
                 'created account': self.EMAIL_NOTIFICATION_CREATED_ACCOUNT_TEMPLATE_HTML,
                 'password reset': self.EMAIL_NOTIFICATION_RESET_PASSWORD_TEMPLATE_HTML
             }
+            if self.EMAIL_NOTIFICATION_DIGEST_ACTIVATED:
+                templates['content_update digest'] = self.EMAIL_NOTIFICATION_DIGEST_TEMPLATE_HTML  # nopep8
             for template_description, template_path in templates.items():
                 if not template_path or not os.path.isfile(template_path):
                     raise ConfigurationError(
@@ -394,6 +471,42 @@ class CFG(object):
             'email.reply.use_txt_parsing',
             True,
         ))
+        self.EMAIL_REPLY_WORKERS = int(settings.get(
+            'email.reply.workers',
+            4,
+        ))
+        self.EMAIL_REPLY_INGESTION_MODE = settings.get(
+            'email.reply.ingestion_mode',
+            'api',
+        ).upper()
+        if self.EMAIL_REPLY_INGESTION_MODE not in (
+                self.CST.API,
+                self.CST.DIRECT,
+        ):
+            raise Exception(
+                'email.reply.ingestion_mode '
+                'can ''be "{}" or "{}", not "{}"'.format(
+                    self.CST.API,
+                    self.CST.DIRECT,
+                    self.EMAIL_REPLY_INGESTION_MODE,
+                )
+            )
+        self.EMAIL_REPLY_INGESTION_BATCH_SIZE = int(settings.get(
+            'email.reply.ingestion.batch_size',
+            100,
+        ))
+        self.EMAIL_REPLY_SYNC_STATE_PATH = settings.get(
+            'email.reply.sync_state_path',
+            ''
+        )
+        self.EMAIL_REPLY_FETCH_CHUNK_SIZE = int(settings.get(
+            'email.reply.fetch.chunk_size',
+            50,
+        ))
+        self.EMAIL_REPLY_MAX_ATTEMPTS = int(settings.get(
+            'email.reply.max_attempts',
+            5,
+        ))
         self.EMAIL_REPLY_LOCKFILE_PATH = settings.get(
             'email.reply.lockfile_path',
             ''
@@ -411,12 +524,14 @@ class CFG(object):
         if self.EMAIL_PROCESSING_MODE not in (
                 self.CST.ASYNC,
                 self.CST.SYNC,
+                self.CST.OUTBOX,
         ):
             raise Exception(
                 'email.processing_mode '
-                'can ''be "{}" or "{}", not "{}"'.format(
+                'can ''be "{}", "{}" or "{}", not "{}"'.format(
                     self.CST.ASYNC,
                     self.CST.SYNC,
+                    self.CST.OUTBOX,
                     self.EMAIL_PROCESSING_MODE,
                 )
             )
@@ -433,6 +548,44 @@ class CFG(object):
             'email.async.redis.db',
             0,
         ))
+        # INFO - G.M - 2019-04-11 - SMTP connections kept open by
+        # mail_notifier daemon in async mode.
+        self.EMAIL_SENDER_SMTP_POOL_SIZE = int(settings.get(
+            'email.async.smtp.pool_size',
+            2,
+        ))
+        self.EMAIL_SENDER_SMTP_MAX_MESSAGES_PER_CONNECTION = int(settings.get(
+            'email.async.smtp.max_messages_per_connection',
+            100,
+        ))
+        self.EMAIL_SENDER_SMTP_HEALTH_CHECK_INTERVAL = int(settings.get(
+            'email.async.smtp.health_check_interval',
+            30,
+        ))
+        # INFO - G.M - 2019-04-12 - in outbox mode, emails are stored in
+        # database in the same transaction as the change they notify, then
+        # sent by email_outbox_relay daemon, failed sendings being retried
+        # with exponential backoff.
+        self.EMAIL_OUTBOX_BATCH_SIZE = int(settings.get(
+            'email.outbox.batch_size',
+            100,
+        ))
+        self.EMAIL_OUTBOX_CHECK_HEARTBEAT = int(settings.get(
+            'email.outbox.check.heartbeat',
+            10,
+        ))
+        self.EMAIL_OUTBOX_RETRY_DELAY = int(settings.get(
+            'email.outbox.retry_delay',
+            60,
+        ))
+        self.EMAIL_OUTBOX_MAX_RETRY_DELAY = int(settings.get(
+            'email.outbox.max_retry_delay',
+            3600,
+        ))
+        self.EMAIL_OUTBOX_MAX_ATTEMPTS = int(settings.get(
+            'email.outbox.max_attempts',
+            10,
+        ))
         self.NEW_USER_INVITATION_DO_NOTIFY = asbool(settings.get(
             'new_user.invitation.do_notify',
             'True'
@@ -453,6 +606,7 @@ class CFG(object):
         self.WEBDAV_VERBOSE_LEVEL = int(settings.get('webdav.verbose.level', 1))
         self.WEBDAV_ROOT_PATH = settings.get('webdav.root_path', '/')
         self.WEBDAV_BLOCK_SIZE = int(settings.get('webdav.block_size', 8192))
+        self.WEBDAV_SPOOL_MAX_SIZE = int(settings.get('webdav.spool_max_size', 1048576))  # nopep8
         self.WEBDAV_DIR_BROWSER_ENABLED = asbool(settings.get('webdav.dir_browser.enabled', True))
         default_webdav_footnote = '<a href="{instance_url}">{instance_name}</a>.' \
                                   ' This Webdav is serve by'  \
@@ -523,6 +677,30 @@ class CFG(object):
 
         self.PREVIEW_JPG_ALLOWED_DIMS = allowed_dims
 
+        self.PREVIEW_PROCESSING_MODE = settings.get(
+            'preview.processing_mode',
+            'sync',
+        ).upper()
+
+        if self.PREVIEW_PROCESSING_MODE not in (
+                self.CST.ASYNC,
+                self.CST.SYNC,
+        ):
+            raise Exception(
+                'preview.processing_mode '
+                'can ''be "{}" or "{}", not "{}"'.format(
+                    self.CST.ASYNC,
+                    self.CST.SYNC,
+                    self.PREVIEW_PROCESSING_MODE,
+                )
+            )
+        # INFO - G.M - 2019-04-05 - delay in seconds given to client as hint
+        # to retry getting a preview which is still being generated.
+        self.PREVIEW_ASYNC_RETRY_AFTER = int(settings.get(
+            'preview.async.retry_after',
+            5,
+        ))
+
         self.FRONTEND_SERVE = asbool(settings.get(
             'frontend.serve', False
         ))
@@ -761,6 +939,10 @@ class CFG(object):
     class CST(object):
         ASYNC = 'ASYNC'
         SYNC = 'SYNC'
+        OUTBOX = 'OUTBOX'
+
+        API = 'API'
+        DIRECT = 'DIRECT'
 
         TREEVIEW_FOLDERS = 'folders'
         TREEVIEW_ALL = 'all'
@@ -20,6 +20,7 @@ class ErrorCode(IntEnum):
     UNAVAILABLE_PREVIEW_TYPE = 1011
     PAGE_OF_PREVIEW_NOT_FOUND = 1012
     UNAIVALABLE_PREVIEW = 1013
+    PREVIEW_GENERATION_PENDING = 1014
 
     # Validation Error
     GENERIC_SCHEMA_VALIDATION_ERROR = 2001
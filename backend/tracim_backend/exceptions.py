@@ -241,7 +241,10 @@ class CommentRequestCreationFailed(TracimException):
 
 
 class BadStatusCode(TracimException):
-    pass
+
+    def __init__(self, message: str, status_code: int = None) -> None:
+        super().__init__(message)
+        self.status_code = status_code
 
 
 class WrongLDAPCredentials(TracimException):
@@ -362,6 +365,14 @@ class UnavailablePreview(TracimException):
     error_code = ErrorCode.UNAIVALABLE_PREVIEW
 
 
+class PreviewGenerationPending(TracimException):
+    error_code = ErrorCode.PREVIEW_GENERATION_PENDING
+
+    def __init__(self, message: str, retry_after: int) -> None:
+        super().__init__(message)
+        self.error_detail = {'retry_after': retry_after}
+
+
 class EmptyNotificationError(TracimException):
     pass
 
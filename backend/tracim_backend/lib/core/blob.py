@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+import datetime
+import typing
+
+from sqlalchemy import func
+from sqlalchemy.orm import Query
+from sqlalchemy.orm import Session
+
+from tracim_backend.config import CFG
+from tracim_backend.lib.utils.logger import logger
+from tracim_backend.models.auth import User
+from tracim_backend.models.data import ContentRevisionRO
+from tracim_backend.models.data import DepotBlob
+
+
+class BlobApi(object):
+    """
+    Maintenance of content-addressed depot blobs shared by revisions.
+    """
+
+    def __init__(
+            self,
+            session: Session,
+            current_user: typing.Optional[User],
+            config: CFG
+    ) -> None:
+        self._user = current_user
+        self._session = session
+        self._config = config
+
+    def _base_query(self) -> Query:
+        return self._session.query(DepotBlob)
+
+    def get_references_count(self) -> typing.Dict[str, int]:
+        """
+        Count revisions using each blob, in one grouped query.
+        :return: dict of blob_hash: number of revisions using this blob
+        """
+        query = self._session.query(
+            ContentRevisionRO.blob_hash,
+            func.count(ContentRevisionRO.revision_id),
+        ).filter(
+            ContentRevisionRO.blob_hash.isnot(None)
+        ).group_by(ContentRevisionRO.blob_hash)
+        return dict(query.all())
+
+    def update_references_count(self) -> int:
+        """
+        Fix reference_count of all blobs according to revisions really using
+        them.
+        :return: number of blobs where reference_count was wrong
+        """
+        references_count = self.get_references_count()
+        nb_fixed_blobs = 0
+        for blob in self._base_query():
+            reference_count = references_count.get(blob.blob_hash, 0)
+            if blob.reference_count != reference_count:
+                logger.debug(
+                    self,
+                    'Fix reference count of blob {}: {} -> {}'.format(
+                        blob.blob_hash,
+                        blob.reference_count,
+                        reference_count,
+                    )
+                )
+                blob.reference_count = reference_count
+                nb_fixed_blobs += 1
+        self._session.flush()
+        return nb_fixed_blobs
+
+    def get_unused_blobs(
+        self,
+        created_before: datetime.datetime,
+    ) -> typing.List[DepotBlob]:
+        """
+        Return blobs not used by any revision.
+        :param created_before: ignore blobs created after this date, this
+        avoid collecting blobs of revisions currently being created.
+        :return: list of unused blobs
+        """
+        used_blobs_hashes = self._session.query(
+            ContentRevisionRO.blob_hash
+        ).filter(ContentRevisionRO.blob_hash.isnot(None))
+        return self._base_query().filter(
+            DepotBlob.blob_hash.notin_(used_blobs_hashes),
+            DepotBlob.created < created_before,
+        ).all()
+
+    def collect_garbage(
+        self,
+        min_age: datetime.timedelta,
+        dry_run: bool = False,
+    ) -> typing.List[DepotBlob]:
+        """
+        Update blobs reference count and delete unused blobs. Depot file
+        owned by a deleted blob is deleted when transaction is committed.
+        :param min_age: only delete blobs older than this
+        :param dry_run: do not delete anything
+        :return: list of unused blobs (deleted ones if not dry_run)
+        """
+        self.update_references_count()
+        unused_blobs = self.get_unused_blobs(
+            created_before=datetime.datetime.utcnow() - min_age,
+        )
+        if not dry_run:
+            for blob in unused_blobs:
+                self._session.delete(blob)
+            self._session.flush()
+        return unused_blobs
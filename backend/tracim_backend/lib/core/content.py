@@ -8,22 +8,31 @@ from contextlib import contextmanager
 
 import sqlalchemy
 import transaction
-from depot.io.utils import FileIntent
 from depot.manager import DepotManager
 from preview_generator.exception import UnavailablePreviewType
 from preview_generator.exception import UnsupportedMimeType
 from preview_generator.manager import PreviewManager
+from sqlalchemy import case
 from sqlalchemy import desc
+from sqlalchemy import exists
 from sqlalchemy import func
+from sqlalchemy import literal
+from sqlalchemy import literal_column
 from sqlalchemy import or_
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Query
 from sqlalchemy.orm import aliased
 from sqlalchemy.orm import joinedload
+from sqlalchemy.orm import make_transient_to_detached
 from sqlalchemy.orm.attributes import QueryableAttribute
 from sqlalchemy.orm.attributes import get_history
 from sqlalchemy.orm.exc import NoResultFound
 from sqlalchemy.orm.session import Session
 from sqlalchemy.sql.elements import and_
+from sqlalchemy.sql.expression import Select
+from sqlalchemy.types import DateTime
+from sqlalchemy.types import Integer
+from zope.sqlalchemy import mark_changed
 from tracim_backend.config import CFG
 
 from tracim_backend.app_models.contents import FOLDER_TYPE
@@ -40,6 +49,7 @@ from tracim_backend.exceptions import EmptyCommentContentNotAllowed
 from tracim_backend.exceptions import EmptyLabelNotAllowed
 from tracim_backend.exceptions import PageOfPreviewNotFound
 from tracim_backend.exceptions import PreviewDimNotAllowed
+from tracim_backend.exceptions import PreviewGenerationPending
 from tracim_backend.exceptions import RevisionDoesNotMatchThisContent
 from tracim_backend.exceptions import \
     RevisionFilePathSearchFailedDepotCorrupted
@@ -49,6 +59,7 @@ from tracim_backend.exceptions import UnallowedSubContent
 from tracim_backend.exceptions import UnavailablePreview
 from tracim_backend.exceptions import WorkspacesDoNotMatch
 from tracim_backend.lib.core.notifications import NotifierFactory
+from tracim_backend.lib.preview.jobs import PreviewGenerationQueue
 from tracim_backend.lib.utils.logger import logger
 from tracim_backend.lib.utils.translation import Translator
 from tracim_backend.lib.utils.utils import cmp_to_key
@@ -56,12 +67,15 @@ from tracim_backend.lib.utils.utils import current_date_for_filename
 from tracim_backend.lib.utils.utils import preview_manager_page_format
 from tracim_backend.models.auth import User
 from tracim_backend.models.context_models import ContentInContext
+from tracim_backend.models.context_models import ContentInContextLoader
 from tracim_backend.models.context_models import PreviewAllowedDim
 from tracim_backend.models.context_models import RevisionInContext
 from tracim_backend.models.data import ActionDescription
 from tracim_backend.models.data import Content
 from tracim_backend.models.data import ContentRevisionRO
+from tracim_backend.models.data import DepotBlob
 from tracim_backend.models.data import NodeTreeItem
+from tracim_backend.models.data import RevisionPreviewMetadata
 from tracim_backend.models.data import RevisionReadStatus
 from tracim_backend.models.data import UserRoleInWorkspace
 from tracim_backend.models.data import Workspace
@@ -157,6 +171,7 @@ class ContentApi(object):
         self._force_show_all_types = force_show_all_types
         self._disable_user_workspaces_filter = disable_user_workspaces_filter
         self.preview_manager = PreviewManager(self._config.PREVIEW_CACHE_DIR, create_folder=True)  # nopep8
+        self.preview_generation_queue = PreviewGenerationQueue(self._config)
         default_lang = None
         if self._user:
             default_lang = self._user.lang
@@ -193,22 +208,45 @@ class ContentApi(object):
     def get_content_in_context(self, content: Content) -> ContentInContext:
         return ContentInContext(content, self._session, self._config, self._user)  # nopep8
 
+    def get_contents_in_context(
+            self,
+            contents: typing.List[Content],
+    ) -> typing.List[ContentInContext]:
+        """
+        Get ContentInContext list of given contents, data related to
+        contents (authors, read status...) are loaded for the whole list
+        at once.
+        :param contents: contents to put in context
+        :return: list of ContentInContext, in same order as contents
+        """
+        contents = list(contents)
+        loader = ContentInContextLoader(
+            contents,
+            self._session,
+            self._config,
+            self._user,
+        )
+        return [
+            ContentInContext(
+                content,
+                self._session,
+                self._config,
+                self._user,
+                loader=loader,
+            )
+            for content in contents
+        ]
+
     def get_revision_in_context(self, revision: ContentRevisionRO) -> RevisionInContext:  # nopep8
         # TODO - G.M - 2018-06-173 - create revision in context object
         return RevisionInContext(revision, self._session, self._config, self._user) # nopep8
     
-    def _get_revision_join(self) -> sqlalchemy.sql.elements.BooleanClauseList:
+    def _get_revision_join(self) -> sqlalchemy.sql.elements.BinaryExpression:
         """
         Return the Content/ContentRevision query join condition
         :return: Content/ContentRevision query join condition
         """
-        return and_(Content.id == ContentRevisionRO.content_id,
-                    ContentRevisionRO.revision_id == self._session.query(
-                        ContentRevisionRO.revision_id)
-                    .filter(ContentRevisionRO.content_id == Content.id)
-                    .order_by(ContentRevisionRO.revision_id.desc())
-                    .limit(1)
-                    .correlate(Content))
+        return Content.current_revision_id == ContentRevisionRO.revision_id
 
     def get_canonical_query(self) -> Query:
         """
@@ -697,7 +735,13 @@ class ContentApi(object):
         """
         assert revision_id is not None# DYN_REMOVE
 
-        revision = self._session.query(ContentRevisionRO).filter(ContentRevisionRO.revision_id == revision_id).one()
+        # INFO - G.M - 2019-04-04 - use get() to not query database again
+        # when revision is already loaded in session
+        revision = self._session.query(ContentRevisionRO).get(revision_id)
+        if not revision:
+            raise NoResultFound(
+                'revision {} not found'.format(revision_id)
+            )
         if content and revision.content_id != content.content_id:
             raise RevisionDoesNotMatchThisContent(
                 'revision {revision_id} is not a revision of content {content_id}'.format(  # nopep8
@@ -806,46 +850,164 @@ class ContentApi(object):
         E.g.: ['foo', 'bar'] for complete path /Workspace1/foo/bar folder
         :return: Found Content
         """
-        query = self._base_query(workspace)
-        parent_folder = None
+        return self.get_content_path_by_labels(
+            content_label=content_label,
+            workspace=workspace,
+            content_parent_labels=content_parent_labels,
+        )[-1]
 
-        # Grab content parent folder if parent path given
-        if content_parent_labels:
-            parent_folder = self.get_folder_with_workspace_path_labels(
-                content_parent_labels,
-                workspace,
+    def get_content_path_by_labels(
+            self,
+            content_label: str,
+            workspace: Workspace,
+            content_parent_labels: typing.List[str]=None,
+            parent_folder: Content=None,
+    ) -> typing.List[Content]:
+        """
+        Return content with it's label and parents labels, and all its parent
+        folders, using one recursive query for whole path where database
+        server support it, else one query per path level.
+        :param content_label: label of content (label or file_name)
+        :param workspace: workspace containing all of this
+        :param content_parent_labels: Ordered list of labels representing path
+            of folder (without workspace label).
+        E.g.: ['foo', 'bar'] for complete path /Workspace1/foo/bar folder
+        :param parent_folder: folder from which path labels start, default
+        to workspace root
+        :return: found folders from first parent label to content, content
+        included
+        """
+        content_parent_labels = content_parent_labels or []
+        if not self._support_recursive_cte():
+            return self._get_content_path_by_labels_level_by_level(
+                content_label=content_label,
+                workspace=workspace,
+                content_parent_labels=content_parent_labels,
+                parent_folder=parent_folder,
             )
+        labels_count = len(content_parent_labels) + 1
 
-        # Build query for found content by label
-        content_query = self.filter_query_for_content_label_as_path(
-            query=query,
-            filename=content_label,
-        )
+        def label_filter(depth: int):
+            if depth == labels_count:
+                return func.lower(Content.label + Content.file_extension) \
+                    == func.lower(content_label)
+            return and_(
+                Content.type == content_type_list.Folder.slug,
+                Content.label == content_parent_labels[depth - 1],
+            )
 
-        # Modify query to apply parent folder filter if any
         if parent_folder:
-            content_query = content_query.filter(
-                Content.parent_id == parent_folder.content_id,
-            )
+            root_filter = Content.parent_id == parent_folder.content_id
         else:
-            content_query = content_query.filter(
-                Content.parent_id == None,
+            root_filter = Content.parent_id == None  # nopep8
+        path_cte = self._base_query(workspace) \
+            .filter(Content.workspace_id == workspace.workspace_id) \
+            .filter(root_filter) \
+            .filter(label_filter(1)) \
+            .with_entities(
+                Content.content_id.label('content_id'),
+                literal_column('1', Integer).label('depth'),
+            ).cte(name='content_path', recursive=True)
+        if labels_count > 1:
+            parent_path = aliased(path_cte, name='parent_path')
+            path_cte = path_cte.union_all(
+                self._base_query(workspace)
+                .join(parent_path, Content.parent_id == parent_path.c.content_id)  # nopep8
+                .filter(or_(*[
+                    and_(parent_path.c.depth == depth - 1, label_filter(depth))
+                    for depth in range(2, labels_count + 1)
+                ]))
+                .with_entities(
+                    Content.content_id,
+                    parent_path.c.depth + 1,
+                )
             )
+        contents_by_depth = {}  # type: typing.Dict[int, typing.List[Content]]
+        for content, depth in self._base_query(workspace) \
+                .join(path_cte, Content.content_id == path_cte.c.content_id) \
+                .add_columns(path_cte.c.depth):
+            contents_by_depth.setdefault(depth, []).append(content)
 
-        # Filter with workspace
-        content_query = content_query.filter(
-            Content.workspace_id == workspace.workspace_id,
+        if not contents_by_depth.get(labels_count):
+            raise ContentNotFound('Content "{}" not found in database'.format(
+                content_label))  # nopep8
+        # INFO - G.M - 2019-04-18 - if many contents match, use last modified
+        content = max(
+            contents_by_depth[labels_count],
+            key=lambda content: content.revision_id,
         )
+        contents = [content]
+        for depth in range(labels_count - 1, 0, -1):
+            contents.insert(0, next(
+                folder for folder in contents_by_depth[depth]
+                if folder.content_id == contents[0].parent_id
+            ))
+        return contents
 
-        # Return the content
-        try:
-            return content_query.order_by(
-                Content.revision_id.desc(),
-            ).one()
-        except NoResultFound as exc:
-            raise ContentNotFound('Content "{}" not found in database'.format(
-                content_label)) from exc  # nopep8
+    def _support_recursive_cte(self) -> bool:
+        """
+        Whether database server support WITH RECURSIVE queries: postgresql,
+        sqlite, mysql >= 8 and mariadb >= 10.2.
+        """
+        dialect = self._session.get_bind().dialect
+        if dialect.name in ('postgresql', 'sqlite'):
+            return True
+        if dialect.name == 'mysql':
+            version = tuple(dialect.server_version_info or ())
+            if 'MariaDB' in version:
+                # INFO - G.M - 2019-04-18 - version of mariadb is given
+                # before 'MariaDB' item, see sqlalchemy mysql dialect.
+                index = version.index('MariaDB')
+                return version[index - 3:index] >= (10, 2)
+            return version >= (8,)
+        return False
+
+    def _get_content_path_by_labels_level_by_level(
+            self,
+            content_label: str,
+            workspace: Workspace,
+            content_parent_labels: typing.List[str],
+            parent_folder: Content=None,
+    ) -> typing.List[Content]:
+        """
+        Same as get_content_path_by_labels, for database servers without
+        recursive queries: walk folders with one query per path level.
+        """
+        contents = []
+        folder = parent_folder
+        for label in content_parent_labels:
+            folder_query = self._base_query(workspace).filter(
+                Content.type == content_type_list.Folder.slug,
+                Content.label == label,
+                Content.workspace_id == workspace.workspace_id,
+            )
+            if folder:
+                folder_query = folder_query.filter(
+                    Content.parent_id == folder.content_id,
+                )
+            else:
+                folder_query = folder_query.filter(Content.parent_id == None)  # nopep8
+            folder = folder_query.order_by(Content.revision_id.desc()).first()
+            if not folder:
+                raise ContentNotFound('Folder "{}" not found'.format(label))
+            contents.append(folder)
 
+        content_query = self.filter_query_for_content_label_as_path(
+            query=self._base_query(workspace),
+            filename=content_label,
+        ).filter(Content.workspace_id == workspace.workspace_id)
+        if folder:
+            content_query = content_query.filter(
+                Content.parent_id == folder.content_id,
+            )
+        else:
+            content_query = content_query.filter(Content.parent_id == None)  # nopep8
+        content = content_query.order_by(Content.revision_id.desc()).first()
+        if not content:
+            raise ContentNotFound('Content "{}" not found in database'.format(
+                content_label))  # nopep8
+        contents.append(content)
+        return contents
 
     # TODO - G.M - 2018-07-24 - [Cleanup] Is this method already needed ?
     def get_folder_with_workspace_path_labels(
@@ -918,6 +1080,49 @@ class ContentApi(object):
             func.lower(Content.label + Content.file_extension) == func.lower(filename)
         )
 
+    def _is_preview_async(self) -> bool:
+        return self._config.PREVIEW_PROCESSING_MODE == self._config.CST.ASYNC
+
+    def enqueue_preview_generation(self, content: Content) -> None:
+        """
+        Enqueue generation of previews of current revision of content, to be
+        done by preview_generator daemon once current transaction is
+        committed. Do nothing if preview processing mode is not async.
+        :param content: file content
+        """
+        if not self._is_preview_async():
+            return
+        self._session.flush()
+        try:
+            file_path = self.get_one_revision_filepath(content.revision_id)
+        except RevisionFilePathSearchFailedDepotCorrupted as exc:
+            logger.warning(
+                self,
+                "Unable to get revision filepath, depot is corrupted: {}".format(str(exc))
+            )
+            return
+        self.preview_generation_queue.enqueue_after_commit(
+            self._session,
+            revision_id=content.revision_id,
+            file_path=file_path,
+            file_extension=content.file_extension,
+        )
+
+    def _raise_if_preview_generation_pending(self, revision_id: int) -> None:
+        """
+        Raise PreviewGenerationPending instead of generating preview
+        in current request if previews of revision are currently generated by
+        preview_generator daemon.
+        :param revision_id: id of revision
+        """
+        if not self._is_preview_async():
+            return
+        if self.preview_generation_queue.is_pending(revision_id):
+            raise PreviewGenerationPending(
+                'Preview of revision {} is being generated'.format(revision_id),  # nopep8
+                retry_after=self._config.PREVIEW_ASYNC_RETRY_AFTER,
+            )
+
     def get_pdf_preview_path(
         self,
         content_id: int,
@@ -934,6 +1139,7 @@ class ContentApi(object):
         :param file_extension: file extension of the file
         :return: preview_path as string
         """
+        self._raise_if_preview_generation_pending(revision_id)
         try:
             file_path = self.get_one_revision_filepath(revision_id)
             page_number = preview_manager_page_format(page_number)
@@ -986,6 +1192,7 @@ class ContentApi(object):
                 :param file_extension: file extension of the file
         :return: path of the full pdf preview of this revision
         """
+        self._raise_if_preview_generation_pending(revision_id)
         try:
             file_path = self.get_one_revision_filepath(revision_id)
             pdf_preview_path = self.preview_manager.get_pdf_preview(file_path, file_ext=file_extension)  # nopep8
@@ -1044,6 +1251,7 @@ class ContentApi(object):
         :param height: height in pixel
         :return: preview_path as string
         """
+        self._raise_if_preview_generation_pending(revision_id)
         try:
             file_path = self.get_one_revision_filepath(revision_id)
             page_number = preview_manager_page_format(page_number)
@@ -1305,11 +1513,70 @@ class ContentApi(object):
         :return: list of content
         """
 
-        resultset = self._get_all_query(
+        activity = self._get_last_activity_query(
             workspace=workspace,
+            content_ids=content_ids,
+        ).subquery()
+        resultset = self.get_canonical_query().join(
+            activity,
+            Content.id == activity.c.content_id,
         )
-        if content_ids:
+        # INFO - G.M - 2018-08-10 - re-apply general filters here to avoid
+        # issue with comments
+        if not self._show_deleted:
+            resultset = resultset.filter(Content.is_deleted == False)
+        if not self._show_archived:
+            resultset = resultset.filter(Content.is_archived == False)
+
+        # INFO - G.M - 2019-04-08 - keyset pagination: only keep contents
+        # after before_content according to (last activity, content_id) order
+        if before_content:
+            before_updated = resultset.filter(
+                Content.id == before_content.content_id
+            ).with_entities(activity.c.updated).scalar()
+            if before_updated is None:
+                return []
             resultset = resultset.filter(
+                or_(
+                    activity.c.updated < before_updated,
+                    and_(
+                        activity.c.updated == before_updated,
+                        activity.c.content_id < before_content.content_id,
+                    )
+                )
+            )
+
+        resultset = resultset.order_by(
+            desc(activity.c.updated),
+            desc(activity.c.content_id),
+        )
+        if limit:
+            resultset = resultset.limit(limit)
+        return resultset.all()
+
+    def _get_last_activity_query(
+            self,
+            workspace: Workspace=None,
+            content_ids: typing.Optional[typing.List[int]] = None,
+    ) -> Query:
+        """
+        Get query of (content_id, updated) of main contents, where updated is
+        the last update of content itself or one of its comments.
+        :param workspace: Workspace to check
+        :param content_ids: restrict selection to some content ids and
+        related Comments
+        :return: query of content_id and last activity date, grouped by
+        content_id
+        """
+        main_content_id = case(
+            [(Content.type == content_type_list.Comment.slug, Content.parent_id)],  # nopep8
+            else_=Content.id,
+        )
+        activity = self._get_all_query(
+            workspace=workspace,
+        )
+        if content_ids:
+            activity = activity.filter(
                 or_(
                     Content.content_id.in_(content_ids),
                     and_(
@@ -1318,40 +1585,10 @@ class ContentApi(object):
                     )
                 )
             )
-
-        resultset = resultset.order_by(desc(ContentRevisionRO.updated), desc(ContentRevisionRO.revision_id), desc(ContentRevisionRO.content_id))
-
-        active_contents = []
-        too_recent_content = []
-        before_content_find = False
-        for content in resultset:
-            related_active_content = None
-            if content_type_list.Comment.slug == content.type:
-                related_active_content = content.parent
-            else:
-                related_active_content = content
-
-            # INFO - G.M - 2018-08-10 - re-apply general filters here to avoid
-            # issue with comments
-            if not self._show_deleted and related_active_content.is_deleted:
-                continue
-            if not self._show_archived and related_active_content.is_archived:
-                continue
-
-            if related_active_content not in active_contents and related_active_content not in too_recent_content:  # nopep8
-
-                if not before_content or before_content_find:
-                    active_contents.append(related_active_content)
-                else:
-                    too_recent_content.append(related_active_content)
-
-                if before_content and related_active_content == before_content:
-                    before_content_find = True
-
-            if limit and len(active_contents) >= limit:
-                break
-
-        return active_contents
+        return activity.with_entities(
+            main_content_id.label('content_id'),
+            func.max(ContentRevisionRO.updated).label('updated'),
+        ).group_by(main_content_id)
 
     # TODO - G.M - 2018-07-19 - Find a way to update this method to something
     # usable and efficient for tracim v2 to get content with read/unread status
@@ -1728,7 +1965,27 @@ class ContentApi(object):
         item.revision_type = ActionDescription.EDITION
         return item
 
-    def update_file_data(self, item: Content, new_filename: str, new_mimetype: str, new_content: bytes) -> Content:
+    def update_file_data(
+            self,
+            item: Content,
+            new_filename: str,
+            new_mimetype: str,
+            new_content: typing.Union[bytes, typing.BinaryIO],
+            new_content_hash: str = None,
+            new_content_size: int = None,
+    ) -> Content:
+        """
+        Update file of content.
+        :param item: content to update
+        :param new_filename: new filename of content
+        :param new_mimetype: new mimetype of content
+        :param new_content: file content as bytes or as a readable and
+        seekable file object (read by blocks and copied to depot without
+        loading it in memory)
+        :param new_content_hash: sha256 of new_content if already known
+        :param new_content_size: size of new_content if already known
+        :return: updated content
+        """
         if not self.is_editable(item):
             raise ContentInNotEditableState("Can't update not editable file, you need to change his status or state (deleted/archived) before any change.")  # nopep8
         # FIXME - G.M - 2018-09-25 - Repair and do a better same content check,
@@ -1749,11 +2006,15 @@ class ContentApi(object):
         )
         item.file_name = new_filename
         item.file_mimetype = new_mimetype
-        item.depot_file = FileIntent(
+        blob = DepotBlob.get_or_create(
+            self._session,
             new_content,
             new_filename,
             new_mimetype,
+            blob_hash=new_content_hash,
+            size=new_content_size,
         )
+        item.revision.attach_blob(blob)
         item.revision_type = ActionDescription.REVISION
         return item
 
@@ -1809,15 +2070,40 @@ class ContentApi(object):
         content.is_deleted = False
         content.revision_type = ActionDescription.UNDELETION
 
-    def get_preview_page_nb(self, revision_id: int, file_extension: str) -> typing.Optional[int]:  # nopep8
+    def _build_preview_metadata(
+            self,
+            revision_id: int,
+            file_extension: str,
+    ) -> typing.Optional[RevisionPreviewMetadata]:
+        """
+        Ask preview generator for preview information of revision file.
+        :return: preview metadata or None if it can't be computed now
+        (depot or preview generator error)
+        """
         try:
             file_path = self.get_one_revision_filepath(revision_id)
-            nb_pages = self.preview_manager.get_page_nb(
-                file_path,
-                file_ext=file_extension
+            metadata = RevisionPreviewMetadata(
+                revision_id=revision_id,
+                mimetype=self.preview_manager.get_mimetype(
+                    file_path,
+                    file_ext=file_extension,
+                ),
+                has_pdf_preview=self.preview_manager.has_pdf_preview(
+                    file_path,
+                    file_ext=file_extension,
+                ),
+                has_jpeg_preview=self.preview_manager.has_jpeg_preview(
+                    file_path,
+                    file_ext=file_extension,
+                ),
             )
-        except UnsupportedMimeType:
-            return None
+            try:
+                metadata.page_nb = self.preview_manager.get_page_nb(
+                    file_path,
+                    file_ext=file_extension
+                )
+            except UnsupportedMimeType:
+                metadata.page_nb = None
         except RevisionFilePathSearchFailedDepotCorrupted as exc:
             logger.warning(
                 self,
@@ -1832,55 +2118,131 @@ class ContentApi(object):
             )
             logger.warning(self, traceback.format_exc())
             return None
-        return nb_pages
+        return metadata
 
-    def has_pdf_preview(self, revision_id: int, file_extension: str) -> bool:
-        try:
-            file_path = self.get_one_revision_filepath(revision_id)
-            return self.preview_manager.has_pdf_preview(
-                file_path,
-                file_ext=file_extension
-            )
-        except UnsupportedMimeType:
-            return False
-        except RevisionFilePathSearchFailedDepotCorrupted as exc:
-            logger.warning(
-                self,
-                "Unable to get revision filepath, depot is corrupted: {}".format(str(exc))
-            )
-            logger.warning(self, traceback.format_exc())
-            return False
-        except Exception as e:
-            logger.warning(
-                self,
-                "Unknown Preview_Generator Exception Occured : {}".format(str(e))
+    def get_previews_metadata(
+            self,
+            revisions: typing.List[typing.Tuple[int, str]],
+    ) -> typing.Dict[int, RevisionPreviewMetadata]:
+        """
+        Get preview information of many revisions: known ones are read in one
+        query, others are computed and stored. In async preview processing
+        mode, revisions whose previews are being generated are not computed:
+        preview generation job stores their metadata.
+        :param revisions: list of (revision_id, file_extension)
+        :return: dict of revision_id: preview metadata, revisions for which
+        preview metadata can't be computed (or is not known yet) are missing.
+        """
+        revision_ids = [revision_id for revision_id, _ in revisions]
+        if not revision_ids:
+            return {}
+        metadata_by_revision_id = {
+            metadata.revision_id: metadata
+            for metadata in self._session.query(RevisionPreviewMetadata).filter(  # nopep8
+                RevisionPreviewMetadata.revision_id.in_(revision_ids)
             )
-            logger.warning(self, traceback.format_exc())
-            return False
+        }
+        for revision_id, file_extension in revisions:
+            if revision_id in metadata_by_revision_id:
+                continue
+            # INFO - G.M - 2019-04-08 - computing metadata here would block
+            # request on the file conversion done by preview_generator daemon.
+            if self._is_preview_async() \
+                    and self.preview_generation_queue.is_pending(revision_id):
+                continue
+            metadata = self._build_preview_metadata(revision_id, file_extension)  # nopep8
+            if metadata:
+                metadata_by_revision_id[revision_id] = self._store_preview_metadata(metadata)  # nopep8
+        return metadata_by_revision_id
 
-    def has_jpeg_preview(self, revision_id: int, file_extension: str) -> bool:
+    def store_preview_metadata(
+            self,
+            revision_id: int,
+            file_extension: str,
+    ) -> typing.Optional[RevisionPreviewMetadata]:
+        """
+        Compute and store preview information of revision if not already
+        stored, used by preview generation job once previews are generated.
+        :param revision_id: id of revision
+        :param file_extension: file extension of revision file
+        :return: preview metadata or None if it can't be computed
+        """
+        metadata = self._session.query(RevisionPreviewMetadata).get(revision_id)  # nopep8
+        if metadata:
+            return metadata
+        metadata = self._build_preview_metadata(revision_id, file_extension)
+        if not metadata:
+            return None
+        return self._store_preview_metadata(metadata)
+
+    def _store_preview_metadata(
+            self,
+            metadata: RevisionPreviewMetadata,
+    ) -> RevisionPreviewMetadata:
+        """
+        Store computed preview metadata in a savepoint: a concurrent request
+        may have stored metadata of same revision first, then its metadata is
+        returned instead of failing whole transaction.
+        """
+        metadata.created = datetime.datetime.utcnow()
+        # INFO - G.M - 2019-04-08 - savepoint of the connection, a session
+        # savepoint would flush all pending objects of the request.
+        connection = self._session.connection()
         try:
-            file_path = self.get_one_revision_filepath(revision_id)
-            return self.preview_manager.has_jpeg_preview(
-                file_path,
-                file_ext=file_extension
-            )
-        except UnsupportedMimeType:
-            return False
-        except RevisionFilePathSearchFailedDepotCorrupted as exc:
-            logger.warning(
-                self,
-                "Unable to get revision filepath, depot is corrupted: {}".format(str(exc))
+            with connection.begin_nested():
+                connection.execute(
+                    RevisionPreviewMetadata.__table__.insert().values(
+                        revision_id=metadata.revision_id,
+                        mimetype=metadata.mimetype,
+                        page_nb=metadata.page_nb,
+                        has_pdf_preview=metadata.has_pdf_preview,
+                        has_jpeg_preview=metadata.has_jpeg_preview,
+                        created=metadata.created,
+                    )
+                )
+        except IntegrityError:
+            return self._session.query(RevisionPreviewMetadata).get(
+                metadata.revision_id
             )
-            logger.warning(self, traceback.format_exc())
+        # INFO - G.M - 2019-04-08 - insert is done without ORM, tell
+        # transaction manager the session must be committed.
+        mark_changed(self._session)
+        make_transient_to_detached(metadata)
+        self._session.add(metadata)
+        return metadata
+
+    def get_preview_metadata(
+            self,
+            revision_id: int,
+            file_extension: str,
+    ) -> typing.Optional[RevisionPreviewMetadata]:
+        """
+        Get preview information of revision, computed only the first time.
+        :param revision_id: id of revision
+        :param file_extension: file extension of revision file
+        :return: preview metadata or None if it can't be computed
+        """
+        return self.get_previews_metadata(
+            [(revision_id, file_extension)]
+        ).get(revision_id)
+
+    def get_preview_page_nb(self, revision_id: int, file_extension: str) -> typing.Optional[int]:  # nopep8
+        metadata = self.get_preview_metadata(revision_id, file_extension)
+        if not metadata:
+            return None
+        return metadata.page_nb
+
+    def has_pdf_preview(self, revision_id: int, file_extension: str) -> bool:
+        metadata = self.get_preview_metadata(revision_id, file_extension)
+        if not metadata:
             return False
-        except Exception as e:
-            logger.warning(
-                self,
-                "Unknown Preview_Generator Exception Occured : {}".format(str(e))
-            )
-            logger.warning(self, traceback.format_exc())
+        return metadata.has_pdf_preview
+
+    def has_jpeg_preview(self, revision_id: int, file_extension: str) -> bool:
+        metadata = self.get_preview_metadata(revision_id, file_extension)
+        if not metadata:
             return False
+        return metadata.has_jpeg_preview
 
     def mark_read__all(
             self,
@@ -1905,15 +2267,33 @@ class ContentApi(object):
     ) -> None:
         """
         Read content of a workspace visible for the user.
+        All revisions not already read are marked read with one
+        INSERT ... SELECT, already read revisions keep their read datetime.
         :param read_datetime: date of readigin
         :param do_flush: flush database
         :param recursive: mark read subcontent too
         :return: nothing
         """
-        itemset = self.get_last_active(workspace)
-        for item in itemset:
-            if item.has_new_information_for(self._user):
-                self.mark_read(item, read_datetime, do_flush, recursive)
+        assert self._user
+        if not read_datetime:
+            read_datetime = datetime.datetime.now()
+        self._session.flush()
+
+        content_ids_query = self._base_query(workspace).with_entities(Content.id)  # nopep8
+        if not recursive:
+            content_ids_query = content_ids_query.filter(
+                Content.type != content_type_list.Comment.slug
+            )
+        # INFO - G.M - 2019-04-05 - Disable correlation: this query use
+        # content_revisions table like the queries it will be used in.
+        self._mark_contents_read(
+            content_ids_query.statement.correlate(None),
+            read_datetime,
+            update_read_datetime=False,
+        )
+
+        if do_flush:
+            self.flush()
 
     def mark_read(
             self,
@@ -1934,36 +2314,30 @@ class ContentApi(object):
 
         # The algorithm is:
         # 1. define the read datetime
-        # 2. update all revisions related to current Content
-        # 3. do the same for all child revisions
-        #    (ie parent_id is content_id of current content)
+        # 2. find all contents to mark read: the content, and if recursive:
+        #    - all valid children, recursively,
+        #    - parent stuff (if you mark a comment as read,
+        #      then you have seen the parent),
+        #    - parent comments
+        # 3. mark read all revisions of these contents in one operation
 
         if not read_datetime:
             read_datetime = datetime.datetime.now()
+        self._session.flush()
 
-        viewed_revisions = self._session.query(ContentRevisionRO) \
-            .filter(ContentRevisionRO.content_id==content.content_id).all()
-
-        for revision in viewed_revisions:
-            revision.read_by[self._user] = read_datetime
-
+        content_ids = {content.content_id}
         if recursive:
-            # mark read :
-            # - all children
-            # - parent stuff (if you mark a comment as read,
-            #                 then you have seen the parent)
-            # - parent comments
-            for child in content.get_valid_children():
-                self.mark_read(child, read_datetime=read_datetime,
-                               do_flush=False)
-
+            content_ids.update(
+                self._get_valid_descendant_ids([content.content_id])
+            )
             if content_type_list.Comment.slug == content.type:
-                self.mark_read(content.parent, read_datetime=read_datetime,
-                               do_flush=False, recursive=False)
-                for comment in content.parent.get_comments():
-                    if comment != content:
-                        self.mark_read(comment, read_datetime=read_datetime,
-                                       do_flush=False, recursive=False)
+                content_ids.add(content.parent_id)
+                content_ids.update(
+                    comment.content_id
+                    for comment in content.parent.get_comments()
+                )
+
+        self._mark_contents_read(content_ids, read_datetime)
 
         if do_flush:
             self.flush()
@@ -1973,24 +2347,139 @@ class ContentApi(object):
     def mark_unread(self, content: Content, do_flush=True) -> Content:
         assert self._user
         assert content
+        self._session.flush()
 
-        revisions = self._session.query(ContentRevisionRO) \
-            .filter(ContentRevisionRO.content_id==content.content_id).all()
-
-        for revision in revisions:
-            try:
-                del revision.read_by[self._user]
-            except KeyError:
-                pass
-
-        for child in content.get_valid_children():
-            self.mark_unread(child, do_flush=False)
+        content_ids = {content.content_id}
+        content_ids.update(
+            self._get_valid_descendant_ids([content.content_id])
+        )
+        self._session.query(RevisionReadStatus).filter(
+            RevisionReadStatus.user_id == self._user.user_id,
+            RevisionReadStatus.revision_id.in_(
+                self._get_revision_ids_query(content_ids)
+            )
+        ).delete(synchronize_session=False)
+        self._expire_read_status(content_ids, deleted=True)
 
         if do_flush:
             self.flush()
 
         return content
 
+    def _get_valid_descendant_ids(
+            self,
+            content_ids: typing.Iterable[int],
+    ) -> typing.Set[int]:
+        """
+        Get content_id of all not deleted and not archived descendants of
+        given contents, with one query per tree level.
+        :param content_ids: content_id of contents
+        :return: set of descendants content_id
+        """
+        descendant_ids = set()
+        parent_ids = set(content_ids)
+        while parent_ids:
+            children_ids = set(
+                content_id for content_id, in self._session.query(
+                    Content.id
+                ).join(
+                    ContentRevisionRO,
+                    self._get_revision_join(),
+                ).filter(
+                    ContentRevisionRO.parent_id.in_(parent_ids),
+                    ContentRevisionRO.is_deleted == False,
+                    ContentRevisionRO.is_archived == False,
+                )
+            )
+            parent_ids = children_ids - descendant_ids
+            descendant_ids.update(parent_ids)
+        return descendant_ids
+
+    def _get_revision_ids_query(
+            self,
+            content_ids: typing.Union[typing.Iterable[int], Select],
+    ) -> Query:
+        return self._session.query(ContentRevisionRO.revision_id).filter(
+            ContentRevisionRO.content_id.in_(content_ids)
+        )
+
+    def _mark_contents_read(
+            self,
+            content_ids: typing.Union[typing.Iterable[int], Select],
+            read_datetime: datetime,
+            update_read_datetime: bool=True,
+    ) -> None:
+        """
+        Mark all revisions of given contents read for current user.
+        Missing read status are added with one INSERT ... SELECT.
+        :param content_ids: content_id of contents, or select of them
+        :param read_datetime: date of reading
+        :param update_read_datetime: also set read date of already read
+        revisions
+        """
+        user_id = self._user.user_id
+        if update_read_datetime:
+            self._session.query(RevisionReadStatus).filter(
+                RevisionReadStatus.user_id == user_id,
+                RevisionReadStatus.revision_id.in_(
+                    self._get_revision_ids_query(content_ids)
+                )
+            ).update(
+                {RevisionReadStatus.view_datetime: read_datetime},
+                synchronize_session=False,
+            )
+
+        unread_revisions = self._session.query(
+            ContentRevisionRO.revision_id,
+            literal(user_id, type_=Integer),
+            literal(read_datetime, type_=DateTime),
+        ).filter(
+            ContentRevisionRO.content_id.in_(content_ids),
+            ~exists().where(and_(
+                RevisionReadStatus.revision_id == ContentRevisionRO.revision_id,  # nopep8
+                RevisionReadStatus.user_id == user_id,
+            ))
+        )
+        self._session.execute(
+            RevisionReadStatus.__table__.insert().from_select(
+                ['revision_id', 'user_id', 'view_datetime'],
+                unread_revisions.statement,
+            )
+        )
+        # INFO - G.M - 2019-04-05 - insert is done without ORM, tell
+        # transaction manager the session must be committed.
+        mark_changed(self._session)
+        self._expire_read_status(
+            None if isinstance(content_ids, Select) else content_ids
+        )
+
+    def _expire_read_status(
+            self,
+            content_ids: typing.Optional[typing.Iterable[int]],
+            deleted: bool=False,
+    ) -> None:
+        """
+        Read status were written without ORM: expire read status related
+        objects in session for current user so they will be loaded again.
+        :param content_ids: content_id of updated contents, None if unknown
+        :param deleted: read status were deleted
+        """
+        if content_ids is not None:
+            content_ids = set(content_ids)
+        user_id = self._user.user_id
+        for instance in list(self._session.identity_map.values()):
+            if isinstance(instance, ContentRevisionRO):
+                if content_ids is None or instance.content_id in content_ids:
+                    self._session.expire(instance, ['revision_read_statuses'])  # nopep8
+            elif isinstance(instance, RevisionReadStatus):
+                if instance.user_id == user_id:
+                    if deleted:
+                        self._session.expunge(instance)
+                    else:
+                        self._session.expire(instance)
+            elif isinstance(instance, User) and instance.user_id == user_id:
+                self._session.expire(instance, ['revision_readers'])
+
     def flush(self):
         self._session.flush()
 
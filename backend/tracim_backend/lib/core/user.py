@@ -53,6 +53,7 @@ from tracim_backend.exceptions import WrongUserPassword
 from tracim_backend.lib.calendar.calendar import CalendarApi
 from tracim_backend.lib.core.group import GroupApi
 from tracim_backend.lib.mail_notifier.notifier import get_email_manager
+from tracim_backend.lib.utils.credentials_cache import CredentialsCache
 from tracim_backend.lib.utils.logger import logger
 from tracim_backend.models.auth import AuthType
 from tracim_backend.models.auth import Group
@@ -466,6 +467,7 @@ class UserApi(object):
             email: str,
             password: str,
             ldap_connector: 'Connector' = None,
+            credentials_cache: CredentialsCache = None,
     ) -> User:
         """
         Authenticate user with email and password, raise AuthenticationFailed
@@ -474,12 +476,18 @@ class UserApi(object):
         :param email: email of the user
         :param password: cleartext password of the user
         :param ldap_connector: ldap connector, enable ldap auth if provided
+        :param credentials_cache: cache of verified credentials, if provided
+        credentials found in cache are not checked again.
         :return: User who was authenticated.
         """
+        if credentials_cache:
+            user = credentials_cache.get_user(email, password, self._session)
+            if user:
+                return user
         user_auth_type_not_available = AuthenticationFailed('Auth mecanism for this user is not activated')
         for auth_type in self._config.AUTH_TYPES:
             try:
-                return self._authenticate(
+                user = self._authenticate(
                     email,
                     password,
                     ldap_connector,
@@ -488,7 +496,10 @@ class UserApi(object):
             except AuthenticationFailed as exc:
                 raise exc
             except WrongAuthTypeForUser:
-                pass
+                continue
+            if credentials_cache:
+                credentials_cache.add(email, password, user)
+            return user
 
         raise user_auth_type_not_available
 
@@ -2,8 +2,11 @@ import typing
 
 from tracim_backend.views import BASE_API_V2
 from tracim_backend.lib.mail_fetcher.email_fetcher import MailFetcher
+from tracim_backend.lib.mail_fetcher.ingestion import MailCommentIngestor
 from tracim_backend.lib.utils.daemon import FakeDaemon
 from tracim_backend.lib.utils.logger import logger
+from tracim_backend.models.setup_models import get_engine
+from tracim_backend.models.setup_models import get_session_factory
 
 
 class MailFetcherDaemon(FakeDaemon):
@@ -30,6 +33,15 @@ class MailFetcherDaemon(FakeDaemon):
             self._fetcher.stop()
 
     def run(self) -> None:
+        engine = None
+        comment_ingestor = None
+        if self.config.EMAIL_REPLY_INGESTION_MODE == self.config.CST.DIRECT:
+            engine = get_engine({'sqlalchemy.url': self.config.SQLALCHEMY_URL})  # nopep8
+            comment_ingestor = MailCommentIngestor(
+                self.config,
+                get_session_factory(engine),
+                self.config.EMAIL_REPLY_INGESTION_BATCH_SIZE,
+            )
         self._fetcher = MailFetcher(
             host=self.config.EMAIL_REPLY_IMAP_SERVER,
             port=self.config.EMAIL_REPLY_IMAP_PORT,
@@ -47,6 +59,15 @@ class MailFetcherDaemon(FakeDaemon):
             use_html_parsing=self.config.EMAIL_REPLY_USE_HTML_PARSING,
             use_txt_parsing=self.config.EMAIL_REPLY_USE_TXT_PARSING,
             lockfile_path=self.config.EMAIL_REPLY_LOCKFILE_PATH,
-            burst=self.burst
+            burst=self.burst,
+            workers=self.config.EMAIL_REPLY_WORKERS,
+            comment_ingestor=comment_ingestor,
+            sync_state_path=self.config.EMAIL_REPLY_SYNC_STATE_PATH,
+            fetch_chunk_size=self.config.EMAIL_REPLY_FETCH_CHUNK_SIZE,
+            max_attempts=self.config.EMAIL_REPLY_MAX_ATTEMPTS,
         )
-        self._fetcher.run()
+        try:
+            self._fetcher.run()
+        finally:
+            if engine:
+                engine.dispose()
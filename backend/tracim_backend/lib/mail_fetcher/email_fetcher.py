@@ -6,6 +6,8 @@ import socket
 import ssl
 import time
 import typing
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from email import message_from_bytes
 from email.header import decode_header
 from email.header import make_header
@@ -22,6 +24,9 @@ from tracim_backend.exceptions import BadStatusCode
 from tracim_backend.exceptions import EmptyEmailBody
 from tracim_backend.exceptions import NoSpecialKeyFound
 from tracim_backend.exceptions import UnsupportedRequestMethod
+from tracim_backend.lib.mail_fetcher.ingestion import MailComment
+from tracim_backend.lib.mail_fetcher.ingestion import MailCommentIngestor
+from tracim_backend.lib.mail_fetcher.sync_state import MailboxSyncState
 from tracim_backend.lib.mail_fetcher.email_processing.parser import ParsedHTMLMail  # nopep8
 from tracim_backend.lib.mail_fetcher.email_processing.sanitizer import HtmlSanitizer  # nopep8
 from tracim_backend.lib.utils.authentification import TRACIM_API_KEY_HEADER
@@ -34,6 +39,8 @@ CONTENT_TYPE_TEXT_HTML = 'text/html'
 
 IMAP_CHECKED_FLAG = imapclient.FLAGGED
 IMAP_SEEN_FLAG = imapclient.SEEN
+# INFO - G.M - 2019-04-17 - mails given up after too many failed attempts
+IMAP_DEAD_LETTER_FLAG = b'$TracimDeadLetter'
 
 MAIL_FETCHER_FILELOCK_TIMEOUT = 10
 MAIL_FETCHER_CONNECTION_TIMEOUT = 60*3
@@ -205,6 +212,11 @@ class MailFetcher(object):
         use_txt_parsing: bool,
         lockfile_path: str,
         burst: bool,
+        workers: int = 1,
+        comment_ingestor: MailCommentIngestor = None,
+        sync_state_path: str = '',
+        fetch_chunk_size: int = 50,
+        max_attempts: int = 5,
     ) -> None:
         """
         Fetch mail from a mailbox folder through IMAP and add their content to
@@ -229,6 +241,14 @@ class MailFetcher(object):
         :param use_txt_parsing: parse txt mail
         :param burst: if true, run only one time,
         if false run as continous daemon.
+        :param workers: number of mails sent to tracim at the same time
+        :param comment_ingestor: if given, comments are added directly in
+        database through it instead of using tracim api.
+        :param sync_state_path: path of file where high-water mark of
+        mailbox is persisted, not persisted if empty.
+        :param fetch_chunk_size: max number of mails fetched at once
+        :param max_attempts: number of failed attempts after which a mail is
+        flagged as dead letter and never retried.
         """
         self.host = host
         self.port = port
@@ -248,6 +268,20 @@ class MailFetcher(object):
         self.lock = filelock.FileLock(lockfile_path)
         self._is_active = True
         self.burst = burst
+        self.workers = max(workers, 1)
+        self.comment_ingestor = comment_ingestor
+        self.fetch_chunk_size = max(fetch_chunk_size, 1)
+        self.max_attempts = max(max_attempts, 1)
+        self.sync_state = MailboxSyncState.load(sync_state_path, folder)
+        # INFO - G.M - 2019-04-15 - keep-alive http connections shared by
+        # workers, one connection per worker.
+        self._http_session = requests.Session()
+        http_adapter = requests.adapters.HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=self.workers,
+        )
+        self._http_session.mount('http://', http_adapter)
+        self._http_session.mount('https://', http_adapter)
 
     def run(self) -> None:
         logger.info(self, 'Starting MailFetcher')
@@ -266,7 +300,8 @@ class MailFetcher(object):
                 logger.debug(self, 'Select folder {}'.format(
                     self.folder,
                 ))
-                imapc.select_folder(self.folder)
+                folder_info = imapc.select_folder(self.folder)
+                self.sync_state.set_uidvalidity(folder_info[b'UIDVALIDITY'])
 
                 # force renew connection when deadline is reached
                 deadline = time.time() + self.connection_max_lifetime
@@ -376,6 +411,7 @@ class MailFetcher(object):
                 logger.debug(self, 'sleep for {}'.format(self.heartbeat))
                 time.sleep(self.heartbeat)
 
+        self._http_session.close()
         log = 'Mail Fetcher stopped'
         logger.debug(self, log)
 
@@ -383,34 +419,77 @@ class MailFetcher(object):
         with self.lock.acquire(
                 timeout=MAIL_FETCHER_FILELOCK_TIMEOUT
         ):
-            messages = self._fetch(imapc)
-            cleaned_mails = [DecodedMail(
-                m.message,
-                m.uid,
-                self.reply_to_pattern,
-                self.references_pattern
-            ) for m in messages]
-            self._notify_tracim(cleaned_mails, imapc)
+            uids = self._search(imapc)
+            # INFO - G.M - 2019-04-17 - fetch mails chunk by chunk to not load
+            # whole mailbox in memory, state is saved after each chunk.
+            for index in range(0, len(uids), self.fetch_chunk_size):
+                if not self._is_active:
+                    break
+                chunk_uids = uids[index:index + self.fetch_chunk_size]
+                messages = self._fetch(imapc, chunk_uids)
+                cleaned_mails = [DecodedMail(
+                    m.message,
+                    m.uid,
+                    self.reply_to_pattern,
+                    self.references_pattern
+                ) for m in messages]
+                sent_uids, postponed_uids = self._notify_tracim(
+                    cleaned_mails,
+                    imapc,
+                )
+                # INFO - G.M - 2019-04-17 - mails postponed because tracim
+                # is unreachable are retried without counting a failure.
+                self._update_sync_state(
+                    imapc,
+                    chunk_uids,
+                    sent_uids,
+                    [
+                        m.uid for m in messages
+                        if m.uid not in sent_uids
+                        and m.uid not in postponed_uids
+                    ],
+                    postponed_uids,
+                )
 
     def stop(self) -> None:
         self._is_active = False
 
+    def _search(self, imapc: imapclient.IMAPClient) -> typing.List[int]:
+        """
+        Search uids of mails to process: mails newer than high-water mark
+        and failed or postponed mails to retry. Mails already processed (flagged) or
+        given up are excluded.
+        :return: sorted list of uids
+        """
+        logger.debug(self, 'Search unflagged messages')
+        uid_set = ','.join(
+            [str(uid) for uid in self.sync_state.get_uids_to_retry()]
+            + ['{}:*'.format(self.sync_state.last_uid + 1)]
+        )
+        found_uids = imapc.search([
+            'UNFLAGGED',
+            'UNKEYWORD', IMAP_DEAD_LETTER_FLAG,
+            'UID', uid_set,
+        ])
+        uids = self.sync_state.get_uids_to_process(found_uids)
+        logger.debug(self, 'Found {} unflagged mails'.format(
+            len(uids),
+        ))
+        return uids
+
     def _fetch(
-        self, 
+        self,
         imapc: imapclient.IMAPClient,
+        uids: typing.List[int],
     ) -> typing.List[MessageContainer]:
         """
-        Get news message from mailbox
-        :return: list of new mails
+        Get messages from mailbox
+        :param uids: uids of messages to get
+        :return: list of mails
         """
         messages = []
 
-        logger.debug(self, 'Fetch unflagged messages')
-        uids = imapc.search(['UNFLAGGED'])
-        logger.debug(self, 'Found {} unflagged mails'.format(
-            len(uids),
-        ))
-        for msgid, data in imapc.fetch(uids, ['BODY.PEEK[]']).items():
+        for msgid, data in sorted(imapc.fetch(uids, ['BODY.PEEK[]']).items()):  # nopep8
             # INFO - G.M - 2017-12-08 - Fetch BODY.PEEK[]
             # Retrieve all mail(body and header) but don't set mail
             # as seen because of PEEK
@@ -436,27 +515,171 @@ class MailFetcher(object):
 
         return messages
 
+    def _update_sync_state(
+        self,
+        imapc: imapclient.IMAPClient,
+        uids: typing.List[int],
+        sent_uids: typing.List[int],
+        failed_uids: typing.List[int],
+        postponed_uids: typing.List[int],
+    ) -> None:
+        """
+        Move high-water mark after processing of a chunk of mails and flag as
+        dead letter mails failing too many times.
+        """
+        given_up_uids = self.sync_state.update(
+            uids,
+            sent_uids,
+            failed_uids,
+            self.max_attempts,
+            postponed_uids=postponed_uids,
+        )
+        if given_up_uids:
+            logger.error(
+                self,
+                'Give up mails {} after {} failed attempts'.format(
+                    given_up_uids,
+                    self.max_attempts,
+                )
+            )
+            imapc.add_flags(given_up_uids, (IMAP_DEAD_LETTER_FLAG,))
+
     def _notify_tracim(
         self,
         mails: typing.List[DecodedMail],
         imapc: imapclient.IMAPClient
-    ) -> None:
+    ) -> typing.Tuple[typing.List[int], typing.List[int]]:
         """
-        Send http request to tracim endpoint
+        Send mails to tracim, through http requests to tracim endpoint or
+        directly through comment ingestor, then all correctly sent mails are
+        flagged at once.
         :param mails: list of mails to send
-        :return: none
+        :return: uids of correctly sent mails, uids of mails postponed
+        because tracim is unreachable
         """
         logger.debug(self, 'Notify tracim about {} new responses'.format(
             len(mails),
         ))
+        if self.comment_ingestor:
+            sent_uids, postponed_uids = self._ingest_comments(mails)
+        else:
+            sent_uids, postponed_uids = self._send_requests(mails)
+        # Flag all correctly checked mail
+        if sent_uids:
+            imapc.add_flags(sent_uids, (IMAP_CHECKED_FLAG, IMAP_SEEN_FLAG))
+        return sent_uids, postponed_uids
+
+    def _send_requests(
+        self,
+        mails: typing.List[DecodedMail],
+    ) -> typing.Tuple[typing.List[int], typing.List[int]]:
+        """
+        Send http requests to tracim endpoint, mails are processed by a pool
+        of workers.
+        :param mails: list of mails to send
+        :return: uids of correctly sent mails, uids of mails postponed
+        """
+        sent_uids = []
+        postponed_uids = []
+        # INFO - G.M - 2019-04-15 - imap connection is not thread-safe, only
+        # http requests are done by workers.
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            for group_sent_uids, group_postponed_uids in executor.map(
+                self._notify_tracim_for_mails,
+                self._group_mails_by_content(mails),
+            ):
+                sent_uids.extend(group_sent_uids)
+                postponed_uids.extend(group_postponed_uids)
+        return sent_uids, postponed_uids
+
+    def _ingest_comments(
+        self,
+        mails: typing.List[DecodedMail],
+    ) -> typing.Tuple[typing.List[int], typing.List[int]]:
+        """
+        Add mails as comments directly in database.
+        :param mails: list of mails to add
+        :return: uids of correctly added mails, uids of mails postponed
+        """
+        comments = []
+        for mail in mails:
+            try:
+                comments.append(self._create_mail_comment(mail))
+            except NoSpecialKeyFound as exc:
+                log = 'Failed to create comment due to missing specialkey in mail {}'  # nopep8
+                logger.error(self, log.format(exc.__str__()))
+            except EmptyEmailBody as exc:
+                log = 'Empty body, skip mail'
+                logger.error(self, log)
+            except Exception as exc:
+                log = 'Failed to create comment in mail fetcher error : {}'
+                logger.error(self, log.format(exc.__str__()))
+        return self.comment_ingestor.ingest(comments)
+
+    def _create_mail_comment(self, mail: DecodedMail) -> MailComment:
+        return MailComment(
+            uid=mail.uid,
+            content_id=int(mail.get_key()),
+            user_email=mail.get_from_address(),
+            raw_content=mail.get_body(
+                use_html_parsing=self.use_html_parsing,
+                use_txt_parsing=self.use_txt_parsing,
+            ),
+        )
+
+    def _group_mails_by_content(
+        self,
+        mails: typing.List[DecodedMail],
+    ) -> typing.List[typing.List[DecodedMail]]:
+        """
+        Group mails by content they reply to: mails of a group are sent one
+        after the other to keep comments order.
+        """
+        groups = OrderedDict()  # type: typing.Dict[typing.Any, typing.List[DecodedMail]]  # nopep8
+        for mail in mails:
+            try:
+                key = mail.get_key()
+            except Exception:
+                # INFO - G.M - 2019-04-15 - error is logged when mail is sent
+                key = None
+            if key is None:
+                key = ('mail', id(mail))
+            groups.setdefault(key, []).append(mail)
+        return list(groups.values())
+
+    def _notify_tracim_for_mails(
+        self,
+        mails: typing.List[DecodedMail],
+    ) -> typing.Tuple[typing.List[int], typing.List[int]]:
+        """
+        Send mails one by one to tracim.
+        :param mails: list of mails to send
+        :return: uids of correctly sent mails, uids of mails postponed
+        because tracim is unreachable
+        """
         # TODO BS 20171124: Look around mail.get_from_address(), mail.get_key()
         # , mail.get_body() etc ... for raise InvalidEmailError if missing
         #  required informations (actually get_from_address raise IndexError
         #  if no from address for example) and catch it here
-        while mails:
-            mail = mails.pop()
+        sent_uids = []
+        postponed_uids = []
+        for mail in mails:
             try:
                 method, endpoint, json_body_dict = self._create_comment_request(mail)  # nopep8
+            except requests.exceptions.RequestException as exc:
+                log = 'Fail to get content info from tracim : {}'
+                logger.error(self, log.format(exc.__str__()))
+                postponed_uids.append(mail.uid)
+                continue
+            except BadStatusCode as exc:
+                if self._is_tracim_unavailable(exc):
+                    log = 'Tracim unavailable to get content info : {}'
+                    logger.error(self, log.format(exc.__str__()))
+                    postponed_uids.append(mail.uid)
+                    continue
+                log = 'Tracim refused to give content info : {}'
+                logger.error(self, log.format(exc.__str__()))
+                continue
             except NoSpecialKeyFound as exc:
                 log = 'Failed to create comment request due to missing specialkey in mail {}'  # nopep8
                 logger.error(self, log.format(exc.__str__()))
@@ -473,7 +696,6 @@ class MailFetcher(object):
             try:
                 self._send_request(
                     mail=mail,
-                    imapc=imapc,
                     method=method,
                     endpoint=endpoint,
                     json_body_dict=json_body_dict,
@@ -481,9 +703,32 @@ class MailFetcher(object):
             except requests.exceptions.Timeout as e:
                 log = 'Timeout error to transmit fetched mail to tracim : {}'
                 logger.error(self, log.format(str(e)))
+                postponed_uids.append(mail.uid)
+                continue
             except requests.exceptions.RequestException as e:
                 log = 'Fail to transmit fetched mail to tracim : {}'
                 logger.error(self, log.format(str(e)))
+                postponed_uids.append(mail.uid)
+                continue
+            except BadStatusCode as e:
+                if self._is_tracim_unavailable(e):
+                    log = 'Tracim unavailable to receive fetched mail : {}'
+                    logger.error(self, log.format(str(e)))
+                    postponed_uids.append(mail.uid)
+                    continue
+                log = 'Tracim refused fetched mail : {}'
+                logger.error(self, log.format(str(e)))
+                continue
+            sent_uids.append(mail.uid)
+        return sent_uids, postponed_uids
+
+    def _is_tracim_unavailable(self, exc: BadStatusCode) -> bool:
+        """
+        Whether bad status code means tracim (or a proxy before it) is
+        unavailable: server errors are retried later without counting a mail
+        failure, only client errors are refusals of mail.
+        """
+        return exc.status_code is not None and exc.status_code >= 500
 
     def _get_auth_headers(self, user_email) -> dict:
         return {
@@ -496,7 +741,7 @@ class MailFetcher(object):
             api_base_url=self.api_base_url,
             content_id=content_id,
         )
-        result = requests.get(
+        result = self._http_session.get(
             endpoint,
             headers=self._get_auth_headers(user_email)
         )
@@ -504,7 +749,7 @@ class MailFetcher(object):
             details = str(result.content)
             msg = 'bad status code {}(200 is valid) response when trying to get info about a content: {}'  # nopep8
             msg = msg.format(str(result.status_code), details)
-            raise BadStatusCode(msg)
+            raise BadStatusCode(msg, status_code=result.status_code)
         return result.json()
 
     def _create_comment_request(self, mail: DecodedMail) -> typing.Tuple[str, str, dict]:  # nopep8
@@ -528,11 +773,10 @@ class MailFetcher(object):
     def _send_request(
             self,
             mail: DecodedMail,
-            imapc: imapclient.IMAPClient,
             method: str,
             endpoint: str,
             json_body_dict: dict
-    ):
+    ) -> None:
         logger.debug(
             self,
             'Contact API on {endpoint} with method {method} with body {body}'.format(   # nopep8
@@ -542,7 +786,7 @@ class MailFetcher(object):
             ),
         )
         if method == 'POST':
-            request_method = requests.post
+            request_method = self._http_session.post
         else:
             # TODO - G.M - 2018-08-24 - Better handling exception
             raise UnsupportedRequestMethod('Request method not supported')
@@ -553,11 +797,12 @@ class MailFetcher(object):
             headers=self._get_auth_headers(mail.get_from_address()),
         )
         if r.status_code not in [200, 204]:
-            details = r.json().get('message')
+            # INFO - G.M - 2019-04-17 - error response may not be json, for
+            # example when given by a proxy while tracim is down.
+            try:
+                details = r.json().get('message')
+            except ValueError:
+                details = r.text
             msg = 'bad status code {} (200 and 204 are valid) response when sending mail to tracim: {}'  # nopep8
             msg = msg.format(str(r.status_code), details)
-            raise BadStatusCode(msg)
-        # Flag all correctly checked mail
-        if r.status_code in [200, 204]:
-            imapc.add_flags((mail.uid,), IMAP_CHECKED_FLAG)
-            imapc.add_flags((mail.uid,), IMAP_SEEN_FLAG)
+            raise BadStatusCode(msg, status_code=r.status_code)
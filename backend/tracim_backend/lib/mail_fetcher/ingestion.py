@@ -0,0 +1,239 @@
+# -*- coding: utf-8 -*-
+import typing
+from collections import namedtuple
+
+import transaction
+from sqlalchemy.exc import InterfaceError
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+from sqlalchemy.orm import sessionmaker
+
+from tracim_backend.app_models.contents import content_type_list
+from tracim_backend.exceptions import ContentNotFound
+from tracim_backend.exceptions import InsufficientUserRoleInWorkspace
+from tracim_backend.exceptions import TracimException
+from tracim_backend.exceptions import UnallowedSubContent
+from tracim_backend.exceptions import UserDoesNotExist
+from tracim_backend.exceptions import WorkspaceNotFound
+from tracim_backend.lib.core.content import ContentApi
+from tracim_backend.lib.utils.logger import logger
+from tracim_backend.models.auth import User
+from tracim_backend.models.data import Content
+from tracim_backend.models.data import UserRoleInWorkspace
+from tracim_backend.models.data import Workspace
+from tracim_backend.models.roles import WorkspaceRoles
+from tracim_backend.models.setup_models import get_tm_session
+
+# INFO - G.M - 2019-04-16 - uid: imap uid of mail, content_id: content
+# commented, user_email: sender of mail, raw_content: comment content.
+MailComment = namedtuple(
+    'MailComment',
+    ['uid', 'content_id', 'user_email', 'raw_content'],
+)
+
+
+class MailCommentIngestor(object):
+    """
+    Add comments from fetched mails directly in database, without doing http
+    requests to tracim api: same checks as comment creation endpoint are done
+    for all mails of a batch with a few bulk queries, then all comments of
+    batch are committed in one transaction.
+    """
+
+    def __init__(
+            self,
+            config: 'CFG',
+            session_factory: sessionmaker,
+            batch_size: int,
+    ) -> None:
+        """
+        :param config: Tracim Config
+        :param session_factory: factory of sessions, sessions share
+        connection pool of factory engine.
+        :param batch_size: max number of comments added in one transaction
+        """
+        self._config = config
+        self._session_factory = session_factory
+        self.batch_size = max(batch_size, 1)
+
+    def ingest(
+            self,
+            comments: typing.List[MailComment],
+    ) -> typing.Tuple[typing.List[int], typing.List[int]]:
+        """
+        Add comments, batch by batch.
+        :param comments: comments to add
+        :return: uids of mails whose comment has been committed, uids of
+        mails whose comment can't be committed because database is
+        unavailable and should be retried later. Other mails failed: their
+        comment is refused or always fails to be added.
+        """
+        ingested_uids = []
+        postponed_uids = []
+        for index in range(0, len(comments), self.batch_size):
+            batch = comments[index:index + self.batch_size]
+            try:
+                ingested_uids.extend(self._ingest_batch(batch))
+            except Exception as exc:
+                if self._is_database_unavailable(exc):
+                    logger.error(
+                        self,
+                        'Database unavailable, postpone batch of {} mail comments: {}'.format(  # nopep8
+                            len(batch),
+                            str(exc),
+                        )
+                    )
+                    postponed_uids.extend(comment.uid for comment in batch)
+                    continue
+                # INFO - G.M - 2019-04-16 - one broken mail should not block
+                # other mails of batch: retry them one transaction per mail.
+                logger.error(
+                    self,
+                    'Fail to add batch of {} mail comments, retry them one by one: {}'.format(  # nopep8
+                        len(batch),
+                        str(exc),
+                    )
+                )
+                for comment in batch:
+                    try:
+                        ingested_uids.extend(self._ingest_batch([comment]))
+                    except Exception as exc:
+                        logger.error(
+                            self,
+                            'Fail to add comment of mail {}: {}'.format(
+                                comment.uid,
+                                str(exc),
+                            )
+                        )
+                        # INFO - G.M - 2019-04-17 - mail failing alone is
+                        # counted as failure, to be given up after max
+                        # attempts instead of being retried forever.
+                        if self._is_database_unavailable(exc):
+                            postponed_uids.append(comment.uid)
+        return ingested_uids, postponed_uids
+
+    def _is_database_unavailable(self, exc: Exception) -> bool:
+        """
+        Whether error is about database connection (lost or refused
+        connection, locked database...) and not about added comment.
+        """
+        return isinstance(exc, (OperationalError, InterfaceError))
+
+    def _ingest_batch(
+            self,
+            comments: typing.List[MailComment],
+    ) -> typing.List[int]:
+        with transaction.manager:
+            session = get_tm_session(self._session_factory, transaction.manager)  # nopep8
+            return self.create_comments(session, comments)
+
+    def create_comments(
+            self,
+            session: Session,
+            comments: typing.List[MailComment],
+    ) -> typing.List[int]:
+        """
+        Add comments in given session, refused comments are logged and
+        skipped. Transaction should be committed once done.
+        :param session: database session
+        :param comments: comments to add
+        :return: uid of mails whose comment has been added
+        """
+        if not comments:
+            return []
+        users = {
+            user.email: user
+            for user in session.query(User).filter(
+                User.email.in_({comment.user_email for comment in comments})
+            )
+        }
+        content_api = ContentApi(
+            session=session,
+            current_user=None,
+            config=self._config,
+            show_archived=True,
+            show_deleted=True,
+        )
+        contents = {
+            content.content_id: content
+            for content in content_api.get_base_query(None).filter(
+                Content.content_id.in_(
+                    {comment.content_id for comment in comments}
+                )
+            )
+        }
+        workspace_ids = {content.workspace_id for content in contents.values()}
+        # INFO - G.M - 2019-04-16 - workspaces are loaded in session identity
+        # map, so content.workspace does not need any other query.
+        workspaces = {
+            workspace.workspace_id: workspace
+            for workspace in session.query(Workspace)
+            .filter(Workspace.workspace_id.in_(workspace_ids))
+            .filter(Workspace.is_deleted == False)  # nopep8
+        }
+        roles = {
+            (role.user_id, role.workspace_id): role.role
+            for role in session.query(UserRoleInWorkspace)
+            .filter(UserRoleInWorkspace.workspace_id.in_(workspace_ids))
+            .filter(UserRoleInWorkspace.user_id.in_(
+                {user.user_id for user in users.values()}
+            ))
+        }
+
+        added_uids = []
+        for comment in comments:
+            try:
+                user = users.get(comment.user_email)
+                if not user or not user.is_active or user.is_deleted:
+                    raise UserDoesNotExist(
+                        'No active user with email "{}"'.format(
+                            comment.user_email,
+                        )
+                    )
+                content = contents.get(comment.content_id)
+                if not content:
+                    raise ContentNotFound(
+                        'Content "{}" not found in database'.format(
+                            comment.content_id,
+                        )
+                    )
+                workspace = workspaces.get(content.workspace_id)
+                if not workspace:
+                    raise WorkspaceNotFound(
+                        'Workspace of content "{}" not found'.format(
+                            comment.content_id,
+                        )
+                    )
+                role = roles.get(
+                    (user.user_id, workspace.workspace_id),
+                    UserRoleInWorkspace.NOT_APPLICABLE,
+                )
+                if role < WorkspaceRoles.CONTRIBUTOR.level:
+                    raise InsufficientUserRoleInWorkspace()
+                if content.type == content_type_list.Folder.slug:
+                    raise UnallowedSubContent(
+                        'Comments are not allowed on folders'
+                    )
+                ContentApi(
+                    session=session,
+                    current_user=user,
+                    config=self._config,
+                    show_archived=True,
+                    show_deleted=True,
+                ).create_comment(
+                    workspace,
+                    content,
+                    comment.raw_content.strip(),
+                    do_save=True,
+                )
+            except TracimException as exc:
+                logger.error(
+                    self,
+                    'Comment of mail {} refused: {}'.format(
+                        comment.uid,
+                        exc.__class__.__name__ + ' ' + str(exc),
+                    )
+                )
+                continue
+            added_uids.append(comment.uid)
+        return added_uids
@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+import typing
+
+from tracim_backend.lib.utils.logger import logger
+
+
+class MailboxSyncState(object):
+    """
+    High-water mark of mail fetcher on a mailbox folder: uid of last
+    processed mail (valid only for same UIDVALIDITY of folder), number of
+    failed attempts of not yet processed mails and uids of mails postponed
+    (tracim unreachable), to retry without counting a failure. If path is
+    given, state is persisted in this file (json) so incremental sync survive
+    restart.
+    """
+
+    def __init__(self, path: str, folder: str) -> None:
+        """
+        :param path: path of state file, no persistence if empty
+        :param folder: mailbox folder synced
+        """
+        self.path = path
+        self.folder = folder
+        self.uidvalidity = None  # type: typing.Optional[int]
+        self.last_uid = 0
+        self.failures = {}  # type: typing.Dict[int, int]
+        self.postponed = set()  # type: typing.Set[int]
+
+    @classmethod
+    def load(cls, path: str, folder: str) -> 'MailboxSyncState':
+        """
+        Load state from file, state is empty if file does not exist or is
+        about another folder.
+        """
+        state = cls(path, folder)
+        if not path or not os.path.isfile(path):
+            return state
+        try:
+            with open(path, 'r') as state_file:
+                data = json.load(state_file)
+        except (OSError, ValueError) as exc:
+            logger.warning(
+                state,
+                'Unreadable mail fetcher state file {}, full sync: {}'.format(
+                    path,
+                    str(exc),
+                )
+            )
+            return state
+        if data.get('folder') != folder:
+            return state
+        state.uidvalidity = data.get('uidvalidity')
+        state.last_uid = data.get('last_uid', 0)
+        state.failures = {
+            int(uid): attempts
+            for uid, attempts in data.get('failures', {}).items()
+        }
+        state.postponed = set(data.get('postponed', []))
+        return state
+
+    def save(self) -> None:
+        if not self.path:
+            return
+        data = {
+            'folder': self.folder,
+            'uidvalidity': self.uidvalidity,
+            'last_uid': self.last_uid,
+            'failures': {
+                str(uid): attempts for uid, attempts in self.failures.items()
+            },
+            'postponed': sorted(self.postponed),
+        }
+        # INFO - G.M - 2019-04-17 - write then rename, state file is never
+        # partially written.
+        tmp_path = '{}.tmp'.format(self.path)
+        with open(tmp_path, 'w') as state_file:
+            json.dump(data, state_file)
+        os.replace(tmp_path, self.path)
+
+    def set_uidvalidity(self, uidvalidity: int) -> None:
+        """
+        Set UIDVALIDITY of folder, uids known by state are dropped if it
+        changed.
+        """
+        if self.uidvalidity is not None and self.uidvalidity != uidvalidity:
+            logger.warning(
+                self,
+                'UIDVALIDITY of folder {} changed ({} -> {}), full sync'.format(  # nopep8
+                    self.folder,
+                    self.uidvalidity,
+                    uidvalidity,
+                )
+            )
+            self.last_uid = 0
+            self.failures = {}
+            self.postponed = set()
+        self.uidvalidity = uidvalidity
+        self.save()
+
+    def get_uids_to_process(
+            self,
+            unprocessed_uids: typing.Iterable[int],
+    ) -> typing.List[int]:
+        """
+        :param unprocessed_uids: uids of mails not yet processed by any
+        fetcher, may contain uids under high-water mark
+        :return: new uids, and uids of failed or postponed mails to retry,
+        sorted
+        """
+        unprocessed_uids = set(unprocessed_uids)
+        # INFO - G.M - 2019-04-17 - forget failed or postponed mails
+        # processed by someone else or removed.
+        self.failures = {
+            uid: attempts
+            for uid, attempts in self.failures.items()
+            if uid in unprocessed_uids
+        }
+        self.postponed &= unprocessed_uids
+        return sorted(
+            uid for uid in unprocessed_uids
+            if uid > self.last_uid
+            or uid in self.failures
+            or uid in self.postponed
+        )
+
+    def get_uids_to_retry(self) -> typing.List[int]:
+        """
+        :return: uids under high-water mark to retry: failed and postponed
+        mails, sorted
+        """
+        return sorted(set(self.failures) | self.postponed)
+
+    def update(
+            self,
+            uids: typing.List[int],
+            processed_uids: typing.List[int],
+            failed_uids: typing.List[int],
+            max_attempts: int,
+            postponed_uids: typing.List[int]=None,
+    ) -> typing.List[int]:
+        """
+        Update state after processing of a chunk of mails
+        :param uids: uids of chunk
+        :param processed_uids: uids of correctly processed mails
+        :param failed_uids: uids of mails which failed
+        :param max_attempts: number of failures after which a mail is given up
+        :param postponed_uids: uids of mails not processed because tracim is
+        unreachable, retried later without counting a failure.
+        :return: uids of mails given up
+        """
+        postponed_uids = postponed_uids or []
+        given_up_uids = []
+        for uid in processed_uids:
+            self.failures.pop(uid, None)
+            self.postponed.discard(uid)
+        for uid in postponed_uids:
+            self.postponed.add(uid)
+        for uid in failed_uids:
+            self.postponed.discard(uid)
+            attempts = self.failures.get(uid, 0) + 1
+            if attempts >= max_attempts:
+                self.failures.pop(uid, None)
+                given_up_uids.append(uid)
+            else:
+                self.failures[uid] = attempts
+        if uids:
+            self.last_uid = max(self.last_uid, max(uids))
+        self.save()
+        return given_up_uids
@@ -1,12 +1,28 @@
+import time
 import typing
+
+import transaction
+from sqlalchemy.orm import sessionmaker
+
+from tracim_backend.lib.mail_notifier.digest import NotificationDigest
+from tracim_backend.lib.mail_notifier.jobs import CONTENT_NOTIFICATION_QUEUE_NAME  # nopep8
+from tracim_backend.lib.mail_notifier.jobs import dispose_job_engines
+from tracim_backend.lib.mail_notifier.outbox import EmailOutbox
+from tracim_backend.lib.mail_notifier.sender import close_smtp_connection_pools  # nopep8
 from tracim_backend.lib.utils.daemon import FakeDaemon
+from tracim_backend.lib.utils.daemon import RQSimpleWorker
 from tracim_backend.lib.utils.logger import logger
 from tracim_backend.lib.utils.utils import get_rq_queue
 from tracim_backend.lib.utils.utils import get_redis_connection
+from tracim_backend.models.setup_models import get_engine
+from tracim_backend.models.setup_models import get_session_factory
+from tracim_backend.models.setup_models import get_tm_session
 from rq.dummy import do_nothing
-from rq.worker import StopRequested
 from rq import Connection as RQConnection
-from rq import Worker as BaseRQWorker
+
+# INFO - G.M - 2019-04-08 - content notification jobs are listed first:
+# they enqueue mail_sender jobs, which are then run by the same worker.
+MAIL_NOTIFIER_QUEUE_NAMES = [CONTENT_NOTIFICATION_QUEUE_NAME, 'mail_sender']
 
 
 class MailSenderDaemon(FakeDaemon):
@@ -19,7 +35,7 @@ class MailSenderDaemon(FakeDaemon):
         """
         super().__init__(*args, **kwargs)
         self.config = config
-        self.worker = None  # type: RQWorker
+        self.worker = None  # type: RQSimpleWorker
         self.burst = burst
 
     def append_thread_callback(self, callback: typing.Callable) -> None:
@@ -37,22 +53,154 @@ class MailSenderDaemon(FakeDaemon):
 
     def run(self) -> None:
 
+        # INFO - G.M - 2019-04-11 - jobs are run in daemon process to reuse
+        # its SMTP connections, see SmtpConnectionPool.
         with RQConnection(get_redis_connection(self.config)):
-            self.worker = RQWorker(['mail_sender'])
-            self.worker.work(burst=self.burst)
+            self.worker = RQSimpleWorker(MAIL_NOTIFIER_QUEUE_NAMES)
+            try:
+                self.worker.work(burst=self.burst)
+            finally:
+                close_smtp_connection_pools()
+                dispose_job_engines()
+
+
+class NotificationDigestDaemon(FakeDaemon):
+    """
+    Thread containing a daemon who periodically send digest emails of
+    workspaces whose content update events are due.
+    """
+    def __init__(self, config: 'CFG', burst=True, *args, **kwargs):
+        """
+        :param config: tracim config
+        :param burst: if true, run one time, if false, run continously
+        """
+        super().__init__(*args, **kwargs)
+        self.config = config
+        self.burst = burst
+        self._is_active = True
+
+    def append_thread_callback(self, callback: typing.Callable) -> None:
+        logger.warning('NotificationDigestDaemon not implement append_thread_callback')  # nopep8
+        pass
+
+    def stop(self) -> None:
+        self._is_active = False
+
+    def run(self) -> None:
+        engine = get_engine({'sqlalchemy.url': self.config.SQLALCHEMY_URL})
+        try:
+            session_factory = get_session_factory(engine)
+            while self._is_active:
+                self._flush_due_digests(session_factory)
+                if self.burst:
+                    self.stop()
+                    break
+                time.sleep(self.config.EMAIL_NOTIFICATION_DIGEST_CHECK_HEARTBEAT)  # nopep8
+        finally:
+            engine.dispose()
+
+    def _flush_due_digests(self, session_factory: sessionmaker) -> None:
+        with transaction.manager:
+            session = get_tm_session(session_factory, transaction.manager)
+            workspace_ids = NotificationDigest(
+                self.config,
+                session,
+            ).get_due_workspace_ids()
+        # INFO - G.M - 2019-04-11 - one transaction per workspace: a workspace
+        # whose digest fails keeps its events for next check and does not
+        # block other workspaces.
+        for workspace_id in workspace_ids:
+            try:
+                with transaction.manager:
+                    session = get_tm_session(session_factory, transaction.manager)  # nopep8
+                    digest = NotificationDigest(self.config, session)
+                    messages = digest.flush_workspace(workspace_id)
+                # INFO - G.M - 2019-04-11 - emails are sent only once events
+                # deletion is committed, a sending failure must not make
+                # digest be sent again to recipients already notified.
+                digest.send_emails(messages)
+            except Exception as exc:
+                logger.error(
+                    self,
+                    'Unable to send digest of workspace {}: {}'.format(
+                        workspace_id,
+                        str(exc),
+                    )
+                )
+                logger.exception(self, exc)
 
 
-class RQWorker(BaseRQWorker):
-    def _install_signal_handlers(self):
-        # RQ Worker is designed to work in main thread
-        # So we have to disable these signals (we implement server stop in
-        # MailSenderDaemon.stop method).
+class EmailOutboxRelayDaemon(FakeDaemon):
+    """
+    Thread containing a daemon who periodically sends emails stored in
+    outbox, batch by batch.
+    """
+    def __init__(self, config: 'CFG', burst=True, *args, **kwargs):
+        """
+        :param config: tracim config
+        :param burst: if true, run one time, if false, run continously
+        """
+        super().__init__(*args, **kwargs)
+        self.config = config
+        self.burst = burst
+        self._is_active = True
+
+    def append_thread_callback(self, callback: typing.Callable) -> None:
+        logger.warning('EmailOutboxRelayDaemon not implement append_thread_callback')  # nopep8
         pass
 
-    def dequeue_job_and_maintain_ttl(self, timeout):
-        # RQ Worker is designed to work in main thread, so we add behaviour
-        # here: if _stop_requested has been set to True, raise the standard way
-        # StopRequested exception to stop worker.
-        if self._stop_requested:
-            raise StopRequested()
-        return super().dequeue_job_and_maintain_ttl(timeout)
+    def stop(self) -> None:
+        self._is_active = False
+
+    def run(self) -> None:
+        engine = get_engine({'sqlalchemy.url': self.config.SQLALCHEMY_URL})
+        try:
+            session_factory = get_session_factory(engine)
+            while self._is_active:
+                # INFO - G.M - 2019-04-12 - drain outbox without waiting
+                # heartbeat as long as batches are full.
+                while self._is_active and self._relay_batch(session_factory):  # nopep8
+                    pass
+                self._log_metrics(session_factory)
+                if self.burst:
+                    self.stop()
+                    break
+                time.sleep(self.config.EMAIL_OUTBOX_CHECK_HEARTBEAT)
+        finally:
+            close_smtp_connection_pools()
+            engine.dispose()
+
+    def _relay_batch(self, session_factory: sessionmaker) -> bool:
+        """
+        Relay one batch of messages.
+        :return: True if batch was full, meaning more messages may be due.
+        """
+        with transaction.manager:
+            session = get_tm_session(session_factory, transaction.manager)
+            result = EmailOutbox(self.config, session).relay()
+        if result.sent or result.failed:
+            logger.info(
+                self,
+                'Outbox batch relayed: {} sent, {} failed, '
+                'max latency {:.1f}s'.format(
+                    result.sent,
+                    result.failed,
+                    max(result.latencies, default=0),
+                )
+            )
+        return result.sent + result.failed >= self.config.EMAIL_OUTBOX_BATCH_SIZE  # nopep8
+
+    def _log_metrics(self, session_factory: sessionmaker) -> None:
+        with transaction.manager:
+            session = get_tm_session(session_factory, transaction.manager)
+            metrics = EmailOutbox(self.config, session).get_metrics()
+        logger.info(
+            self,
+            'Outbox: {} pending message(s) ({} retrying), {} failed, '
+            'oldest pending message age {:.1f}s'.format(
+                metrics.pending,
+                metrics.retrying,
+                metrics.failed,
+                metrics.oldest_pending_age,
+            )
+        )
@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+import datetime
+import typing
+from email.message import Message
+
+from sqlalchemy import func
+from sqlalchemy import or_
+from sqlalchemy.orm import Session
+
+from tracim_backend.app_models.contents import content_type_list
+from tracim_backend.config import CFG
+from tracim_backend.lib.mail_notifier.sender import EmailSender
+from tracim_backend.lib.mail_notifier.sender import send_email_through
+from tracim_backend.lib.mail_notifier.utils import SmtpConfiguration
+from tracim_backend.lib.utils.logger import logger
+from tracim_backend.models.data import Content
+from tracim_backend.models.data import NotificationDigestEvent
+
+
+class NotificationDigest(object):
+    """
+    Digest of content update notifications: content update events are stored
+    in database instead of being notified one by one, then events of a
+    workspace are notified at once, in one email per user, when workspace is
+    due (see get_due_workspace_ids).
+    """
+
+    def __init__(self, config: CFG, session: Session) -> None:
+        self._config = config
+        self._session = session
+
+    def add_event(self, actor_id: int, content: Content) -> None:
+        """
+        Store content update event in session, event will be committed (or
+        rollbacked) with content update.
+        Comments are stored as an event of their parent content, digest
+        summarize main contents.
+        :param actor_id: id of the user that has triggered the event
+        :param content: updated content
+        """
+        main_content = content
+        if content.type == content_type_list.Comment.slug:
+            main_content = content.parent
+        self._session.add(
+            NotificationDigestEvent(
+                workspace_id=content.workspace_id,
+                content_id=main_content.content_id,
+                actor_id=actor_id,
+                action=content.get_last_action().id,
+            )
+        )
+
+    def get_due_workspace_ids(
+            self,
+            now: datetime.datetime=None
+    ) -> typing.List[int]:
+        """
+        Get ids of workspaces whose digest should be sent now: workspaces
+        without event since quiet period or with an event older than max delay
+        :param now: reference datetime (utc), default to current datetime
+        """
+        now = now or datetime.datetime.utcnow()
+        quiet_limit = now - datetime.timedelta(
+            seconds=self._config.EMAIL_NOTIFICATION_DIGEST_QUIET_PERIOD
+        )
+        max_delay_limit = now - datetime.timedelta(
+            seconds=self._config.EMAIL_NOTIFICATION_DIGEST_MAX_DELAY
+        )
+        query = self._session.query(NotificationDigestEvent.workspace_id)
+        query = query.group_by(NotificationDigestEvent.workspace_id)
+        query = query.having(
+            or_(
+                func.max(NotificationDigestEvent.created) <= quiet_limit,
+                func.min(NotificationDigestEvent.created) <= max_delay_limit,
+            )
+        )
+        return [workspace_id for workspace_id, in query.all()]
+
+    def flush_workspace(self, workspace_id: int) -> typing.List[Message]:
+        """
+        Consume all events of workspace and build digest emails about them.
+        Events are deleted in current transaction. In outbox mode, emails are
+        stored in outbox in the same transaction; otherwise they are returned
+        to be sent with send_emails once transaction is committed, so
+        a sending failure can't rollback deletion and resend digest to
+        recipients already notified.
+        :param workspace_id: id of workspace to flush
+        :return: digest emails to send after commit
+        """
+        # INFO - G.M - 2019-04-11 - Dirty import, to avoid circular import
+        from tracim_backend.lib.mail_notifier.notifier import EmailManager
+        events = self._session.query(NotificationDigestEvent) \
+            .filter(NotificationDigestEvent.workspace_id == workspace_id) \
+            .order_by(NotificationDigestEvent.event_id) \
+            .all()
+        if not events:
+            return []
+        self._session.query(NotificationDigestEvent) \
+            .filter(
+                NotificationDigestEvent.event_id.in_(
+                    [event.event_id for event in events]
+                )
+            ).delete(synchronize_session=False)
+        logger.info(
+            self,
+            'Flush {} content update event(s) of workspace {}'.format(
+                len(events),
+                workspace_id,
+            )
+        )
+        messages = EmailManager(
+            self._get_smtp_config(),
+            self._config,
+            self._session,
+        ).build_content_digest_messages(workspace_id, events)
+        if self._config.EMAIL_PROCESSING_MODE == self._config.CST.OUTBOX:
+            for message in messages:
+                send_email_through(
+                    self._config,
+                    self._get_email_sender().send_mail,
+                    message,
+                    session=self._session,
+                )
+            return []
+        return messages
+
+    def send_emails(self, messages: typing.List[Message]) -> None:
+        """
+        Send digest emails built by flush_workspace, once its transaction is
+        committed. Events are already consumed: a failing email is logged and
+        next ones are still sent.
+        :param messages: digest emails to send
+        """
+        email_sender = self._get_email_sender()
+        for message in messages:
+            try:
+                send_email_through(
+                    self._config,
+                    email_sender.send_mail,
+                    message,
+                )
+            except Exception as exc:
+                logger.error(
+                    self,
+                    'Unable to send digest email to {}: {}'.format(
+                        message['To'],
+                        str(exc),
+                    )
+                )
+                logger.exception(self, exc)
+
+    def _get_smtp_config(self) -> SmtpConfiguration:
+        return SmtpConfiguration(
+            self._config.EMAIL_NOTIFICATION_SMTP_SERVER,
+            self._config.EMAIL_NOTIFICATION_SMTP_PORT,
+            self._config.EMAIL_NOTIFICATION_SMTP_USER,
+            self._config.EMAIL_NOTIFICATION_SMTP_PASSWORD
+        )
+
+    def _get_email_sender(self) -> EmailSender:
+        return EmailSender(
+            self._config,
+            self._get_smtp_config(),
+            self._config.EMAIL_NOTIFICATION_ACTIVATED
+        )
@@ -0,0 +1,236 @@
+# -*- coding: utf-8 -*-
+import threading
+import typing
+
+import transaction
+from rq import Queue
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from sqlalchemy.orm import sessionmaker
+
+from tracim_backend.config import CFG
+from tracim_backend.lib.mail_notifier.utils import SmtpConfiguration
+from tracim_backend.lib.utils.logger import logger
+from tracim_backend.lib.utils.utils import get_redis_connection
+from tracim_backend.lib.utils.utils import get_rq_queue
+from tracim_backend.models.setup_models import get_engine
+from tracim_backend.models.setup_models import get_session_factory
+from tracim_backend.models.setup_models import get_tm_session
+
+CONTENT_NOTIFICATION_QUEUE_NAME = 'content_notification'
+# INFO - G.M - 2019-04-08 - key of session.info where content update events
+# are stored until session transaction is committed.
+PENDING_CONTENT_NOTIFICATIONS_KEY = 'tracim_pending_content_notifications'
+# INFO - G.M - 2019-04-08 - redis key set while a notification job of a
+# content updated by an user is waiting in queue: other updates of this
+# content by this user are notified by this job. Key expire to not block
+# notifications if job is lost.
+PENDING_CONTENT_NOTIFICATION_JOB_KEY = 'tracim:content_notification:pending:{actor_id}:{content_id}'  # nopep8
+PENDING_CONTENT_NOTIFICATION_JOB_TTL = 3600
+
+ContentUpdateEvent = typing.Tuple[int, int]
+
+# INFO - G.M - 2019-04-08 - session factories of jobs, one per database,
+# live as long as worker process so jobs share connection pool of engine.
+_session_factories = {}  # type: typing.Dict[str, sessionmaker]
+_session_factories_lock = threading.Lock()
+
+
+def get_job_session_factory(config: CFG) -> sessionmaker:
+    """
+    Get session factory of jobs run by current process, create it (and its
+    engine) on first call.
+    """
+    with _session_factories_lock:
+        session_factory = _session_factories.get(config.SQLALCHEMY_URL)
+        if not session_factory:
+            session_factory = get_session_factory(
+                get_engine({'sqlalchemy.url': config.SQLALCHEMY_URL})
+            )
+            _session_factories[config.SQLALCHEMY_URL] = session_factory
+    return session_factory
+
+
+def dispose_job_engines() -> None:
+    """
+    Close database connections of all session factories of jobs of process.
+    """
+    with _session_factories_lock:
+        session_factories = list(_session_factories.values())
+        _session_factories.clear()
+    for session_factory in session_factories:
+        session_factory.kw['bind'].dispose()
+
+
+def get_pending_job_key(event_actor_id: int, event_content_id: int) -> str:
+    return PENDING_CONTENT_NOTIFICATION_JOB_KEY.format(
+        actor_id=event_actor_id,
+        content_id=event_content_id,
+    )
+
+
+def notify_content_update(
+        config: CFG,
+        event_actor_id: int,
+        event_content_id: int,
+) -> None:
+    """
+    Content notification job, run by mail_notifier daemon: find users to
+    notify about content update, build their emails and send them through
+    mail sender. Email show current state of content, which include all
+    updates done since job was enqueued.
+    :param config: tracim config
+    :param event_actor_id: id of the user that has triggered the event
+    :param event_content_id: id of updated content
+    """
+    # INFO - G.M - 2019-04-08 - import here to avoid circular import
+    from tracim_backend.lib.mail_notifier.notifier import EmailManager
+    logger.info(
+        notify_content_update,
+        'Notify update of content {} by user {}'.format(
+            event_content_id,
+            event_actor_id,
+        )
+    )
+    # INFO - G.M - 2019-04-08 - release pending key before reading content:
+    # updates committed from now are notified by a new job.
+    get_redis_connection(config).delete(
+        get_pending_job_key(event_actor_id, event_content_id)
+    )
+    smtp_config = SmtpConfiguration(
+        config.EMAIL_NOTIFICATION_SMTP_SERVER,
+        config.EMAIL_NOTIFICATION_SMTP_PORT,
+        config.EMAIL_NOTIFICATION_SMTP_USER,
+        config.EMAIL_NOTIFICATION_SMTP_PASSWORD
+    )
+    with transaction.manager:
+        session = get_tm_session(
+            get_job_session_factory(config),
+            transaction.manager,
+        )
+        EmailManager(
+            smtp_config,
+            config,
+            session,
+        ).notify_content_update(event_actor_id, event_content_id)
+
+
+class ContentNotificationQueue(object):
+    """
+    Queue of content notification jobs, one lightweight job per content
+    update event. Jobs are stored in redis and run by mail_notifier daemon.
+    Events of a content updated by an user while a job of this content and
+    user is waiting in queue are collapsed into this job.
+    """
+
+    def __init__(self, config: CFG) -> None:
+        self._config = config
+        self._queue = None
+
+    @property
+    def queue(self) -> Queue:
+        if not self._queue:
+            self._queue = get_rq_queue(
+                get_redis_connection(self._config),
+                CONTENT_NOTIFICATION_QUEUE_NAME,
+            )
+        return self._queue
+
+    def enqueue(
+            self,
+            event_actor_id: int,
+            event_content_id: int,
+    ) -> None:
+        """
+        Enqueue notification job of a content update event, unless a job of
+        same content and user is already waiting.
+        :param event_actor_id: id of the user that has triggered the event
+        :param event_content_id: id of updated content
+        """
+        is_first_pending_event = self.queue.connection.set(
+            get_pending_job_key(event_actor_id, event_content_id),
+            1,
+            nx=True,
+            ex=PENDING_CONTENT_NOTIFICATION_JOB_TTL,
+        )
+        if not is_first_pending_event:
+            logger.info(
+                self,
+                'notification of content {} update already enqueued'.format(
+                    event_content_id
+                )
+            )
+            return
+        logger.info(
+            self,
+            'enqueue notification of content {} update'.format(
+                event_content_id
+            )
+        )
+        self.queue.enqueue_call(
+            notify_content_update,
+            args=(
+                self._config,
+                event_actor_id,
+                event_content_id,
+            ),
+            # INFO - G.M - 2019-04-08 - job has no result, drop it once done.
+            result_ttl=0,
+        )
+
+    def enqueue_after_commit(
+            self,
+            session: Session,
+            event_actor_id: int,
+            event_content_id: int,
+    ) -> None:
+        """
+        Enqueue notification job once session transaction is committed:
+        daemon must not see (or miss) an update which is not in database yet.
+        Events of a rollbacked transaction are dropped.
+        :param session: session where content update is done
+        :param event_actor_id: id of the user that has triggered the event
+        :param event_content_id: id of updated content
+        """
+        pending_events = session.info.get(PENDING_CONTENT_NOTIFICATIONS_KEY)
+        if pending_events is None:
+            pending_events = []
+            session.info[PENDING_CONTENT_NOTIFICATIONS_KEY] = pending_events
+            event.listen(session, 'after_commit', self._enqueue_pending_events)  # nopep8
+            event.listen(session, 'after_rollback', self._drop_pending_events)  # nopep8
+        if (event_actor_id, event_content_id) not in pending_events:
+            pending_events.append((event_actor_id, event_content_id))
+
+    def _pop_pending_events(
+            self,
+            session: Session,
+    ) -> typing.List[ContentUpdateEvent]:
+        pending_events = session.info.get(PENDING_CONTENT_NOTIFICATIONS_KEY, [])  # nopep8
+        session.info[PENDING_CONTENT_NOTIFICATIONS_KEY] = []
+        return pending_events
+
+    def _enqueue_pending_events(self, session: Session) -> None:
+        for event_actor_id, event_content_id \
+                in self._pop_pending_events(session):
+            try:
+                self.enqueue(event_actor_id, event_content_id)
+            except Exception as exc:
+                # INFO - G.M - 2019-04-08 - transaction is already committed,
+                # failing here would only hide other events.
+                logger.error(
+                    self,
+                    'Unable to enqueue notification of content {}: {}'.format(
+                        event_content_id,
+                        str(exc),
+                    )
+                )
+                logger.exception(self, exc)
+
+    def _drop_pending_events(self, session: Session) -> None:
+        pending_events = self._pop_pending_events(session)
+        if pending_events:
+            logger.info(
+                self,
+                'Drop {} content notification(s) of rollbacked '
+                'transaction'.format(len(pending_events))
+            )
@@ -2,27 +2,32 @@
 import datetime
 import logging
 import typing
+from collections import OrderedDict
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 from email.utils import formataddr
 from smtplib import SMTPRecipientsRefused
 
 from lxml.html.diff import htmldiff
-from mako.template import Template
 from sqlalchemy.orm import Session
 
 from tracim_backend.app_models.contents import content_type_list
 from tracim_backend.config import CFG
 from tracim_backend.exceptions import EmptyNotificationError
 from tracim_backend.exceptions import EmailTemplateError
+from tracim_backend.exceptions import WorkspaceNotFound
 from tracim_backend.lib.core.notifications import INotifier
 from tracim_backend.lib.core.workspace import WorkspaceApi
+from tracim_backend.lib.mail_notifier.digest import NotificationDigest
+from tracim_backend.lib.mail_notifier.jobs import ContentNotificationQueue
 from tracim_backend.lib.mail_notifier.sender import EmailSender
 from tracim_backend.lib.mail_notifier.sender import send_email_through
 from tracim_backend.lib.mail_notifier.utils import EST
+from tracim_backend.lib.mail_notifier.utils import EmailTemplateLookup
 from tracim_backend.lib.mail_notifier.utils import SmtpConfiguration
 from tracim_backend.lib.utils.logger import logger
 from tracim_backend.lib.utils.translation import Translator
+from tracim_backend.lib.utils.translation import translator_marker
 from tracim_backend.lib.utils.utils import get_email_logo_frontend_url
 from tracim_backend.lib.utils.utils import get_login_frontend_url
 from tracim_backend.lib.utils.utils import get_reset_password_frontend_url
@@ -31,7 +36,13 @@ from tracim_backend.models.context_models import ContentInContext
 from tracim_backend.models.context_models import WorkspaceInContext
 from tracim_backend.models.data import ActionDescription
 from tracim_backend.models.data import Content
+from tracim_backend.models.data import NotificationDigestEvent
 from tracim_backend.models.data import UserRoleInWorkspace
+from tracim_backend.models.data import Workspace
+
+# INFO - G.M - 2019-04-10 - marker replaced in content update body by
+# recipient intro rendered with recipient template.
+CONTENT_UPDATE_RECIPIENT_INTRO_PLACEHOLDER = '<!-- tracim-recipient-intro -->'  # nopep8
 
 
 class EmailNotifier(INotifier):
@@ -118,11 +129,25 @@ class EmailNotifier(INotifier):
         # (SQLA objects are related to a given thread/session)
         #
         try:
-            if self.config.EMAIL_NOTIFICATION_PROCESSING_MODE.lower() == self.config.CST.ASYNC.lower():
+            if self.config.EMAIL_NOTIFICATION_DIGEST_ACTIVATED:
+                logger.info(self, 'Store event for digest email')
+                # INFO - G.M - 2019-04-11 - event is committed with content
+                # update, notification_digest daemon will notify it later
+                # with other updates of the workspace.
+                NotificationDigest(self.config, self.session).add_event(
+                    self._user.user_id,
+                    content,
+                )
+            elif self.config.EMAIL_NOTIFICATION_PROCESSING_MODE.lower() == self.config.CST.ASYNC.lower():
                 logger.info(self, 'Sending email in ASYNC mode')
-                # TODO - D.A - 2014-11-06
-                # This feature must be implemented in order to be able to scale to large communities
-                raise NotImplementedError('Sending emails through ASYNC mode is not working yet')
+                # INFO - G.M - 2019-04-08 - only enqueue event here,
+                # recipients are found and emails built by mail_notifier
+                # daemon, once content update is committed.
+                ContentNotificationQueue(self.config).enqueue_after_commit(
+                    self.session,
+                    self._user.user_id,
+                    content.content_id,
+                )
             else:
                 logger.info(self, 'Sending email in SYNC mode')
                 EmailManager(
@@ -142,6 +167,14 @@ class EmailManager(object):
     This class will build Email and send it for both created account and content
     update
     """
+    # INFO - G.M - 2019-04-11 - label of content update actions in digest
+    DIGEST_ACTION_LABELS = {
+        ActionDescription.COMMENT: translator_marker('commented'),
+        ActionDescription.CREATION: translator_marker('created'),
+        ActionDescription.EDITION: translator_marker('modified'),
+        ActionDescription.REVISION: translator_marker('modified'),
+        ActionDescription.STATUS_UPDATE: translator_marker('status changed'),
+    }
 
     def __init__(
             self,
@@ -277,25 +310,27 @@ class EmailManager(object):
             self._smtp_config,
             self.config.EMAIL_NOTIFICATION_ACTIVATED
         )
-        for role in notifiable_roles:
-            logger.info(self,
-                        'Generating content {} notification email to {}'.format(
-                            content.content_id,
-                            role.user.email
-                        )
-            )
-            translator = Translator(app_config=self.config, default_lang=role.user.lang)  # nopep8
-            _ = translator.get_translation
-            to_addr = formataddr((role.user.display_name, role.user.email))
-            # INFO - G.M - 2017-11-15 - set content_id in header to permit reply
-            # references can have multiple values, but only one in this case.
-            replyto_addr = self.config.EMAIL_NOTIFICATION_REPLY_TO_EMAIL.replace( # nopep8
-                '{content_id}', str(main_content.content_id)
-            )
+        # INFO - G.M - 2017-11-15 - set content_id in header to permit reply
+        # references can have multiple values, but only one in this case.
+        replyto_addr = self.config.EMAIL_NOTIFICATION_REPLY_TO_EMAIL.replace( # nopep8
+            '{content_id}', str(main_content.content_id)
+        )
 
-            reference_addr = self.config.EMAIL_NOTIFICATION_REFERENCES_EMAIL.replace( #nopep8
-                '{content_id}',str(main_content.content_id)
-             )
+        reference_addr = self.config.EMAIL_NOTIFICATION_REFERENCES_EMAIL.replace( #nopep8
+            '{content_id}',str(main_content.content_id)
+         )
+        sender = self._get_sender(user)
+        content_in_context = content_api.get_content_in_context(content)
+        parent_in_context = None
+        if content.parent_id:
+            parent_in_context = content_api.get_content_in_context(content.parent) # nopep8
+
+        # INFO - G.M - 2019-04-10 - everything but recipient is the same for
+        # recipients using same lang: translate subject and build body
+        # context (including revision diff) once per lang.
+        for lang, lang_roles in self._group_roles_by_lang(notifiable_roles).items():  # nopep8
+            translator = Translator(app_config=self.config, default_lang=lang)  # nopep8
+            _ = translator.get_translation
             #
             #  INFO - D.A. - 2014-11-06
             # We do not use .format() here because the subject defined in the .ini file
@@ -311,52 +346,165 @@ class EmailManager(object):
             reply_to_label = _('{username} & all members of {workspace}').format(  # nopep8
                 username=user.display_name,
                 workspace=main_content.workspace.label)
-
-            message = MIMEMultipart('alternative')
-            message['Subject'] = subject
-            message['From'] = self._get_sender(user)
-            message['To'] = to_addr
-            message['Reply-to'] = formataddr((reply_to_label, replyto_addr))
-            # INFO - G.M - 2017-11-15
-            # References can theorically have label, but in pratice, references
-            # contains only message_id from parents post in thread.
-            # To link this email to a content we create a virtual parent
-            # in reference who contain the content_id.
-            message['References'] = formataddr(('', reference_addr))
-            content_in_context = content_api.get_content_in_context(content)
-            parent_in_context = None
-            if content.parent_id:
-                parent_in_context = content_api.get_content_in_context(content.parent) # nopep8
-
-            body_html = self._build_email_body_for_content(
-                self.config.EMAIL_NOTIFICATION_CONTENT_UPDATE_TEMPLATE_HTML,
-                role,
+            shared_context = self._build_shared_context_for_content_update(
                 content_in_context,
                 parent_in_context,
                 workpace_in_context,
                 user,
                 translator,
             )
-
-            part2 = MIMEText(body_html, 'html', 'utf-8')
-            # Attach parts into message container.
-            # According to RFC 2046, the last part of a multipart message, in this case
-            # the HTML message, is best and preferred.
-            message.attach(part2)
-
-            self.log_email_notification(
-                msg='an email was created to {}'.format(message['To']),
-                action='{:8s}'.format('CREATED'),
-                email_recipient=message['To'],
-                email_subject=message['Subject'],
-                config=self.config,
+            # INFO - G.M - 2019-04-10 - body is rendered once per lang, only
+            # recipient intro (greeting and role) is rendered per recipient.
+            shared_body_html = self._build_email_body_for_content(
+                self.config.EMAIL_NOTIFICATION_CONTENT_UPDATE_TEMPLATE_HTML,
+                main_content.workspace,
+                shared_context,
+                translator,
             )
 
-            send_email_through(
-                self.config,
-                email_sender.send_mail,
-                message
+            for role in lang_roles:
+                logger.info(self,
+                            'Generating content {} notification email to {}'.format(
+                                content.content_id,
+                                role.user.email
+                            )
+                )
+                to_addr = formataddr((role.user.display_name, role.user.email))
+                message = MIMEMultipart('alternative')
+                message['Subject'] = subject
+                message['From'] = sender
+                message['To'] = to_addr
+                message['Reply-to'] = formataddr((reply_to_label, replyto_addr))
+                # INFO - G.M - 2017-11-15
+                # References can theorically have label, but in pratice, references
+                # contains only message_id from parents post in thread.
+                # To link this email to a content we create a virtual parent
+                # in reference who contain the content_id.
+                message['References'] = formataddr(('', reference_addr))
+
+                body_html = shared_body_html.replace(
+                    CONTENT_UPDATE_RECIPIENT_INTRO_PLACEHOLDER,
+                    self._build_email_recipient_intro_for_content(
+                        self.config.EMAIL_NOTIFICATION_CONTENT_UPDATE_RECIPIENT_TEMPLATE_HTML,  # nopep8
+                        role,
+                        translator,
+                    ),
+                )
+
+                part2 = MIMEText(body_html, 'html', 'utf-8')
+                # Attach parts into message container.
+                # According to RFC 2046, the last part of a multipart message, in this case
+                # the HTML message, is best and preferred.
+                message.attach(part2)
+
+                self.log_email_notification(
+                    msg='an email was created to {}'.format(message['To']),
+                    action='{:8s}'.format('CREATED'),
+                    email_recipient=message['To'],
+                    email_subject=message['Subject'],
+                    config=self.config,
+                )
+
+                send_email_through(
+                    self.config,
+                    email_sender.send_mail,
+                    message,
+                    session=self.session,
+                )
+
+    def build_content_digest_messages(
+            self,
+            workspace_id: int,
+            events: typing.List[NotificationDigestEvent],
+    ) -> typing.List[MIMEMultipart]:
+        """
+        Build for each user to be notified in workspace one email summarizing
+        all contents updated by given events. Contents only updated by
+        recipient are not included, recipient without any other updated
+        content get no email.
+        Emails are only built, not sent: see NotificationDigest.flush_workspace
+        :param workspace_id: id of workspace of events
+        :param events: content update events of workspace, oldest first
+        :return: digest emails, one per recipient
+        """
+        workspace_api = WorkspaceApi(
+            session=self.session,
+            current_user=None,
+            config=self.config,
+        )
+        try:
+            workspace = workspace_api.get_one(workspace_id)
+        except WorkspaceNotFound:
+            logger.info(self, 'Skipping digest of deleted workspace {}'.format(workspace_id))  # nopep8
+            return []
+        notifiable_roles = workspace_api.get_notifiable_roles(workspace)
+        if len(notifiable_roles) <= 0:
+            logger.info(self, 'Skipping digest as nobody subscribed to in workspace {}'.format(workspace.label))  # nopep8
+            return []
+
+        # INFO - G.M - 2019-04-11 - summarize contents in order of their first
+        # update, loading all contents and actors at once.
+        events_by_content_id = OrderedDict()  # type: typing.Dict[int, typing.List[NotificationDigestEvent]]  # nopep8
+        for event in events:
+            events_by_content_id.setdefault(event.content_id, []).append(event)
+        contents = self.session.query(Content) \
+            .filter(Content.id.in_(list(events_by_content_id.keys()))) \
+            .all()
+        contents_by_id = {content.content_id: content for content in contents}
+        actors = self.session.query(User) \
+            .filter(User.user_id.in_({event.actor_id for event in events})) \
+            .all()
+        actors_by_id = {actor.user_id: actor for actor in actors}
+
+        messages = []
+        sender = self._get_sender()
+        workspace_in_context = workspace_api.get_workspace_with_context(workspace)  # nopep8
+        logo_url = get_email_logo_frontend_url(self.config)
+        for lang, lang_roles in self._group_roles_by_lang(notifiable_roles).items():  # nopep8
+            translator = Translator(app_config=self.config, default_lang=lang)  # nopep8
+            content_summaries = self._build_content_summaries_for_digest(
+                events_by_content_id,
+                contents_by_id,
+                actors_by_id,
+                translator,
             )
+            translated_subject = translator.get_translation(self.config.EMAIL_NOTIFICATION_DIGEST_SUBJECT)  # nopep8
+            subject = translated_subject.replace(EST.WEBSITE_TITLE, str(self.config.WEBSITE_TITLE))  # nopep8
+            subject = subject.replace(EST.WORKSPACE_LABEL, str(workspace.label))  # nopep8
+            for role in lang_roles:
+                user_summaries = [
+                    summary for summary in content_summaries
+                    if summary['actor_ids'] != {role.user.user_id}
+                ]
+                if not user_summaries:
+                    continue
+                message = MIMEMultipart('alternative')
+                message['Subject'] = subject.replace(EST.CONTENT_COUNT, str(len(user_summaries)))  # nopep8
+                message['From'] = sender
+                message['To'] = formataddr((role.user.display_name, role.user.email))  # nopep8
+                body_html = self._render_template(
+                    mako_template_filepath=self.config.EMAIL_NOTIFICATION_DIGEST_TEMPLATE_HTML,  # nopep8
+                    context={
+                        'user': role.user,
+                        'workspace': workspace,
+                        'role_label': role.role_as_label(),
+                        'workspace_url': workspace_in_context.frontend_url,
+                        'content_summaries': user_summaries,
+                        'logo_url': logo_url,
+                    },
+                    translator=translator,
+                )
+                message.attach(MIMEText(body_html, 'html', 'utf-8'))
+
+                self.log_email_notification(
+                    msg='a digest email was created to {}'.format(message['To']),  # nopep8
+                    action='{:8s}'.format('CREATED'),
+                    email_recipient=message['To'],
+                    email_subject=message['Subject'],
+                    config=self.config,
+                )
+                messages.append(message)
+        return messages
 
     def notify_created_account(
             self,
@@ -417,7 +565,8 @@ class EmailManager(object):
         send_email_through(
             config=self.config,
             sendmail_callable=email_sender.send_mail,
-            message=message
+            message=message,
+            session=self.session,
         )
 
     def notify_reset_password(
@@ -481,7 +630,8 @@ class EmailManager(object):
         send_email_through(
             config=self.config,
             sendmail_callable=email_sender.send_mail,
-            message=message
+            message=message,
+            session=self.session,
         )
 
     def _render_template(
@@ -498,7 +648,10 @@ class EmailManager(object):
         :return: template rendered string
         """
         try:
-            template = Template(filename=mako_template_filepath)
+            template = EmailTemplateLookup.get_template(
+                mako_template_filepath,
+                module_directory=self.config.EMAIL_TEMPLATE_MODULE_DIR,
+            )
             return template.render(
                 _=translator.get_translation,
                 config=self.config,
@@ -508,29 +661,41 @@ class EmailManager(object):
             logger.exception(self, 'Failed to render email template: {}'.format(exc.__str__()))
             raise EmailTemplateError('Failed to render email template: {}'.format(exc.__str__()))
 
-    def _build_context_for_content_update(
+    def _group_roles_by_lang(
+            self,
+            roles: typing.List[UserRoleInWorkspace],
+    ) -> typing.Dict[str, typing.List[UserRoleInWorkspace]]:
+        """
+        Group roles by lang of their user, keeping roles order.
+        """
+        roles_by_lang = OrderedDict()  # type: typing.Dict[str, typing.List[UserRoleInWorkspace]]  # nopep8
+        for role in roles:
+            lang = role.user.lang or self.config.DEFAULT_LANG
+            roles_by_lang.setdefault(lang, []).append(role)
+        return roles_by_lang
+
+    def _build_shared_context_for_content_update(
             self,
-            role: UserRoleInWorkspace,
             content_in_context: ContentInContext,
             parent_in_context: typing.Optional[ContentInContext],
             workspace_in_context: WorkspaceInContext,
             actor: User,
             translator: Translator
-    ):
-
+    ) -> typing.Dict[str, typing.Any]:
+        """
+        Build email template context of content update, shared by all
+        recipients using translator lang.
+        """
         _ = translator.get_translation
         content = content_in_context.content
         action = content.get_last_action().id
 
         # default values
-        user = role.user
-        workspace = role.workspace
         workspace_url = workspace_in_context.frontend_url
         main_title = content.label
         status_label = content.get_status().label
         # TODO - G.M - 11-06-2018 - [emailTemplateURL] correct value for status_icon_url  # nopep8
         status_icon_url = ''
-        role_label = role.role_as_label()
         content_intro = '<span id="content-intro-username">{}</span> did something.'.format(actor.display_name)  # nopep8
         content_text = content.description
         call_to_action_url = content_in_context.frontend_url
@@ -599,71 +764,133 @@ class EmailManager(object):
         #     raise EmptyNotificationError('Unexpected empty notification')
 
         # FIXME: remove/readapt assert to debug easily broken case
-        assert user
-        assert workspace
         assert main_title
         assert status_label
         # assert status_icon_url
-        assert role_label
         # assert content_intro
         assert content_text or content_text == content.description
         assert call_to_action_url
         assert logo_url
 
         return {
-            'user': role.user,
-            'workspace': role.workspace,
             'workspace_url': workspace_url,
             'main_title': main_title,
             'status_label': status_label,
             'status_icon_url': status_icon_url,
-            'role_label': role_label,
             'content_intro': content_intro,
             'content_text': content_text,
             'call_to_action_url': call_to_action_url,
             'logo_url': logo_url,
         }
 
+    def _build_content_summaries_for_digest(
+            self,
+            events_by_content_id: typing.Dict[int, typing.List[NotificationDigestEvent]],  # nopep8
+            contents_by_id: typing.Dict[int, Content],
+            actors_by_id: typing.Dict[int, User],
+            translator: Translator,
+    ) -> typing.List[typing.Dict[str, typing.Any]]:
+        """
+        Build digest summary of each updated content, shared by all recipients
+        using translator lang. Deleted contents are not summarized.
+        """
+        # INFO - G.M - 2019-04-11 - Dirty import, to avoid circular import
+        from tracim_backend.lib.core.content import ContentApi
+        _ = translator.get_translation
+        content_api = ContentApi(
+            session=self.session,
+            current_user=None,
+            config=self.config,
+        )
+        summaries = []
+        for content_id, content_events in events_by_content_id.items():
+            content = contents_by_id.get(content_id)
+            if not content or content.is_deleted:
+                continue
+            actions = []
+            authors = []
+            actor_ids = set()
+            for event in content_events:
+                action_label = _(self.DIGEST_ACTION_LABELS.get(event.action, self.DIGEST_ACTION_LABELS[ActionDescription.EDITION]))  # nopep8
+                if action_label not in actions:
+                    actions.append(action_label)
+                actor = actors_by_id.get(event.actor_id)
+                if actor and actor.display_name not in authors:
+                    authors.append(actor.display_name)
+                actor_ids.add(event.actor_id)
+            summaries.append({
+                'content_id': content_id,
+                'label': content.label,
+                'url': content_api.get_content_in_context(content).frontend_url,  # nopep8
+                'status_label': _(content.get_status().label),
+                'actions': actions,
+                'authors': authors,
+                'actor_ids': actor_ids,
+                'events_count': len(content_events),
+            })
+        return summaries
+
     def _build_email_body_for_content(
             self,
             mako_template_filepath: str,
-            role: UserRoleInWorkspace,
-            content_in_context: ContentInContext,
-            parent_in_context: typing.Optional[ContentInContext],
-            workspace_in_context: WorkspaceInContext,
-            actor: User,
+            workspace: Workspace,
+            shared_context: typing.Dict[str, typing.Any],
             translator: Translator
     ) -> str:
         """
-        Build an email body and return it as a string
+        Build an email body shared by all recipients using translator lang and
+        return it as a string. Recipient intro is left as a placeholder, see
+        _build_email_recipient_intro_for_content.
         :param mako_template_filepath: the absolute path to the mako template
         to be used for email body building
-        :param role: the role related to user to whom the email must be sent.
-        The role is required (and not the user only) in order to show in the
-         mail why the user receive the notification
-        :param content_in_context: the content item related to the notification
-        :param parent_in_context: parent of the content item related to the
-        notification
-        :param actor: the user at the origin of the action / notification
-        (for example the one who wrote a comment
+        :param workspace: workspace of notified content
+        :param shared_context: template context shared by all recipients
+        using translator lang, see _build_shared_context_for_content_update
         :return: the built email body as string. In case of multipart email,
          this method must be called one time for text and one time for html
         """
         logger.debug(self, 'Building email content from MAKO template {}'.format(mako_template_filepath))  # nopep8
-        context = self._build_context_for_content_update(
-            role=role,
-            content_in_context=content_in_context,
-            parent_in_context=parent_in_context,
-            workspace_in_context=workspace_in_context,
-            actor=actor,
-            translator=translator
+        context = dict(
+            shared_context,
+            workspace=workspace,
+            recipient_intro=CONTENT_UPDATE_RECIPIENT_INTRO_PLACEHOLDER,
         )
-        body_content = self._render_template(
+        return self._render_template(
             mako_template_filepath=mako_template_filepath,
             context=context,
             translator=translator,
         )
-        return body_content
+
+    def _build_email_recipient_intro_for_content(
+            self,
+            mako_template_filepath: str,
+            role: UserRoleInWorkspace,
+            translator: Translator
+    ) -> str:
+        """
+        Build the part of email body specific to a recipient (greeting and
+        role explanation) and return it as a string
+        :param mako_template_filepath: the absolute path to the mako template
+        to be used for recipient intro building
+        :param role: the role related to user to whom the email must be sent.
+        The role is required (and not the user only) in order to show in the
+         mail why the user receive the notification
+        :return: the built recipient intro as string
+        """
+        role_label = role.role_as_label()
+        # FIXME: remove/readapt assert to debug easily broken case
+        assert role.user
+        assert role.workspace
+        assert role_label
+        return self._render_template(
+            mako_template_filepath=mako_template_filepath,
+            context={
+                'user': role.user,
+                'workspace': role.workspace,
+                'role_label': role_label,
+            },
+            translator=translator,
+        )
 
 
 def get_email_manager(config: CFG, session: Session):
@@ -0,0 +1,214 @@
+# -*- coding: utf-8 -*-
+import datetime
+import email
+import typing
+from collections import namedtuple
+from email.message import Message
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from tracim_backend.config import CFG
+from tracim_backend.lib.mail_notifier.sender import EmailSender
+from tracim_backend.lib.mail_notifier.utils import SmtpConfiguration
+from tracim_backend.lib.utils.logger import logger
+from tracim_backend.models.data import EmailOutboxMessage
+
+# INFO - G.M - 2019-04-12 - pending: messages to be sent, retrying: pending
+# messages whose sending has already failed, failed: messages relay gave up,
+# oldest_pending_age: age in seconds of oldest pending message.
+EmailOutboxMetrics = namedtuple(
+    'EmailOutboxMetrics',
+    ['pending', 'retrying', 'failed', 'oldest_pending_age'],
+)
+# INFO - G.M - 2019-04-12 - sent/failed: number of messages of relayed batch,
+# latencies: delay in seconds between storage and sending of each sent message
+EmailOutboxRelayResult = namedtuple(
+    'EmailOutboxRelayResult',
+    ['sent', 'failed', 'latencies'],
+)
+
+
+class EmailOutbox(object):
+    """
+    Database outbox of emails: in outbox processing mode, emails are stored
+    in the same transaction as the change they notify, then relayed by batch
+    by email_outbox_relay daemon. Failed sendings are retried with
+    exponential backoff.
+    """
+
+    def __init__(self, config: CFG, session: Session) -> None:
+        self._config = config
+        self._session = session
+
+    def add(self, message: Message) -> EmailOutboxMessage:
+        """
+        Store message in outbox (in current transaction).
+        :param message: message to send
+        """
+        outbox_message = EmailOutboxMessage(
+            recipient=str(message['To'] or ''),
+            subject=str(message['Subject'] or ''),
+            message=message.as_string(),
+        )
+        self._session.add(outbox_message)
+        return outbox_message
+
+    def _support_skip_locked(self) -> bool:
+        """
+        Whether database server support SELECT ... FOR UPDATE SKIP LOCKED:
+        postgresql, mysql >= 8 and mariadb >= 10.6.
+        """
+        dialect = self._session.get_bind().dialect
+        if dialect.name == 'postgresql':
+            return True
+        if dialect.name == 'mysql':
+            version = tuple(dialect.server_version_info or ())
+            if 'MariaDB' in version:
+                # INFO - G.M - 2019-04-12 - version of mariadb is given
+                # before 'MariaDB' item, see sqlalchemy mysql dialect.
+                index = version.index('MariaDB')
+                return version[index - 3:index] >= (10, 6)
+            return version >= (8,)
+        return False
+
+    def get_due_messages(
+            self,
+            now: datetime.datetime=None,
+    ) -> typing.List[EmailOutboxMessage]:
+        """
+        Get next batch of messages to send, oldest first. Messages are locked
+        until end of transaction. Where database server support it, locked
+        messages are skipped so many relays can drain outbox at the same
+        time, else relays wait for each other.
+        :param now: reference datetime (utc), default to current datetime
+        """
+        now = now or datetime.datetime.utcnow()
+        return self._session.query(EmailOutboxMessage) \
+            .filter(EmailOutboxMessage.next_attempt <= now) \
+            .order_by(
+                EmailOutboxMessage.next_attempt,
+                EmailOutboxMessage.message_id,
+            ) \
+            .limit(self._config.EMAIL_OUTBOX_BATCH_SIZE) \
+            .with_for_update(skip_locked=self._support_skip_locked()) \
+            .all()
+
+    def get_retry_delay(self, attempts: int) -> datetime.timedelta:
+        """
+        Delay before next attempt of a message after given number of failed
+        attempts: retry delay, doubled on each attempt up to max retry delay.
+        """
+        delay = self._config.EMAIL_OUTBOX_RETRY_DELAY * 2 ** (attempts - 1)
+        return datetime.timedelta(
+            seconds=min(delay, self._config.EMAIL_OUTBOX_MAX_RETRY_DELAY)
+        )
+
+    def relay(
+            self,
+            sendmail_callable: typing.Callable[[Message], None]=None,
+            now: datetime.datetime=None,
+    ) -> EmailOutboxRelayResult:
+        """
+        Send next batch of messages: sent messages are deleted, failed ones
+        are scheduled for a new attempt, or given up after max attempts.
+        Transaction should be committed once done.
+        :param sendmail_callable: callable sending message, raising on
+        failure. Default to sending through configured SMTP server.
+        :param now: reference datetime (utc), default to current datetime
+        """
+        if not sendmail_callable:
+            sendmail_callable = self._send_mail
+        now = now or datetime.datetime.utcnow()
+        sent = 0
+        failed = 0
+        latencies = []
+        for outbox_message in self.get_due_messages(now):
+            try:
+                sendmail_callable(
+                    email.message_from_string(outbox_message.message)
+                )
+            except Exception as exc:
+                failed += 1
+                self._reschedule(outbox_message, exc, now)
+                continue
+            sent += 1
+            latencies.append((now - outbox_message.created).total_seconds())
+            self._session.delete(outbox_message)
+        self._session.flush()
+        return EmailOutboxRelayResult(sent, failed, latencies)
+
+    def _reschedule(
+            self,
+            outbox_message: EmailOutboxMessage,
+            exc: Exception,
+            now: datetime.datetime,
+    ) -> None:
+        outbox_message.attempts += 1
+        outbox_message.last_error = str(exc)
+        if outbox_message.attempts >= self._config.EMAIL_OUTBOX_MAX_ATTEMPTS:
+            outbox_message.next_attempt = None
+            logger.error(
+                self,
+                'Give up sending email {} to {} after {} attempts: {}'.format(
+                    outbox_message.message_id,
+                    outbox_message.recipient,
+                    outbox_message.attempts,
+                    str(exc),
+                )
+            )
+            return
+        outbox_message.next_attempt = now + self.get_retry_delay(
+            outbox_message.attempts
+        )
+        logger.warning(
+            self,
+            'Fail to send email {} to {} (attempt {}), next attempt at {}: {}'.format(  # nopep8
+                outbox_message.message_id,
+                outbox_message.recipient,
+                outbox_message.attempts,
+                outbox_message.next_attempt,
+                str(exc),
+            )
+        )
+
+    def _send_mail(self, message: Message) -> None:
+        smtp_config = SmtpConfiguration(
+            self._config.EMAIL_NOTIFICATION_SMTP_SERVER,
+            self._config.EMAIL_NOTIFICATION_SMTP_PORT,
+            self._config.EMAIL_NOTIFICATION_SMTP_USER,
+            self._config.EMAIL_NOTIFICATION_SMTP_PASSWORD
+        )
+        EmailSender(
+            self._config,
+            smtp_config,
+            self._config.EMAIL_NOTIFICATION_ACTIVATED,
+        ).send_mail(message, raise_on_error=True)
+
+    def get_metrics(self, now: datetime.datetime=None) -> EmailOutboxMetrics:
+        """
+        Get outbox queue depth and latency metrics.
+        :param now: reference datetime (utc), default to current datetime
+        """
+        now = now or datetime.datetime.utcnow()
+        pending_filter = EmailOutboxMessage.next_attempt.isnot(None)
+        pending, oldest_created = self._session.query(
+            func.count(EmailOutboxMessage.message_id),
+            func.min(EmailOutboxMessage.created),
+        ).filter(pending_filter).one()
+        retrying = self._session.query(EmailOutboxMessage) \
+            .filter(pending_filter) \
+            .filter(EmailOutboxMessage.attempts > 0) \
+            .count()
+        failed = self._session.query(EmailOutboxMessage) \
+            .filter(EmailOutboxMessage.next_attempt.is_(None)) \
+            .count()
+        oldest_pending_age = 0
+        if oldest_created:
+            oldest_pending_age = (now - oldest_created).total_seconds()
+        return EmailOutboxMetrics(
+            pending=pending,
+            retrying=retrying,
+            failed=failed,
+            oldest_pending_age=oldest_pending_age,
+        )
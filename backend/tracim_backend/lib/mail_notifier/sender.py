@@ -1,11 +1,16 @@
 # -*- coding: utf-8 -*-
 import smtplib
+import threading
+import time
 import traceback
 import typing
 from email.message import Message
 from email.mime.multipart import MIMEMultipart
 
+from sqlalchemy.orm import Session
+
 from tracim_backend.config import CFG
+from tracim_backend.exceptions import NotificationSendingFailed
 from tracim_backend.lib.utils.logger import logger
 from tracim_backend.lib.utils.utils import get_rq_queue
 from tracim_backend.lib.utils.utils import get_redis_connection
@@ -15,15 +20,17 @@ def send_email_through(
         config: CFG,
         sendmail_callable: typing.Callable[[Message], None],
         message: Message,
+        session: Session = None,
 ) -> None:
     """
-    Send mail encapsulation to send it in async or sync mode.
+    Send mail encapsulation to send it in async, sync or outbox mode.
 
     TODO BS 20170126: A global mail/sender management should be a good
                       thing. Actually, this method is an fast solution.
     :param config: system configuration
     :param sendmail_callable: A callable who get message on first parameter
     :param message: The message who have to be sent
+    :param session: session where message is stored in outbox mode
     """
     if config.EMAIL_PROCESSING_MODE == config.CST.SYNC:
         logger.info(
@@ -45,6 +52,24 @@ def send_email_through(
         redis_connection = get_redis_connection(config)
         queue = get_rq_queue(redis_connection, 'mail_sender')
         queue.enqueue(sendmail_callable, message)
+    elif config.EMAIL_PROCESSING_MODE == config.CST.OUTBOX:
+        # INFO - G.M - 2019-04-12 - message is stored in session of the
+        # change it notifies, to be committed or rollbacked with it.
+        if session is None:
+            raise NotificationSendingFailed(
+                'Database session is required to send email through outbox'
+            )
+        logger.info(
+            send_email_through,
+            'send email to {} through outbox: '
+            'mail stored in database in wait for a '
+            'email_outbox_relay daemon'.format(
+                message['To']
+            )
+        )
+        # INFO - G.M - 2019-04-12 - import here to avoid circular import
+        from tracim_backend.lib.mail_notifier.outbox import EmailOutbox
+        EmailOutbox(config, session).add(message)
     else:
         raise NotImplementedError(
             'Mail sender processing mode {} is not implemented'.format(
@@ -53,6 +78,182 @@ def send_email_through(
         )
 
 
+class PooledSmtpConnection(object):
+    """
+    Open SMTP connection kept by SmtpConnectionPool.
+    """
+
+    def __init__(self, connection: smtplib.SMTP) -> None:
+        self.connection = connection
+        self.sent_messages = 0
+        self.last_used = time.time()
+
+
+class SmtpConnectionPool(object):
+    """
+    Pool of open and authenticated SMTP connections, used in async mode by
+    mail_notifier daemon to send many queued messages through the same
+    connection instead of doing connection, STARTTLS and login for each one.
+    """
+
+    def __init__(
+            self,
+            connection_factory: typing.Callable[[], smtplib.SMTP],
+            pool_size: int,
+            max_messages_per_connection: int,
+            health_check_interval: int,
+    ) -> None:
+        """
+        :param connection_factory: callable opening a new connection
+        :param pool_size: max number of idle connections kept open
+        :param max_messages_per_connection: connection is closed once it
+        has sent this number of messages
+        :param health_check_interval: idle time in seconds after which
+        connection is checked (with NOOP) before being reused
+        """
+        self._connection_factory = connection_factory
+        self._pool_size = pool_size
+        self._max_messages_per_connection = max_messages_per_connection
+        self._health_check_interval = health_check_interval
+        self._idle_connections = []  # type: typing.List[PooledSmtpConnection]  # nopep8
+        self._lock = threading.Lock()
+
+    def _open(self) -> PooledSmtpConnection:
+        return PooledSmtpConnection(self._connection_factory())
+
+    def _close(self, pooled_connection: PooledSmtpConnection) -> None:
+        try:
+            pooled_connection.connection.quit()
+        except (smtplib.SMTPException, OSError):
+            pooled_connection.connection.close()
+
+    def _is_healthy(self, pooled_connection: PooledSmtpConnection) -> bool:
+        idle_time = time.time() - pooled_connection.last_used
+        if idle_time < self._health_check_interval:
+            return True
+        try:
+            return pooled_connection.connection.noop()[0] == 250
+        except (smtplib.SMTPException, OSError):
+            return False
+
+    def acquire(self) -> PooledSmtpConnection:
+        """
+        Get a healthy idle connection of pool, or open a new one.
+        """
+        while True:
+            with self._lock:
+                if not self._idle_connections:
+                    break
+                pooled_connection = self._idle_connections.pop()
+            if self._is_healthy(pooled_connection):
+                return pooled_connection
+            logger.info(self, 'Drop broken SMTP connection')
+            self._close(pooled_connection)
+        return self._open()
+
+    def release(
+            self,
+            pooled_connection: PooledSmtpConnection,
+            reusable: bool = True,
+    ) -> None:
+        """
+        Give back connection to pool, it is closed if not reusable, if it
+        has reached its messages limit or if pool is full.
+        """
+        pooled_connection.last_used = time.time()
+        if reusable and pooled_connection.sent_messages < self._max_messages_per_connection:  # nopep8
+            with self._lock:
+                if len(self._idle_connections) < self._pool_size:
+                    self._idle_connections.append(pooled_connection)
+                    return
+        self._close(pooled_connection)
+
+    def send_message(self, message: Message) -> typing.Dict[str, typing.Any]:
+        """
+        Send message through a pooled connection. If connection has been
+        closed by server, message is sent again with a new connection.
+        :return: refused recipients, like smtplib.SMTP.send_message
+        """
+        pooled_connection = self.acquire()
+        try:
+            try:
+                result = pooled_connection.connection.send_message(message)
+            except smtplib.SMTPServerDisconnected:
+                logger.info(self, 'SMTP connection lost, reconnecting')
+                self._close(pooled_connection)
+                pooled_connection = self._open()
+                result = pooled_connection.connection.send_message(message)
+        except (
+            smtplib.SMTPRecipientsRefused,
+            smtplib.SMTPSenderRefused,
+            smtplib.SMTPDataError,
+        ):
+            # INFO - G.M - 2019-04-11 - message refused by server, connection
+            # can still be used for other messages.
+            pooled_connection.sent_messages += 1
+            self.release(pooled_connection)
+            raise
+        except Exception:
+            self.release(pooled_connection, reusable=False)
+            raise
+        pooled_connection.sent_messages += 1
+        self.release(pooled_connection)
+        return result
+
+    def close(self) -> None:
+        """
+        Close all idle connections.
+        """
+        with self._lock:
+            idle_connections = self._idle_connections
+            self._idle_connections = []
+        for pooled_connection in idle_connections:
+            self._close(pooled_connection)
+
+
+# INFO - G.M - 2019-04-11 - SMTP connection pools of process, by smtp server
+# and login.
+_smtp_connection_pools = {}  # type: typing.Dict[typing.Tuple[str, int, str], SmtpConnectionPool]  # nopep8
+_smtp_connection_pools_lock = threading.Lock()
+
+
+def get_smtp_connection_pool(
+        config: CFG,
+        smtp_config: SmtpConfiguration,
+        connection_factory: typing.Callable[[], smtplib.SMTP],
+) -> SmtpConnectionPool:
+    """
+    Get process SMTP connection pool of smtp_config server and login.
+    :param config: tracim config
+    :param smtp_config: SMTP configuration
+    :param connection_factory: callable opening a new connection, used if
+    pool does not exist yet.
+    """
+    key = (smtp_config.server, smtp_config.port, smtp_config.login)
+    with _smtp_connection_pools_lock:
+        pool = _smtp_connection_pools.get(key)
+        if not pool:
+            pool = SmtpConnectionPool(
+                connection_factory,
+                pool_size=config.EMAIL_SENDER_SMTP_POOL_SIZE,
+                max_messages_per_connection=config.EMAIL_SENDER_SMTP_MAX_MESSAGES_PER_CONNECTION,  # nopep8
+                health_check_interval=config.EMAIL_SENDER_SMTP_HEALTH_CHECK_INTERVAL,  # nopep8
+            )
+            _smtp_connection_pools[key] = pool
+    return pool
+
+
+def close_smtp_connection_pools() -> None:
+    """
+    Close connections of all SMTP connection pools of process.
+    """
+    with _smtp_connection_pools_lock:
+        pools = list(_smtp_connection_pools.values())
+        _smtp_connection_pools.clear()
+    for pool in pools:
+        pool.close()
+
+
 class EmailSender(object):
     """
     Independent email sender class.
@@ -74,94 +275,100 @@ class EmailSender(object):
 
     def connect(self):
         if not self._smtp_connection:
-            log = 'Connecting to SMTP server {}'
-            logger.info(self, log.format(self._smtp_config.server))
-            # TODO - G.M - 2019-01-29 - Support for SMTP SSL-only port connection
-            # using smtplib.SMTP_SSL
-            self._smtp_connection = smtplib.SMTP(
-                self._smtp_config.server,
-                self._smtp_config.port
-            )
-            self._smtp_connection.ehlo()
-
-            if self._smtp_config.login:
-                try:
-                    starttls_result = self._smtp_connection.starttls()
-
-                    if starttls_result[0] == 220:
-                        logger.info(self, 'SMTP Start TLS OK')
-
-                    log = 'SMTP Start TLS return code: {} with message: {}'
-                    logger.debug(
-                        self,
-                        log.format(
-                            starttls_result[0],
-                            starttls_result[1].decode('utf-8')
-                        )
+            self._smtp_connection = self.open_smtp_connection()
+
+    def open_smtp_connection(self) -> smtplib.SMTP:
+        """
+        Open a new SMTP connection and authenticate if configured.
+        """
+        log = 'Connecting to SMTP server {}'
+        logger.info(self, log.format(self._smtp_config.server))
+        # TODO - G.M - 2019-01-29 - Support for SMTP SSL-only port connection
+        # using smtplib.SMTP_SSL
+        smtp_connection = smtplib.SMTP(
+            self._smtp_config.server,
+            self._smtp_config.port
+        )
+        smtp_connection.ehlo()
+
+        if self._smtp_config.login:
+            try:
+                starttls_result = smtp_connection.starttls()
+
+                if starttls_result[0] == 220:
+                    logger.info(self, 'SMTP Start TLS OK')
+
+                log = 'SMTP Start TLS return code: {} with message: {}'
+                logger.debug(
+                    self,
+                    log.format(
+                        starttls_result[0],
+                        starttls_result[1].decode('utf-8')
                     )
-                except smtplib.SMTPResponseException as exc:
-                    log = 'SMTP start TLS return error code: {} with message: {}'
-                    logger.error(
-                        self,
-                        log.format(
-                            exc.smtp_code,
-                            exc.smtp_error.decode('utf-8')
-                        )
+                )
+            except smtplib.SMTPResponseException as exc:
+                log = 'SMTP start TLS return error code: {} with message: {}'
+                logger.error(
+                    self,
+                    log.format(
+                        exc.smtp_code,
+                        exc.smtp_error.decode('utf-8')
                     )
-                except Exception as exc:
-                    log = 'Unexpected exception during SMTP start TLS process: {}'
-                    logger.error(self, log.format(exc.__str__()))
-                    logger.error(self, traceback.format_exc())
+                )
+            except Exception as exc:
+                log = 'Unexpected exception during SMTP start TLS process: {}'
+                logger.error(self, log.format(exc.__str__()))
+                logger.error(self, traceback.format_exc())
 
 
-            if self._smtp_config.login:
-                try:
-                    login_res = self._smtp_connection.login(
-                        self._smtp_config.login,
-                        self._smtp_config.password
-                    )
+        if self._smtp_config.login:
+            try:
+                login_res = smtp_connection.login(
+                    self._smtp_config.login,
+                    self._smtp_config.password
+                )
 
-                    if login_res[0] == 235:
-                        logger.info(self, 'SMTP Authentication Successful')
-                    if login_res[0] == 503:
-                        logger.info(self, 'SMTP Already Authenticated')
-
-                    log = 'SMTP login return code: {} with message: {}'
-                    logger.debug(
-                        self,
-                        log.format(
-                            login_res[0],
-                            login_res[1].decode('utf-8')
-                        )
-                    )
-                except smtplib.SMTPAuthenticationError as exc:
-
-                    log = 'SMTP auth return error code: {} with message: {}'
-                    logger.error(
-                        self,
-                        log.format(
-                            exc.smtp_code,
-                            exc.smtp_error.decode('utf-8')
-                        )
+                if login_res[0] == 235:
+                    logger.info(self, 'SMTP Authentication Successful')
+                if login_res[0] == 503:
+                    logger.info(self, 'SMTP Already Authenticated')
+
+                log = 'SMTP login return code: {} with message: {}'
+                logger.debug(
+                    self,
+                    log.format(
+                        login_res[0],
+                        login_res[1].decode('utf-8')
                     )
-                    logger.error(self,
-                                 'check your auth params combinaison '
-                                 '(login/password) for SMTP'
+                )
+            except smtplib.SMTPAuthenticationError as exc:
+
+                log = 'SMTP auth return error code: {} with message: {}'
+                logger.error(
+                    self,
+                    log.format(
+                        exc.smtp_code,
+                        exc.smtp_error.decode('utf-8')
                     )
-                except smtplib.SMTPResponseException as exc:
-                    log = 'SMTP login return error code: {} with message: {}'
-                    logger.error(
-                        self,
-                        log.format(
-                            exc.smtp_code,
-                            exc.smtp_error.decode('utf-8')
-                        )
+                )
+                logger.error(self,
+                             'check your auth params combinaison '
+                             '(login/password) for SMTP'
+                )
+            except smtplib.SMTPResponseException as exc:
+                log = 'SMTP login return error code: {} with message: {}'
+                logger.error(
+                    self,
+                    log.format(
+                        exc.smtp_code,
+                        exc.smtp_error.decode('utf-8')
                     )
-                except Exception as exc:
-                    log = 'Unexpected exception during SMTP login {}'
-                    logger.error(self, log.format(exc.__str__()))
-                    logger.error(self, traceback.format_exc())
-
+                )
+            except Exception as exc:
+                log = 'Unexpected exception during SMTP login {}'
+                logger.error(self, log.format(exc.__str__()))
+                logger.error(self, traceback.format_exc())
+        return smtp_connection
 
     def disconnect(self):
         if self._smtp_connection:
@@ -170,12 +377,31 @@ class EmailSender(object):
             self._smtp_connection.quit()
             logger.info(self, 'Connection closed.')
 
-    def send_mail(self, message: MIMEMultipart):
+    def _use_connection_pool(self) -> bool:
+        # INFO - G.M - 2019-04-11 - in async and outbox mode, messages are
+        # sent by a daemon (mail_notifier or email_outbox_relay), which keeps
+        # connections open between messages.
+        return self.config.EMAIL_PROCESSING_MODE in (
+            self.config.CST.ASYNC,
+            self.config.CST.OUTBOX,
+        )
+
+    def send_mail(self, message: MIMEMultipart, raise_on_error: bool=False):
+        """
+        Send message, sending errors are logged.
+        :param message: message to send
+        :param raise_on_error: if true, sending error is raised once logged,
+        allowing caller to retry
+        """
+        error = None  # type: typing.Optional[Exception]
         if not self._is_active:
             log = 'Not sending email to {} (service disabled)'
             logger.info(self, log.format(message['To']))
         else:
-            self.connect()  # Actually, this connects to SMTP only if required
+            use_connection_pool = not self._smtp_connection \
+                and self._use_connection_pool()
+            if not use_connection_pool:
+                self.connect()  # Actually, this connects to SMTP only if required  # nopep8
             logger.info(self, 'Sending email to {}'.format(message['To']))
             # TODO - G.M - 2019-01-29 - optimisize this code, we should not send
             # email if connection has failed.
@@ -183,7 +409,14 @@ class EmailSender(object):
             failed_action = '{:8s}'.format('SENDFAIL')
             action = send_action
             try:
-                send_message_result = self._smtp_connection.send_message(message)
+                if use_connection_pool:
+                    send_message_result = get_smtp_connection_pool(
+                        self.config,
+                        self._smtp_config,
+                        self.open_smtp_connection,
+                    ).send_message(message)
+                else:
+                    send_message_result = self._smtp_connection.send_message(message)  # nopep8
                 # INFO - G.M - 2019-01-29 - send_message return if not failed,
                 # dict of refused recipients.
 
@@ -199,16 +432,19 @@ class EmailSender(object):
                     log = 'Mail could not be send to some recipient: {}'
                     logger.debug(self, log.format(send_message_result))
                     action = failed_action
+                    error = smtplib.SMTPRecipientsRefused(send_message_result)
 
             except smtplib.SMTPException as exc:
                 log = 'SMTP sending message return error: {}'
                 logger.error(self, log.format(str(exc)))
                 action = failed_action
+                error = exc
             except Exception as exc:
                 log = 'Unexpected exception during sending email message using SMTP: {}'
                 logger.error(self, log.format(exc.__str__()))
                 logger.error(self, traceback.format_exc())
                 action = failed_action
+                error = exc
 
             from tracim_backend.lib.mail_notifier.notifier import EmailManager
             if action == send_action:
@@ -223,5 +459,5 @@ class EmailSender(object):
                 email_subject=message['Subject'],
                 config=self.config,
             )
-
-
+        if error and raise_on_error:
+            raise error
@@ -1,3 +1,10 @@
+import os
+import typing
+
+from mako.lookup import TemplateLookup
+from mako.template import Template
+
+
 class SmtpConfiguration(object):
     """Container class for SMTP configuration used in Tracim."""
 
@@ -20,14 +27,58 @@ class EST(object):
     WORKSPACE_LABEL = '{workspace_label}'
     CONTENT_LABEL = '{content_label}'
     CONTENT_STATUS_LABEL = '{content_status_label}'
+    CONTENT_COUNT = '{content_count}'
 
     @classmethod
     def all(cls):
         return [
             cls.CONTENT_LABEL,
             cls.CONTENT_STATUS_LABEL,
+            cls.CONTENT_COUNT,
             cls.WEBSITE_TITLE,
             cls.WORKSPACE_LABEL
         ]
 
 
+
+
+class EmailTemplateLookup(object):
+    """
+    Process wide cache of compiled email mako templates: a template is
+    compiled once, then only rendered for each email. Cache is keyed by
+    template path and a template is compiled again if its file has been
+    modified since.
+    """
+    _lookups = {}  # type: typing.Dict[typing.Tuple[str, typing.Optional[str]], TemplateLookup]  # nopep8
+
+    @classmethod
+    def get_template(
+            cls,
+            template_filepath: str,
+            module_directory: typing.Optional[str] = None,
+    ) -> Template:
+        """
+        Get compiled mako template of given file.
+        :param template_filepath: path of mako template file
+        :param module_directory: directory where compiled templates modules
+        are written, to be reused by other processes. If None, templates
+        are only compiled in memory.
+        :return: compiled template
+        """
+        directory, filename = os.path.split(os.path.abspath(template_filepath))
+        key = (directory, module_directory)
+        lookup = cls._lookups.get(key)
+        if not lookup:
+            # INFO - G.M - 2019-04-09 - filesystem_checks make lookup compare
+            # template file mtime with compiled one before returning it.
+            lookup = TemplateLookup(
+                directories=[directory],
+                module_directory=module_directory,
+                filesystem_checks=True,
+            )
+            lookup = cls._lookups.setdefault(key, lookup)
+        return lookup.get_template(filename)
+
+    @classmethod
+    def clear(cls) -> None:
+        cls._lookups.clear()
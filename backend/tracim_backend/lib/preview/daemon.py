@@ -0,0 +1,53 @@
+import typing
+
+from rq import Connection as RQConnection
+from rq.dummy import do_nothing
+
+from tracim_backend.lib.mail_notifier.jobs import dispose_job_engines
+from tracim_backend.lib.preview.jobs import PREVIEW_GENERATOR_QUEUE_NAME
+from tracim_backend.lib.utils.daemon import FakeDaemon
+from tracim_backend.lib.utils.daemon import RQWorker
+from tracim_backend.lib.utils.logger import logger
+from tracim_backend.lib.utils.utils import get_redis_connection
+from tracim_backend.lib.utils.utils import get_rq_queue
+
+
+class PreviewGeneratorDaemon(FakeDaemon):
+    """
+    Run preview generation jobs enqueued when preview.processing_mode is async
+    """
+    # NOTE: use *args and **kwargs because parent __init__ use strange
+    # * parameter
+    def __init__(self, config: 'CFG', burst=True, *args, **kwargs):
+        """
+        :param config: tracim config
+        :param burst: if true, run one time, if false, run continously
+        """
+        super().__init__(*args, **kwargs)
+        self.config = config
+        self.worker = None  # type: RQWorker
+        self.burst = burst
+
+    def append_thread_callback(self, callback: typing.Callable) -> None:
+        logger.warning(
+            self,
+            'PreviewGeneratorDaemon not implement append_thread_callback'
+        )
+        pass
+
+    def stop(self) -> None:
+        # When _stop_requested at False, RQWorker will raise StopRequested
+        # exception in worker thread after receive a job.
+        self.worker._stop_requested = True
+        redis_connection = get_redis_connection(self.config)
+        queue = get_rq_queue(redis_connection, PREVIEW_GENERATOR_QUEUE_NAME)
+        queue.enqueue(do_nothing)
+
+    def run(self) -> None:
+
+        with RQConnection(get_redis_connection(self.config)):
+            self.worker = RQWorker([PREVIEW_GENERATOR_QUEUE_NAME])
+            try:
+                self.worker.work(burst=self.burst)
+            finally:
+                dispose_job_engines()
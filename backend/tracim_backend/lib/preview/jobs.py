@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+import typing
+
+import transaction
+from preview_generator.exception import UnsupportedMimeType
+from preview_generator.manager import PreviewManager
+from rq import Queue
+from rq.job import JobStatus
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.session import SessionTransaction
+
+from tracim_backend.config import CFG
+from tracim_backend.lib.mail_notifier.jobs import get_job_session_factory
+from tracim_backend.lib.utils.logger import logger
+from tracim_backend.lib.utils.utils import get_redis_connection
+from tracim_backend.lib.utils.utils import get_rq_queue
+from tracim_backend.models.setup_models import get_tm_session
+
+PREVIEW_GENERATOR_QUEUE_NAME = 'preview_generator'
+# INFO - G.M - 2019-04-05 - key of session.info where preview generations
+# are stored until session transaction is committed.
+PENDING_PREVIEW_GENERATIONS_KEY = 'tracim_pending_preview_generations'
+
+# INFO - G.M - 2019-04-05 - revision_id, file_path, file_extension
+PreviewGeneration = typing.Tuple[int, str, str]
+
+
+def generate_revision_previews(
+        config: CFG,
+        revision_id: int,
+        file_path: str,
+        file_extension: str,
+) -> None:
+    """
+    Preview generation job, run by preview_generator daemon: generate in
+    preview cache full pdf preview and first page jpg previews of a revision
+    file, then store preview metadata of revision. Other pages previews are
+    quickly generated on demand from cached pdf preview.
+    :param config: tracim config
+    :param revision_id: id of revision
+    :param file_path: path of revision file in depot
+    :param file_extension: file extension of revision file
+    """
+    # INFO - G.M - 2019-04-05 - import here to avoid circular import
+    from tracim_backend.lib.core.content import ContentApi
+    preview_manager = PreviewManager(config.PREVIEW_CACHE_DIR, create_folder=True)  # nopep8
+    try:
+        if preview_manager.has_pdf_preview(file_path, file_ext=file_extension):
+            preview_manager.get_pdf_preview(file_path, file_ext=file_extension)
+        if preview_manager.has_jpeg_preview(file_path, file_ext=file_extension):  # nopep8
+            for dim in config.PREVIEW_JPG_ALLOWED_DIMS:
+                preview_manager.get_jpeg_preview(
+                    file_path,
+                    page=0,
+                    width=dim.width,
+                    height=dim.height,
+                    file_ext=file_extension,
+                )
+    except UnsupportedMimeType:
+        logger.debug(
+            generate_revision_previews,
+            'No preview available for file {}'.format(file_path)
+        )
+    # INFO - G.M - 2019-04-08 - previews are cached now: computing metadata
+    # (page number included) is quick.
+    with transaction.manager:
+        session = get_tm_session(
+            get_job_session_factory(config),
+            transaction.manager,
+        )
+        ContentApi(
+            session=session,
+            current_user=None,
+            config=config,
+        ).store_preview_metadata(revision_id, file_extension)
+
+
+class PreviewGenerationQueue(object):
+    """
+    Queue of preview generation jobs, one job per revision. Jobs are stored in
+    redis and run by preview_generator daemon.
+    """
+
+    def __init__(self, config: CFG) -> None:
+        self._config = config
+        self._queue = None
+
+    @property
+    def queue(self) -> Queue:
+        if not self._queue:
+            self._queue = get_rq_queue(
+                get_redis_connection(self._config),
+                PREVIEW_GENERATOR_QUEUE_NAME,
+            )
+        return self._queue
+
+    @classmethod
+    def get_job_id(cls, revision_id: int) -> str:
+        return 'preview_revision_{}'.format(revision_id)
+
+    def enqueue(
+            self,
+            revision_id: int,
+            file_path: str,
+            file_extension: str,
+    ) -> None:
+        """
+        Enqueue previews generation of revision file.
+        :param revision_id: id of revision
+        :param file_path: path of revision file in depot
+        :param file_extension: file extension of revision file
+        """
+        logger.info(
+            self,
+            'enqueue previews generation of revision {}'.format(revision_id)
+        )
+        self.queue.enqueue_call(
+            generate_revision_previews,
+            args=(
+                self._config,
+                revision_id,
+                file_path,
+                file_extension,
+            ),
+            job_id=self.get_job_id(revision_id),
+            # INFO - G.M - 2019-04-05 - job has no result, drop it once done
+            # so revision is no longer seen as pending.
+            result_ttl=0,
+        )
+
+    def enqueue_after_commit(
+            self,
+            session: Session,
+            revision_id: int,
+            file_path: str,
+            file_extension: str,
+    ) -> None:
+        """
+        Enqueue previews generation of revision file once session transaction
+        is committed: daemon must not generate previews of a revision which
+        is not in database (yet or anymore). Generations of a rollbacked
+        transaction are dropped.
+        :param session: session where revision is created
+        :param revision_id: id of revision
+        :param file_path: path of revision file in depot
+        :param file_extension: file extension of revision file
+        """
+        pending_generations = session.info.get(PENDING_PREVIEW_GENERATIONS_KEY)  # nopep8
+        if pending_generations is None:
+            pending_generations = []
+            session.info[PENDING_PREVIEW_GENERATIONS_KEY] = pending_generations  # nopep8
+            event.listen(session, 'after_commit', self._enqueue_pending_generations)  # nopep8
+            # INFO - G.M - 2019-04-05 - session may be closed without
+            # rollback event: drop generations left when session transaction
+            # ends, committed ones are already enqueued.
+            event.listen(session, 'after_transaction_end', self._drop_pending_generations)  # nopep8
+        pending_generations.append((revision_id, file_path, file_extension))
+
+    def _pop_pending_generations(
+            self,
+            session: Session,
+    ) -> typing.List[PreviewGeneration]:
+        pending_generations = session.info.get(PENDING_PREVIEW_GENERATIONS_KEY, [])  # nopep8
+        session.info[PENDING_PREVIEW_GENERATIONS_KEY] = []
+        return pending_generations
+
+    def _enqueue_pending_generations(self, session: Session) -> None:
+        for revision_id, file_path, file_extension \
+                in self._pop_pending_generations(session):
+            try:
+                self.enqueue(revision_id, file_path, file_extension)
+            except Exception as exc:
+                # INFO - G.M - 2019-04-05 - transaction is already committed,
+                # previews will be generated on demand.
+                logger.error(
+                    self,
+                    'Unable to enqueue previews generation of revision {}: {}'.format(  # nopep8
+                        revision_id,
+                        str(exc),
+                    )
+                )
+                logger.exception(self, exc)
+
+    def _drop_pending_generations(
+            self,
+            session: Session,
+            session_transaction: SessionTransaction,
+    ) -> None:
+        if session_transaction.parent is not None:
+            return
+        pending_generations = self._pop_pending_generations(session)
+        if pending_generations:
+            logger.info(
+                self,
+                'Drop {} previews generation(s) of rollbacked '
+                'transaction'.format(len(pending_generations))
+            )
+
+    def is_pending(self, revision_id: int) -> bool:
+        """
+        Check if previews generation of revision is queued or running.
+        :param revision_id: id of revision
+        """
+        job = self.queue.fetch_job(self.get_job_id(revision_id))
+        if not job:
+            return False
+        return job.get_status() in (JobStatus.QUEUED, JobStatus.STARTED)
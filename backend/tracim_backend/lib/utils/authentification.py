@@ -14,6 +14,7 @@ from tracim_backend.models.auth import AuthType
 from tracim_backend.exceptions import AuthenticationFailed
 from tracim_backend.exceptions import UserDoesNotExist
 from tracim_backend.lib.core.user import UserApi
+from tracim_backend.lib.utils.credentials_cache import CredentialsCache
 from tracim_backend.models.auth import User
 from tracim_backend.config import CFG
 
@@ -54,11 +55,13 @@ class TracimAuthenticationPolicy(object):
         request: Request,
         email: typing.Optional[str],
         password: typing.Optional[str],
+        credentials_cache: typing.Optional[CredentialsCache]=None,
     ) -> typing.Optional[User]:
         """
         Helper to authenticate user in pyramid request
         from user email and password
         :param request: pyramid request
+        :param credentials_cache: cache of verified credentials, optional
         :return: User or None
         """
         app_config = request.registry.settings['CFG']
@@ -70,7 +73,8 @@ class TracimAuthenticationPolicy(object):
             user = uapi.authenticate(
                 email=email,
                 password=password,
-                ldap_connector=ldap_connector
+                ldap_connector=ldap_connector,
+                credentials_cache=credentials_cache,
             )
             return user
         except AuthenticationFailed:
@@ -100,8 +104,15 @@ class TracimBasicAuthAuthenticationPolicy(
     TracimAuthenticationPolicy
 ):
 
-    def __init__(self, realm):
+    def __init__(
+            self,
+            realm: str,
+            credentials_cache: typing.Optional[CredentialsCache]=None,
+    ):
         BasicAuthAuthenticationPolicy.__init__(self, check=None, realm=realm)
+        # INFO - G.M - 2019-04-19 - http basic auth clients send credentials
+        # with every request, verified credentials are cached.
+        self.credentials_cache = credentials_cache
         # TODO - G.M - 2018-09-21 - Disable callback is needed to have BasicAuth
         # correctly working, if enabled, callback method will try check method
         # who is now disabled (uneeded because we use directly
@@ -118,6 +129,7 @@ class TracimBasicAuthAuthenticationPolicy(
             request=request,
             email=credentials.username,
             password=credentials.password,
+            credentials_cache=self.credentials_cache,
         )
         if not user:
             return None
@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import hmac
+import os
+import threading
+import time
+import typing
+from collections import OrderedDict
+from collections import namedtuple
+
+from sqlalchemy.orm import Session
+
+from tracim_backend.models.auth import User
+
+# INFO - G.M - 2019-04-19 - hits/misses: number of credentials checks
+# answered/not answered by cache since process start, size: number of cached
+# credentials.
+CredentialsCacheMetrics = namedtuple(
+    'CredentialsCacheMetrics',
+    ['hits', 'misses', 'size'],
+)
+
+
+class CredentialsCache(object):
+    """
+    Per-process cache of verified credentials: webdav clients and http basic
+    auth clients send login and password with every request, cache avoid to
+    check the password hash (or to do a ldap bind) for each of them.
+
+    Credentials are never stored: entries are keyed by a keyed hash of login
+    and password, with a secret generated at process start. A cached entry is
+    only valid if user has still the same email, auth type and hashed password
+    and is still active and not deleted, so password change, disable or
+    deletion of user invalidate it, even if done by another process. Password
+    of ldap users is not known by tracim: its change is only taken into
+    account when cached entry expire.
+    """
+
+    def __init__(self, ttl: int, max_size: int) -> None:
+        """
+        :param ttl: lifetime of cached credentials in seconds, cache is
+        disabled if 0
+        :param max_size: max number of cached credentials, least recently used
+        ones are dropped first
+        """
+        self.ttl = ttl
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._secret = os.urandom(32)
+        # INFO - G.M - 2019-04-19 - key -> (expiration time, user_id,
+        # credentials version of user)
+        self._entries = OrderedDict()  # type: typing.Dict[bytes, typing.Tuple[float, int, tuple]]  # nopep8
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0 and self.max_size > 0
+
+    def _get_key(self, login: str, password: str) -> bytes:
+        return hmac.new(
+            self._secret,
+            '{}\0{}'.format(login, password).encode('utf-8'),
+            hashlib.sha256,
+        ).digest()
+
+    @staticmethod
+    def _get_credentials_version(user: User) -> tuple:
+        return user.email, user.auth_type, user.password
+
+    def get_user(
+            self,
+            login: str,
+            password: str,
+            session: Session,
+    ) -> typing.Optional[User]:
+        """
+        Get user of already verified credentials.
+        :param login: login (email) of user
+        :param password: cleartext password of user
+        :param session: database session used to load user
+        :return: user if credentials are cached and still valid, else None
+        """
+        if not self.enabled:
+            return None
+        key = self._get_key(login, password)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] < time.monotonic():
+                del self._entries[key]
+                entry = None
+            if not entry:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+        _, user_id, credentials_version = entry
+        user = session.query(User).get(user_id)
+        if (
+            not user
+            or user.is_deleted
+            or not user.is_active
+            or self._get_credentials_version(user) != credentials_version
+        ):
+            with self._lock:
+                self._entries.pop(key, None)
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return user
+
+    def add(self, login: str, password: str, user: User) -> None:
+        """
+        Cache verified credentials
+        :param login: login (email) of user
+        :param password: cleartext password of user
+        :param user: user authenticated with these credentials
+        """
+        if not self.enabled:
+            return
+        key = self._get_key(login, password)
+        with self._lock:
+            self._entries[key] = (
+                time.monotonic() + self.ttl,
+                user.user_id,
+                self._get_credentials_version(user),
+            )
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def get_metrics(self) -> CredentialsCacheMetrics:
+        with self._lock:
+            return CredentialsCacheMetrics(
+                hits=self.hits,
+                misses=self.misses,
+                size=len(self._entries),
+            )
@@ -1,7 +1,35 @@
+from rq import SimpleWorker as BaseRQSimpleWorker
+from rq import Worker as BaseRQWorker
+from rq.worker import StopRequested
+
+
 class FakeDaemon(object):
     """
     Temporary class for transition between tracim 1 and tracim 2
     """
     def __init__(self, *args, **kwargs):
         pass
-    
+
+
+class RQWorker(BaseRQWorker):
+    def _install_signal_handlers(self):
+        # RQ Worker is designed to work in main thread
+        # So we have to disable these signals (we implement server stop in
+        # daemons stop method).
+        pass
+
+    def dequeue_job_and_maintain_ttl(self, timeout):
+        # RQ Worker is designed to work in main thread, so we add behaviour
+        # here: if _stop_requested has been set to True, raise the standard way
+        # StopRequested exception to stop worker.
+        if self._stop_requested:
+            raise StopRequested()
+        return super().dequeue_job_and_maintain_ttl(timeout)
+
+
+class RQSimpleWorker(RQWorker, BaseRQSimpleWorker):
+    """
+    RQWorker running jobs in its own process instead of a forked one, so
+    jobs can reuse resources kept by the process (like connections).
+    """
+    pass
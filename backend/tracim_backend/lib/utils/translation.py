@@ -1,6 +1,8 @@
 # -*- coding: utf-8 -*-
 import json
 import os
+import threading
+from types import MappingProxyType
 
 from babel.core import default_locale
 import typing
@@ -9,6 +11,12 @@ if typing.TYPE_CHECKING:
 
 TRANSLATION_FILENAME = 'backend.json'
 DEFAULT_FALLBACK_LANG = 'en'
+EMPTY_TRANSLATION_CATALOG = MappingProxyType({})
+
+# INFO - G.M - 2019-04-09 - translation catalogs by (i18n folder, lang), each
+# json file is loaded once per process and shared by all Translator instances.
+_translation_catalogs = {}  # type: typing.Dict[typing.Tuple[str, str], typing.Mapping[str, str]]  # nopep8
+_translation_catalogs_lock = threading.Lock()
 
 def translator_marker(string: str) -> str:
     """
@@ -18,6 +26,58 @@ def translator_marker(string: str) -> str:
     """
     return string
 
+def _load_translation_catalog(i18n_folder: str, lang: str) -> typing.Mapping[str, str]:  # nopep8
+    filepath = os.path.join(i18n_folder, lang, TRANSLATION_FILENAME)
+    try:
+        with open(filepath) as file:
+            trads = json.load(file)
+        # INFO - G.M - 2019-04-09 - empty translations are not translations
+        return MappingProxyType(
+            {message: trad for message, trad in trads.items() if trad}
+        )
+    except Exception:
+        return EMPTY_TRANSLATION_CATALOG
+
+
+def get_translation_catalog(i18n_folder: str, lang: str) -> typing.Mapping[str, str]:  # nopep8
+    """
+    Get read-only translation catalog of lang, loaded from its json file
+    only the first time.
+    :param i18n_folder: folder containing one subfolder per lang
+    :param lang: lang of catalog
+    :return: dict like translations catalog, empty if there is no valid
+    translation file for lang.
+    """
+    key = (i18n_folder, lang)
+    catalog = _translation_catalogs.get(key)
+    if catalog is not None:
+        return catalog
+    # INFO - G.M - 2019-04-09 - do not keep catalogs of unknown langs, lang
+    # may come from user input.
+    if not lang or not os.path.isdir(os.path.join(i18n_folder, lang)):
+        return EMPTY_TRANSLATION_CATALOG
+    with _translation_catalogs_lock:
+        catalog = _translation_catalogs.get(key)
+        if catalog is None:
+            catalog = _load_translation_catalog(i18n_folder, lang)
+            _translation_catalogs[key] = catalog
+    return catalog
+
+
+def preload_translation_catalogs(app_config: 'CFG') -> None:
+    """
+    Load translation catalogs of all langs available in i18n folder, to not
+    load them while serving requests.
+    """
+    i18n_folder = app_config.BACKEND_I18N_FOLDER
+    # INFO - G.M - 2019-04-09 - missing i18n folder is allowed, messages are
+    # then untranslated.
+    if not os.path.isdir(i18n_folder):
+        return
+    for lang in os.listdir(i18n_folder):
+        get_translation_catalog(i18n_folder, lang)
+
+
 class Translator(object):
     """
     Get translation from json file
@@ -37,30 +97,11 @@ class Translator(object):
             default_lang = fallback_lang
         self.default_lang = default_lang
 
-    def _get_json_translation_lang_filepath(self, lang: str) -> typing.Optional[str]:  # nopep8
-        i18n_folder = self.config.BACKEND_I18N_FOLDER
-        lang_filepath = os.path.join(i18n_folder, lang, TRANSLATION_FILENAME)
-        if not os.path.isdir(self.config.BACKEND_I18N_FOLDER):
-            return None
-        else:
-            return lang_filepath
-
-    def _get_translation_from_file(self, filepath: str) -> typing.Optional[typing.Dict[str, str]]:  # nopep8
-        try:
-            with open(filepath) as file:
-                trads = json.load(file)
-                return trads
-        except Exception:
-            return None
-
     def _get_translation(self, lang: str, message: str) -> typing.Tuple[str, bool]:
-        try:
-            translation_filepath = self._get_json_translation_lang_filepath(lang)  # nopep8
-            translation = self._get_translation_from_file(translation_filepath)
-            if message in translation and translation[message]:
-                return translation[message], True
-        except Exception:
-            pass
+        catalog = get_translation_catalog(self.config.BACKEND_I18N_FOLDER, lang)  # nopep8
+        translation = catalog.get(message)
+        if translation:
+            return translation, True
         return message, False
 
     def get_translation(self, message: str, lang: str = None) -> str:
@@ -1,5 +1,6 @@
 # -*- coding: utf-8 -*-
 import datetime
+import hashlib
 import random
 import string
 from os.path import normpath as base_normpath
@@ -16,6 +17,7 @@ if typing.TYPE_CHECKING:
     from tracim_backend.config import CFG
 
 DATETIME_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
+FILE_HASH_BLOCK_SIZE = 64 * 1024
 DEFAULT_TRACIM_CONFIG_FILE = "development.ini"
 CONTENT_FRONTEND_URL_SCHEMA = 'workspaces/{workspace_id}/contents/{content_type}/{content_id}'  # nopep8
 WORKSPACE_FRONTEND_URL_SCHEMA = 'workspaces/{workspace_id}'  # nopep8
@@ -110,6 +112,36 @@ def get_rq_queue(redis_connection: Redis, queue_name: str ='default') -> Queue:
     return Queue(name=queue_name, connection=redis_connection)
 
 
+def get_file_hash(
+    file_content: typing.Union[bytes, typing.BinaryIO],
+    block_size: int = FILE_HASH_BLOCK_SIZE,
+    rewind: bool = True,
+) -> typing.Tuple[str, int]:
+    """
+    Compute sha256 hash and size of given bytes or file object. File object
+    is read by blocks and rewound to its start, so it can be read again after.
+    :param file_content: bytes or readable file object
+    :param block_size: size of blocks read from file object
+    :param rewind: seek file object to its start after reading, file object
+    should be seekable if True.
+    :return: tuple of hash as hexadecimal string and size in bytes
+    """
+    file_hash = hashlib.sha256()
+    if isinstance(file_content, bytes):
+        file_hash.update(file_content)
+        return file_hash.hexdigest(), len(file_content)
+
+    size = 0
+    block = file_content.read(block_size)
+    while block:
+        file_hash.update(block)
+        size += len(block)
+        block = file_content.read(block_size)
+    if rewind:
+        file_content.seek(0)
+    return file_hash.hexdigest(), size
+
+
 def cmp_to_key(mycmp):
     """
     List sort related function
@@ -10,9 +10,12 @@ from tracim_backend.config import CFG
 from tracim_backend.lib.utils.utils import DEFAULT_TRACIM_CONFIG_FILE
 from tracim_backend.lib.webdav.authentification import TracimDomainController
 from tracim_backend.lib.webdav.dav_provider import Provider
+from tracim_backend.lib.webdav.lock_storage import LockStorage
 from tracim_backend.lib.webdav.middlewares import TracimEnforceHTTPS
 from tracim_backend.lib.webdav.middlewares import TracimEnv
 from tracim_backend.lib.webdav.middlewares import TracimWsgiDavDebugFilter
+from tracim_backend.models.setup_models import get_engine
+from tracim_backend.models.setup_models import get_session_factory
 
 
 class WebdavAppFactory(object):
@@ -59,11 +62,17 @@ class WebdavAppFactory(object):
                 show_history=app_config.WEBDAV_SHOW_ARCHIVED,
                 show_archived=app_config.WEBDAV_SHOW_DELETED,
                 show_deleted=app_config.WEBDAV_SHOW_HISTORY,
-                manage_locks=app_config.WEBDAV_MANAGE_LOCK,
                 app_config=app_config,
             )
         }
         config['block_size'] = app_config.WEBDAV_BLOCK_SIZE
+        # INFO - G.M - 2019-04-19 - locks are stored in database, so they are
+        # shared by all webdav processes.
+        config['locksmanager'] = False
+        if app_config.WEBDAV_MANAGE_LOCK:
+            config['locksmanager'] = LockStorage(
+                get_session_factory(get_engine(settings))
+            )
 
         config['domaincontroller'] = TracimDomainController(
             presetdomain=None,
@@ -8,6 +8,7 @@ from tracim_backend.config import CFG
 from tracim_backend.exceptions import AuthenticationFailed
 from tracim_backend.exceptions import DigestAuthNotImplemented
 from tracim_backend.lib.core.user import UserApi
+from tracim_backend.lib.utils.credentials_cache import CredentialsCache
 
 DEFAULT_TRACIM_WEBDAV_REALM = '/'
 
@@ -19,6 +20,10 @@ class TracimDomainController(object):
     """
     def __init__(self, app_config: CFG, presetdomain=None, presetserver=None):
         self.app_config = app_config
+        self.credentials_cache = CredentialsCache(
+            ttl=app_config.AUTH_CREDENTIALS_CACHE_TTL,
+            max_size=app_config.AUTH_CREDENTIALS_CACHE_MAX_SIZE,
+        )
 
     def getDomainRealm(self, inputURL: str, environ: typing.Dict[str, typing.Any]) -> str:
         return DEFAULT_TRACIM_WEBDAV_REALM
@@ -58,7 +63,8 @@ class TracimDomainController(object):
             api.authenticate(
                 email=username,
                 password=password,
-                ldap_connector=environ['tracim_registry'].ldap_connector
+                ldap_connector=environ['tracim_registry'].ldap_connector,
+                credentials_cache=self.credentials_cache,
             )
             transaction.commit()
         except AuthenticationFailed:
@@ -5,12 +5,12 @@ import typing
 from os.path import basename
 from os.path import dirname
 
+from sqlalchemy import event
 from sqlalchemy.orm import Session
 from sqlalchemy.orm.exc import NoResultFound
 from wsgidav.dav_error import HTTP_FORBIDDEN
 from wsgidav.dav_error import DAVError
 from wsgidav.dav_provider import DAVProvider
-from wsgidav.lock_manager import LockManager
 
 from tracim_backend.app_models.contents import content_type_list
 from tracim_backend.config import CFG
@@ -23,17 +23,26 @@ from tracim_backend.lib.core.content import ContentApi
 from tracim_backend.lib.core.content import ContentRevisionRO
 from tracim_backend.lib.core.user import UserApi
 from tracim_backend.lib.core.workspace import WorkspaceApi
+from tracim_backend.lib.utils.authorization import AuthorizationChecker
+from tracim_backend.lib.utils.authorization import ProfileChecker
+from tracim_backend.lib.utils.authorization import RoleChecker
 from tracim_backend.lib.utils.request import TracimContext
 from tracim_backend.lib.utils.utils import normpath
 from tracim_backend.lib.utils.utils import webdav_convert_file_name_to_bdd
 from tracim_backend.lib.webdav import resources
-from tracim_backend.lib.webdav.lock_storage import LockStorage
 from tracim_backend.lib.webdav.utils import HistoryType
 from tracim_backend.lib.webdav.utils import SpecialFolderExtension
 from tracim_backend.models.data import Content
 from tracim_backend.models.data import Workspace
 
 
+WEBDAV_FLUSH_COUNT_INFO_KEY = 'webdav_flush_count'
+
+
+def _count_session_flush(session: Session, flush_context) -> None:
+    session.info[WEBDAV_FLUSH_COUNT_INFO_KEY] += 1
+
+
 class WebdavTracimContext(TracimContext):
 
     def __init__(self, environ: typing.Dict[str, typing.Any], app_config: CFG, session: Session):
@@ -42,10 +51,67 @@ class WebdavTracimContext(TracimContext):
         self._candidate_parent_content = None
         self._app_config = app_config
         self._session  = session
+        # INFO - G.M - 2019-04-18 - wsgidav resolve same paths many times
+        # for one request: resolved workspaces, contents and folder prefixes
+        # of paths are cached for the request, until something is written in
+        # database.
+        self._workspaces_cache = {}  # type: typing.Dict[typing.Tuple[str, bool], typing.Optional[Workspace]]  # nopep8
+        self._contents_cache = {}  # type: typing.Dict[str, typing.Optional[Content]]  # nopep8
+        self._folders_cache = {}  # type: typing.Dict[typing.Tuple[int, typing.Tuple[str, ...]], Content]  # nopep8
+        # INFO - G.M - 2019-04-19 - every property getter of every member of
+        # a PROPFIND check rights of user: result of checks which depend only
+        # on current user and current workspace are cached too.
+        self._authorizations_cache = {}  # type: typing.Dict[typing.Tuple[AuthorizationChecker, str], typing.Optional[TracimException]]  # nopep8
+        # INFO - G.M - 2019-04-18 - session may be reused by many requests,
+        # flush counter listener should be registered only once.
+        if WEBDAV_FLUSH_COUNT_INFO_KEY not in session.info:
+            session.info[WEBDAV_FLUSH_COUNT_INFO_KEY] = 0
+            event.listen(session, 'after_flush', _count_session_flush)
+        self._cache_flush_count = session.info[WEBDAV_FLUSH_COUNT_INFO_KEY]
+
+    def _check_cache(self) -> None:
+        """
+        Drop cached paths if database has been modified since they were cached
+        """
+        flush_count = self._session.info[WEBDAV_FLUSH_COUNT_INFO_KEY]
+        if flush_count != self._cache_flush_count:
+            self._workspaces_cache.clear()
+            self._contents_cache.clear()
+            self._folders_cache.clear()
+            self._authorizations_cache.clear()
+            self._cache_flush_count = flush_count
 
     def set_path(self, path: str):
         self.path = path
 
+    def check_authorization(
+            self,
+            authorization_checker: AuthorizationChecker,
+    ) -> None:
+        """
+        Check authorization of current user, raise TracimException if check
+        doesn't pass.
+        :param authorization_checker: checker to apply
+        """
+        if not isinstance(authorization_checker, (ProfileChecker, RoleChecker)):  # nopep8
+            authorization_checker.check(tracim_context=self)
+            return
+        self._check_cache()
+        if self._current_workspace:
+            workspace_key = self._current_workspace.workspace_id
+        else:
+            workspace_key = self._get_current_workspace_label()
+        cache_key = (authorization_checker, workspace_key)
+        if cache_key not in self._authorizations_cache:
+            try:
+                authorization_checker.check(tracim_context=self)
+                self._authorizations_cache[cache_key] = None
+            except TracimException as exc:
+                self._authorizations_cache[cache_key] = exc
+        exc = self._authorizations_cache[cache_key]
+        if exc:
+            raise exc
+
     @property
     def root_path(self) -> str:
         return self.environ['http_authenticator.realm']
@@ -63,11 +129,11 @@ class WebdavTracimContext(TracimContext):
         """
         Current authenticated user if exist
         """
-        return self._generate_if_none(
-            self._current_user,
-            self._get_user,
-            self._get_current_user_email
-        )
+        # INFO - G.M - 2019-04-19 - authenticated user does not change during
+        # request, load it once.
+        if not self._current_user:
+            self._current_user = self._get_user(self._get_current_user_email)
+        return self._current_user
 
     def _get_user(self, user_email: typing.Callable):
         user_email = user_email()
@@ -106,13 +172,33 @@ class WebdavTracimContext(TracimContext):
 
     def _get_workspace(self, workspace_id_fetcher):
         workspace_id = workspace_id_fetcher()
-        wapi = WorkspaceApi(
-            current_user=self.current_user,
-            session=self.dbsession,
-            config=self.app_config,
-            show_deleted=True,
-        )
-        return wapi.get_one_by_label(workspace_id)
+        return self._get_workspace_by_label(workspace_id, show_deleted=True)
+
+    def _get_workspace_by_label(
+            self,
+            label: str,
+            show_deleted: bool,
+    ) -> Workspace:
+        self._check_cache()
+        cache_key = (label, show_deleted)
+        if cache_key not in self._workspaces_cache:
+            wapi = WorkspaceApi(
+                current_user=self.current_user,
+                session=self.dbsession,
+                config=self.app_config,
+                show_deleted=show_deleted,
+            )
+            try:
+                self._workspaces_cache[cache_key] = wapi.get_one_by_label(label)  # nopep8
+            except WorkspaceNotFound:
+                self._workspaces_cache[cache_key] = None
+                raise
+        workspace = self._workspaces_cache[cache_key]
+        if not workspace:
+            raise WorkspaceNotFound(
+                'workspace {} does not exist or not visible for user'.format(label)  # nopep8
+            )
+        return workspace
 
     def _get_current_workspace_label(self) -> str:
         return webdav_convert_file_name_to_bdd(self.path.split('/')[1])
@@ -131,30 +217,64 @@ class WebdavTracimContext(TracimContext):
 
     def _get_content(self, content_path_fetcher):
         path = content_path_fetcher()
+        self._check_cache()
+        if path not in self._contents_cache:
+            try:
+                self._contents_cache[path] = self._resolve_content(path)
+            except ContentNotFound:
+                self._contents_cache[path] = None
+                raise
+        content = self._contents_cache[path]
+        if not content:
+            raise ContentNotFound(
+                'Content "{}" not found in database'.format(path)
+            )
+        return content
+
+    def _resolve_content(self, path: str) -> Content:
         content_path = self.reduce_path(path)
         splited_local_path = content_path.strip('/').split('/')
         workspace_name = webdav_convert_file_name_to_bdd(splited_local_path[0])
-        wapi = WorkspaceApi(
-            current_user=self.current_user,
-            session=self.dbsession,
-            config=self.app_config,
+        workspace = self._get_workspace_by_label(
+            workspace_name,
+            show_deleted=False,
         )
-        workspace = wapi.get_one_by_label(workspace_name)
         parents = []
         if len(splited_local_path) > 2:
             parent_string = splited_local_path[1:-1]
             parents = [webdav_convert_file_name_to_bdd(x) for x in parent_string]
 
+        # INFO - G.M - 2019-04-18 - start from deepest parent folder already
+        # resolved in this request
+        parent_folder = None
+        resolved_parents_count = 0
+        for parents_count in range(len(parents), 0, -1):
+            parent_folder = self._folders_cache.get(
+                (workspace.workspace_id, tuple(parents[:parents_count]))
+            )
+            if parent_folder:
+                resolved_parents_count = parents_count
+                break
+
         content_api = ContentApi(
             config=self.app_config,
             current_user=self.current_user,
             session=self.dbsession
         )
-        return content_api.get_one_by_filename_and_parent_labels(
+        contents = content_api.get_content_path_by_labels(
             content_label=webdav_convert_file_name_to_bdd(basename(path)),
-            content_parent_labels=parents,
+            content_parent_labels=parents[resolved_parents_count:],
             workspace=workspace,
+            parent_folder=parent_folder,
         )
+        for parents_count, folder in enumerate(
+                contents[:-1],
+                start=resolved_parents_count + 1,
+        ):
+            self._folders_cache[
+                (workspace.workspace_id, tuple(parents[:parents_count]))
+            ] = folder
+        return contents[-1]
 
     def _get_content_path(self):
         return normpath(self.path)
@@ -218,13 +338,9 @@ class Provider(DAVProvider):
             show_history=True,
             show_deleted=True,
             show_archived=True,
-            manage_locks=True,
     ):
         super(Provider, self).__init__()
 
-        if manage_locks:
-            self.lockManager = LockManager(LockStorage())
-
         self.app_config = app_config
         self._show_archive = show_archived
         self._show_delete = show_deleted
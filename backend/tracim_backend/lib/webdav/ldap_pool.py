@@ -0,0 +1,113 @@
+# coding: utf8
+import contextlib
+import queue
+import time
+import typing
+
+import ldap3
+from ldap3.core.exceptions import LDAPException
+from pyramid_ldap3 import ConnectionManager
+
+from tracim_backend.lib.utils.logger import logger
+
+
+class PooledLDAPConnectionManager(ConnectionManager):
+    """
+    LDAP connection manager meant to live as long as the process: connections
+    bound with service account (used for login queries) are kept open and
+    shared between requests and threads. Each connection is used by one thread
+    at a time and is checked before being reused: closed, too old or (after
+    some idle time) unresponsive connections are replaced by new ones.
+    Connections to check user credentials are never pooled.
+    """
+
+    # INFO - G.M - 2019-04-19 - connections idle for more than this number of
+    # seconds are checked with a request to ldap server before being reused.
+    HEALTH_CHECK_IDLE_TIME = 30
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        # INFO - G.M - 2019-04-19 - idle connections, with their creation
+        # time and last use time.
+        self._idle_connections = queue.LifoQueue(
+            maxsize=self.pool_size or 0
+        )  # type: queue.LifoQueue[typing.Tuple[ldap3.Connection, float, float]]  # nopep8
+
+    def connection(self, user: str=None, password: str=None):
+        if user or not self.pool_size:
+            return super().connection(user, password)
+        return self._pooled_connection()
+
+    @contextlib.contextmanager
+    def _pooled_connection(self) -> typing.Iterator[ldap3.Connection]:
+        conn, created = self._get_connection()
+        reusable = False
+        try:
+            yield conn
+            reusable = True
+        except LDAPException:
+            # INFO - G.M - 2019-04-19 - connection may be broken, drop it
+            raise
+        except BaseException:
+            # INFO - G.M - 2019-04-19 - error not related to ldap, connection
+            # is still usable.
+            reusable = True
+            raise
+        finally:
+            if reusable:
+                self._release(conn, created)
+            else:
+                self._close(conn)
+
+    def _release(self, conn: ldap3.Connection, created: float) -> None:
+        try:
+            self._idle_connections.put_nowait((conn, created, time.time()))
+        except queue.Full:
+            self._close(conn)
+
+    def _get_connection(self) -> typing.Tuple[ldap3.Connection, float]:
+        while True:
+            try:
+                conn, created, last_used = self._idle_connections.get_nowait()
+            except queue.Empty:
+                break
+            if self._is_healthy(conn, created, last_used):
+                return conn, created
+            self._close(conn)
+        return self._new_connection(), time.time()
+
+    def _new_connection(self) -> ldap3.Connection:
+        # INFO - G.M - 2019-04-19 - pyramid_ldap3 queries read results with
+        # conn.get_response(), which requires an asynchronous strategy.
+        return self.ldap3.Connection(
+            self.server, user=self.bind, password=self.passwd,
+            client_strategy=ldap3.ASYNC,
+            auto_bind=True, lazy=False, read_only=True)
+
+    def _is_healthy(
+            self,
+            conn: ldap3.Connection,
+            created: float,
+            last_used: float,
+    ) -> bool:
+        now = time.time()
+        if conn.closed or not conn.bound:
+            return False
+        if self.pool_lifetime and now - created > self.pool_lifetime:
+            return False
+        if now - last_used > self.HEALTH_CHECK_IDLE_TIME:
+            try:
+                conn.extend.standard.who_am_i()
+            except LDAPException as exc:
+                logger.warning(
+                    self,
+                    'Drop unresponsive LDAP connection: {}'.format(str(exc)),
+                )
+                return False
+        return True
+
+    def _close(self, conn: ldap3.Connection) -> None:
+        try:
+            conn.unbind()
+        except LDAPException:
+            pass
@@ -1,275 +1,325 @@
+# coding: utf8
+import contextlib
 import time
+import typing
 
-from tracim_backend.lib.webdav.model import Lock, Url2Token
+from sqlalchemy import and_
+from sqlalchemy import func
+from sqlalchemy import or_
+from sqlalchemy.orm import Session
+from sqlalchemy.orm import sessionmaker
 from wsgidav import util
-from wsgidav.lock_manager import normalizeLockRoot, lockString, generateLockToken, validateLock
-from wsgidav.rw_lock import ReadWriteLock
+from wsgidav.dav_error import HTTP_LOCKED
+from wsgidav.dav_error import PRECONDITION_CODE_LockConflict
+from wsgidav.dav_error import DAVError
+from wsgidav.dav_error import DAVErrorCondition
+from wsgidav.lock_manager import generateLockToken
+from wsgidav.lock_manager import lockString
+from wsgidav.lock_manager import normalizeLockRoot
+from wsgidav.lock_manager import validateLock
+
+from tracim_backend.models.data import WebdavLock
 
 _logger = util.getModuleLogger(__name__)
 
 
-def from_dict_to_base(lock):
-    return Lock(
-        token=lock["token"],
-        depth=lock["depth"],
-        root=lock["root"],
-        type=lock["type"],
-        scopre=lock["scope"],
-        owner=lock["owner"],
-        timeout=lock["timeout"],
-        principal=lock["principal"],
-        expire=lock["expire"]
+def from_dict_to_base(lock: dict) -> WebdavLock:
+    return WebdavLock(
+        token=lock['token'],
+        depth=lock['depth'],
+        root=lock['root'],
+        type=lock['type'],
+        scope=lock['scope'],
+        owner=lock['owner'].decode('utf-8'),
+        timeout=lock['timeout'],
+        principal=lock['principal'],
+        expire=lock['expire'],
     )
 
 
-def from_base_to_dict(lock):
+def from_base_to_dict(lock: WebdavLock) -> dict:
     return {
         'token': lock.token,
         'depth': lock.depth,
         'root': lock.root,
         'type': lock.type,
         'scope': lock.scope,
-        'owner': lock.owner,
+        # INFO - G.M - 2019-04-19 - wsgidav expect xml of owner as bytes
+        'owner': lock.owner.encode('utf-8'),
         'timeout': lock.timeout,
         'principal': lock.principal,
-        'expire': lock.expire
+        'expire': lock.expire,
     }
 
 
+def get_ancestor_roots(root: str) -> typing.List[str]:
+    """
+    :param root: normalized lock root
+    :return: given root and normalized roots of all its ancestors
+    """
+    roots = [root]
+    while root != '/':
+        root = '/' + root.strip('/').rpartition('/')[0]
+        roots.append(root)
+    return roots
+
+
 class LockStorage(object):
+    """
+    Database storage of WebDAV locks for wsgidav LockManager: locks are shared
+    by all webdav processes using the same database. Each operation is done
+    in its own short transaction, independent from request one, so locks are
+    visible to other processes as soon as they are created.
+
+    Locks are looked up by their indexed root: locks of a path and of its
+    ancestors are found with one indexed query for each level, whatever the
+    number of locks stored. Expired locks are never returned and are purged
+    in bulk.
+    """
     LOCK_TIME_OUT_DEFAULT = 604800  # 1 week, in seconds
     LOCK_TIME_OUT_MAX = 4 * 604800  # 1 month, in seconds
+    # INFO - G.M - 2019-04-19 - expired locks are purged by lock creation, at
+    # most once per this number of seconds.
+    CLEANUP_INTERVAL = 60
 
-    def __init__(self):
-        self._session = None# todo Session()
-        self._lock = ReadWriteLock()
-
-    def __repr__(self):
-        return "C'est bien mon verrou..."
-
-    def __del__(self):
-        pass
+    def __init__(self, session_factory: sessionmaker) -> None:
+        """
+        :param session_factory: factory of sessions used for lock operations,
+        sessions must not be bound to a transaction manager.
+        """
+        self._session_factory = session_factory
+        self._last_cleanup = 0
 
-    def get_lock_db_from_token(self, token):
-        return self._session.query(Lock).filter(Lock.token == token).one_or_none()
+    def __repr__(self) -> str:
+        return '{}()'.format(self.__class__.__name__)
 
-    def _flush(self):
-        """Overloaded by Shelve implementation."""
-        pass
+    @contextlib.contextmanager
+    def _session(self) -> typing.Iterator[Session]:
+        session = self._session_factory()
+        try:
+            yield session
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
 
-    def open(self):
-        """Called before first use.
+    @staticmethod
+    def _valid_lock_filter(now: float):
+        return or_(WebdavLock.expire < 0, WebdavLock.expire >= now)
 
-        May be implemented to initialize a storage.
-        """
+    def open(self) -> None:
+        """Called before first use."""
         pass
 
-    def close(self):
+    def close(self) -> None:
         """Called on shutdown."""
         pass
 
-    def cleanup(self):
-        """Purge expired locks (optional)."""
-        pass
-
-    def clear(self):
+    def cleanup(self) -> int:
+        """
+        Purge expired locks
+        :return: number of purged locks
+        """
+        now = time.time()
+        with self._session() as session:
+            purged = session.query(WebdavLock) \
+                .filter(WebdavLock.expire >= 0) \
+                .filter(WebdavLock.expire < now) \
+                .delete(synchronize_session=False)
+        self._last_cleanup = now
+        if purged:
+            _logger.debug('Purged {} expired locks'.format(purged))
+        return purged
+
+    def clear(self) -> None:
         """Delete all entries."""
-        self._session.query(Lock).all().delete(synchronize_session=False)
-        self._session.commit()
-
-    def get(self, token):
-        """Return a lock dictionary for a token.
+        with self._session() as session:
+            session.query(WebdavLock).delete(synchronize_session=False)
 
+    def get(self, token: str) -> typing.Optional[dict]:
+        """
+        Return a lock dictionary for a token.
         If the lock does not exist or is expired, None is returned.
-
-        token:
-            lock token
-        Returns:
-            Lock dictionary or <None>
-
-        Side effect: if lock is expired, it will be purged and None is returned.
+        :param token: lock token
         """
-        self._lock.acquireRead()
-        try:
-            lock_base = self._session.query(Lock).filter(Lock.token == token).one_or_none()
-            if lock_base is None:
-                # Lock not found: purge dangling URL2TOKEN entries
-                _logger.debug("Lock purged dangling: %s" % token)
-                self.delete(token)
-                return None
-            expire = float(lock_base.expire)
-            if 0 <= expire < time.time():
-                _logger.debug("Lock timed-out(%s): %s" % (expire, lockString(from_base_to_dict(lock_base))))
-                self.delete(token)
+        with self._session() as session:
+            lock_db = session.query(WebdavLock) \
+                .filter(WebdavLock.token == token) \
+                .filter(self._valid_lock_filter(time.time())) \
+                .one_or_none()
+            if lock_db is None:
                 return None
-            return from_base_to_dict(lock_base)
-        finally:
-            self._lock.release()
-
-    def create(self, path, lock):
-        """Create a direct lock for a resource path.
+            return from_base_to_dict(lock_db)
 
-        path:
-            Normalized path (utf8 encoded string, no trailing '/')
-        lock:
-            lock dictionary, without a token entry
-        Returns:
-            New unique lock token.: <lock
-
-        **Note:** the lock dictionary may be modified on return:
+    def create(self, path: str, lock: dict) -> dict:
+        """
+        Create a direct lock for a resource path.
 
-        - lock['root'] is ignored and set to the normalized <path>
+        **Note:** the lock dictionary is modified:
+        - lock['root'] is set to the normalized <path>
         - lock['timeout'] may be normalized and shorter than requested
-        - lock['token'] is added
+        - lock['token'] and lock['expire'] are added
+
+        Conflicts are checked again once lock is stored: another process
+        may have stored a conflicting lock since wsgidav LockManager checked
+        them. If so, lock is removed and DAVError(HTTP_LOCKED) is raised.
+        :param path: normalized path (no trailing '/')
+        :param lock: lock dictionary, without a token entry
+        :return: lock dictionary
         """
-        self._lock.acquireWrite()
-        try:
-            # We expect only a lock definition, not an existing lock
-            assert lock.get("token") is None
-            assert lock.get("expire") is None, "Use timeout instead of expire"
-            assert path and "/" in path
-
-            # Normalize root: /foo/bar
-            org_path = path
-            path = normalizeLockRoot(path)
-            lock["root"] = path
+        # We expect only a lock definition, not an existing lock
+        assert lock.get('token') is None
+        assert lock.get('expire') is None, 'Use timeout instead of expire'
+        assert path and '/' in path
 
-            # Normalize timeout from ttl to expire-date
-            timeout = float(lock.get("timeout"))
-            if timeout is None:
-                timeout = LockStorage.LOCK_TIME_OUT_DEFAULT
-            elif timeout < 0 or timeout > LockStorage.LOCK_TIME_OUT_MAX:
-                timeout = LockStorage.LOCK_TIME_OUT_MAX
+        if time.time() - self._last_cleanup > self.CLEANUP_INTERVAL:
+            self.cleanup()
 
-            lock["timeout"] = timeout
-            lock["expire"] = time.time() + timeout
+        org_path = path
+        path = normalizeLockRoot(path)
+        lock['root'] = path
 
-            validateLock(lock)
+        # Normalize timeout from ttl to expire-date
+        timeout = lock.get('timeout')
+        if timeout is None:
+            timeout = self.LOCK_TIME_OUT_DEFAULT
+        timeout = float(timeout)
+        if timeout < 0 or timeout > self.LOCK_TIME_OUT_MAX:
+            timeout = self.LOCK_TIME_OUT_MAX
 
-            token = generateLockToken()
-            lock["token"] = token
+        lock['timeout'] = timeout
+        lock['expire'] = time.time() + timeout
 
-            # Store lock
-            lock_db = from_dict_to_base(lock)
+        validateLock(lock)
 
-            self._session.add(lock_db)
+        lock['token'] = generateLockToken()
+        with self._session() as session:
+            session.add(from_dict_to_base(lock))
 
-            # Store locked path reference
-            url2token = Url2Token(
-                path=path,
-                token=token
-            )
+        conflicting_locks = self._get_conflicting_locks(lock)
+        if conflicting_locks:
+            self.delete(lock['token'])
+            errcond = DAVErrorCondition(PRECONDITION_CODE_LockConflict)
+            for conflicting_lock in conflicting_locks:
+                errcond.add_href(conflicting_lock.root)
+            raise DAVError(HTTP_LOCKED, errcondition=errcond)
 
-            self._session.add(url2token)
-            self._session.commit()
+        _logger.debug('LockStorage.create({!r}): {}'.format(org_path, lockString(lock)))  # nopep8
+        return lock
 
-            self._flush()
-            _logger.debug("LockStorageDict.set(%r): %s" % (org_path, lockString(lock)))
-            #            print("LockStorageDict.set(%r): %s" % (org_path, lockString(lock)))
-            return lock
-        finally:
-            self._lock.release()
-
-    def refresh(self, token, timeout):
-        """Modify an existing lock's timeout.
-
-        token:
-            Valid lock token.
-        timeout:
-            Suggested lifetime in seconds (-1 for infinite).
-            The real expiration time may be shorter than requested!
-        Returns:
-            Lock dictionary.
-            Raises ValueError, if token is invalid.
+    def _get_conflicting_locks(self, lock: dict) -> typing.List[WebdavLock]:
+        """
+        Get other valid locks conflicting with given one, same rules as
+        wsgidav LockManager: lock conflict with locks on same root and with
+        depth-infinity locks of ancestors, unless both are shared, and a
+        depth-infinity lock conflict with all locks of descendants.
+        """
+        root = lock['root']
+        root_filter = WebdavLock.root == root
+        ancestor_roots = get_ancestor_roots(root)[1:]
+        if ancestor_roots:
+            root_filter = or_(
+                root_filter,
+                and_(
+                    WebdavLock.root.in_(ancestor_roots),
+                    WebdavLock.depth == 'infinity',
+                ),
+            )
+        if lock['scope'] == 'shared':
+            root_filter = and_(root_filter, WebdavLock.scope != 'shared')
+        if lock['depth'] == 'infinity':
+            root_filter = or_(root_filter, self._children_filter(root))
+        with self._session() as session:
+            return session.query(WebdavLock) \
+                .filter(WebdavLock.token != lock['token']) \
+                .filter(root_filter) \
+                .filter(self._valid_lock_filter(time.time())) \
+                .all()
+
+    @staticmethod
+    def _children_filter(root: str):
+        prefix = root.rstrip('/') + '/'
+        like_prefix = prefix.replace('\\', '\\\\') \
+            .replace('%', '\\%') \
+            .replace('_', '\\_')
+        # INFO - G.M - 2019-04-19 - like may be case insensitive, substr
+        # comparison keep only real children.
+        return and_(
+            WebdavLock.root.like(like_prefix + '%', escape='\\'),
+            func.substr(WebdavLock.root, 1, len(prefix)) == prefix,
+            WebdavLock.root != root,
+        )
+
+    def refresh(self, token: str, timeout: float) -> dict:
+        """
+        Modify an existing lock's timeout.
+        :param token: valid lock token
+        :param timeout: suggested lifetime in seconds (-1 for infinite), the
+        real expiration time may be shorter than requested!
+        :return: lock dictionary
         """
-        lock_db = self._session.query(Lock).filter(Lock.token == token).one_or_none()
-        assert lock_db is not None, "Lock must exist"
         assert timeout == -1 or timeout > 0
-        if timeout < 0 or timeout > LockStorage.LOCK_TIME_OUT_MAX:
-            timeout = LockStorage.LOCK_TIME_OUT_MAX
+        if timeout < 0 or timeout > self.LOCK_TIME_OUT_MAX:
+            timeout = self.LOCK_TIME_OUT_MAX
 
-        self._lock.acquireWrite()
-        try:
-            # Note: shelve dictionary returns copies, so we must reassign values:
+        with self._session() as session:
+            lock_db = session.query(WebdavLock) \
+                .filter(WebdavLock.token == token) \
+                .one_or_none()
+            if lock_db is None:
+                raise ValueError('Lock {} does not exist'.format(token))
             lock_db.timeout = timeout
             lock_db.expire = time.time() + timeout
-            self._session.commit()
-            self._flush()
-        finally:
-            self._lock.release()
-        return from_base_to_dict(lock_db)
-
-    def delete(self, token):
-        """Delete lock.
+            return from_base_to_dict(lock_db)
 
-        Returns True on success. False, if token does not exist, or is expired.
+    def delete(self, token: str) -> bool:
         """
-        self._lock.acquireWrite()
-        try:
-            lock_db = self._session.query(Lock).filter(Lock.token == token).one_or_none()
-            _logger.debug("delete %s" % lockString(from_base_to_dict(lock_db)))
-            if lock_db is None:
-                return False
-            # Remove url to lock mapping
-            url2token = self._session.query(Url2Token).filter(
-                Url2Token.path == lock_db.root,
-                Url2Token.token == token).one_or_none()
-            if url2token is not None:
-                self._session.delete(url2token)
-            # Remove the lock
-            self._session.delete(lock_db)
-            self._session.commit()
-
-            self._flush()
-        finally:
-            self._lock.release()
-        return True
-
-    def getLockList(self, path, includeRoot, includeChildren, tokenOnly):
-        """Return a list of direct locks for <path>.
-
-        Expired locks are *not* returned (but may be purged).
-
-        path:
-            Normalized path (utf8 encoded string, no trailing '/')
-        includeRoot:
-            False: don't add <path> lock (only makes sense, when includeChildren
-            is True).
-        includeChildren:
-            True: Also check all sub-paths for existing locks.
-        tokenOnly:
-            True: only a list of token is returned. This may be implemented
-            more efficiently by some providers.
-        Returns:
-            List of valid lock dictionaries (may be empty).
+        Delete lock.
+        :return: True on success, False if token does not exist
+        """
+        with self._session() as session:
+            deleted = session.query(WebdavLock) \
+                .filter(WebdavLock.token == token) \
+                .delete(synchronize_session=False)
+        _logger.debug('LockStorage.delete({})'.format(token))
+        return bool(deleted)
+
+    def getLockList(
+            self,
+            path: str,
+            includeRoot: bool,
+            includeChildren: bool,
+            tokenOnly: bool,
+    ) -> typing.List[typing.Union[dict, str]]:
         """
-        assert path and path.startswith("/")
+        Return a list of direct locks for <path>. Expired locks are not
+        returned.
+        :param path: normalized path (no trailing '/')
+        :param includeRoot: False: don't add <path> lock (only makes sense,
+        when includeChildren is True).
+        :param includeChildren: True: also check all sub-paths for existing
+        locks.
+        :param tokenOnly: True: only a list of token is returned.
+        :return: list of valid lock dictionaries (may be empty), or of tokens
+        """
+        assert path and path.startswith('/')
         assert includeRoot or includeChildren
 
-        def __appendLocks(toklist):
-            # Since we can do this quickly, we use self.get() even if
-            # tokenOnly is set, so expired locks are purged.
-            for token in toklist:
-                lock_db = self.get_lock_db_from_token(token)
-                if lock_db:
-                    if tokenOnly:
-                        lockList.append(lock_db.token)
-                    else:
-                        lockList.append(from_base_to_dict(lock_db))
-
         path = normalizeLockRoot(path)
-        self._lock.acquireRead()
-        try:
-            tokList = self._session.query(Url2Token.token).filter(Url2Token.path == path).all()
-            lockList = []
-            if includeRoot:
-                __appendLocks(tokList)
-
-            if includeChildren:
-                for url, in self._session.query(Url2Token.path).group_by(Url2Token.path):
-                    if util.isChildUri(path, url):
-                        __appendLocks(self._session.query(Url2Token.token).filter(Url2Token.path == url))
-
-            return lockList
-        finally:
-            self._lock.release()
\ No newline at end of file
+        root_filters = []
+        if includeRoot:
+            root_filters.append(WebdavLock.root == path)
+        if includeChildren:
+            root_filters.append(self._children_filter(path))
+
+        with self._session() as session:
+            query = session.query(WebdavLock) \
+                .filter(or_(*root_filters)) \
+                .filter(self._valid_lock_filter(time.time()))
+            if tokenOnly:
+                return [
+                    token for token, in query.with_entities(WebdavLock.token)
+                ]
+            return [from_base_to_dict(lock_db) for lock_db in query]
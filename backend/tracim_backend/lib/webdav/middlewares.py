@@ -10,8 +10,6 @@ import transaction
 import yaml
 from pyramid.paster import get_appsettings
 from pyramid.registry import Registry
-from pyramid.threadlocal import get_current_registry
-from pyramid_ldap3 import ConnectionManager
 from pyramid_ldap3 import Connector
 from pyramid_ldap3 import _LDAPQuery
 from wsgidav import compat
@@ -20,7 +18,9 @@ from wsgidav.middleware import BaseMiddleware
 
 from tracim_backend.config import CFG
 from tracim_backend.lib.core.user import UserApi
+from tracim_backend.lib.utils.translation import preload_translation_catalogs
 from tracim_backend.lib.webdav.dav_provider import WebdavTracimContext
+from tracim_backend.lib.webdav.ldap_pool import PooledLDAPConnectionManager
 from tracim_backend.models.auth import AuthType
 from tracim_backend.models.setup_models import get_engine
 from tracim_backend.models.setup_models import get_scoped_session_factory
@@ -271,6 +271,13 @@ class TracimEnv(BaseMiddleware):
         self.session_factory = get_scoped_session_factory(self.engine)
         self.app_config = CFG(self.settings)
         self.app_config.configure_filedepot()
+        preload_translation_catalogs(self.app_config)
+        # INFO - G.M - 2019-04-19 - ldap connection manager live as long as
+        # the webdav app, its connections are shared by all requests.
+        self.registry = Registry('tracim_webdav')
+        self.registry.ldap_connector = None
+        if AuthType.LDAP in self.app_config.AUTH_TYPES:
+            self.registry = self.setup_ldap(self.registry, self.app_config)
 
     def __call__(self, environ, start_response):
         # TODO - G.M - 18-05-2018 - This code should not create trouble
@@ -278,11 +285,7 @@ class TracimEnv(BaseMiddleware):
         # see https://github.com/tracim/tracim_backend/issues/62
         tm = transaction.manager
         session = get_tm_session(self.session_factory, tm)
-        registry = get_current_registry()
-        registry.ldap_connector = None
-        if AuthType.LDAP in self.app_config.AUTH_TYPES:
-            registry = self.setup_ldap(registry, self.app_config)
-        environ['tracim_registry'] =  registry
+        environ['tracim_registry'] = self.registry
         environ['tracim_context'] = WebdavTracimContext(environ, self.app_config, session)
         try:
             app = self._application(environ, start_response)
@@ -295,7 +298,7 @@ class TracimEnv(BaseMiddleware):
         return app
 
     def setup_ldap(self, registry: Registry, app_config: CFG):
-        manager = ConnectionManager(
+        manager = PooledLDAPConnectionManager(
             uri=app_config.LDAP_URL,
             bind=app_config.LDAP_BIND_DN,
             passwd=app_config.LDAP_BIND_PASS,
@@ -1,5 +1,6 @@
 # coding: utf8
 import functools
+import hashlib
 import logging
 import os
 import re
@@ -46,6 +47,8 @@ from tracim_backend.lib.webdav.design import design_page
 from tracim_backend.lib.webdav.design import design_thread
 from tracim_backend.lib.webdav.utils import FakeFileStream
 from tracim_backend.lib.webdav.utils import HistoryType
+from tracim_backend.lib.webdav.utils import open_depot_file
+from tracim_backend.models.context_models import ContentInContextLoader
 from tracim_backend.models.data import ActionDescription
 from tracim_backend.models.data import Content
 from tracim_backend.models.data import ContentRevisionRO
@@ -64,9 +67,7 @@ def webdav_check_right(authorization_checker: AuthorizationChecker):
         def wrapper(self: '_DAVResource', *arg, **kwarg) -> typing.Callable:
             tracim_context = self.tracim_context # type: WebdavTracimContext
             try:
-                authorization_checker.check(
-                    tracim_context=self.tracim_context,
-                )
+                tracim_context.check_authorization(authorization_checker)
             except TracimException as exc:
                 raise DAVError(HTTP_FORBIDDEN) from exc
             return func(self, *arg, **kwarg)
@@ -335,7 +336,8 @@ class WorkspaceResource(DAVCollection):
             workspace=self.workspace,
             content=content,
             parent=self.content,
-            path=self.path + '/' + fixed_file_name
+            path=self.path + '/' + fixed_file_name,
+            spool_max_size=self.tracim_context.app_config.WEBDAV_SPOOL_MAX_SIZE,  # nopep8
         )
 
     @webdav_check_right(is_content_manager)
@@ -408,44 +410,101 @@ class WorkspaceResource(DAVCollection):
                 raise DAVError(HTTP_FORBIDDEN)
 
     def getMemberList(self) -> [_DAVResource]:
-        members = []
-
         children = self.content_api.get_all(False, content_type_list.Any_SLUG, self.workspace)
+        return self._get_members(children)
+
+    def _get_members(
+            self,
+            children: typing.List[Content],
+            content_api: ContentApi = None,
+    ) -> [_DAVResource]:
+        """
+        Get resources of given children contents. PROPFIND of a collection
+        read properties of all its members: all members share one ContentApi
+        and size of files and comments of threads are loaded for all children
+        with one query each instead of one (or more) per member.
+        :param children: children contents
+        :param content_api: ContentApi shared by members, default one if None
+        """
+        members = []
+        content_api = content_api or ContentApi(
+            current_user=self.user,
+            config=self.tracim_context.app_config,
+            session=self.session,
+        )
+        content_loader = ContentInContextLoader(
+            children,
+            self.session,
+            self.tracim_context.app_config,
+            self.user,
+        )
+        threads_comments = self._get_threads_comments(content_api, children)
 
         for content in children:
             content_path = '%s/%s' % (self.path, webdav_convert_file_name_to_display(content.file_name))
 
-            if content.type == content_type_list.Folder.slug:
-                members.append(
-                    FolderResource(
-                        path=content_path,
-                        environ=self.environ,
-                        workspace=self.workspace,
-                        content=content,
-                        tracim_context=self.tracim_context
-                    )
-                )
-            elif content.type == content_type_list.File.slug:
-                self._file_count += 1
-                members.append(
-                    FileResource(
-                        path=content_path,
-                        environ=self.environ,
-                        content=content,
-                        tracim_context=self.tracim_context
+            try:
+                if content.type == content_type_list.Folder.slug:
+                    members.append(
+                        FolderResource(
+                            path=content_path,
+                            environ=self.environ,
+                            workspace=self.workspace,
+                            content=content,
+                            tracim_context=self.tracim_context
+                        )
                     )
-                )
-            else:
-                self._file_count += 1
-                members.append(
-                    OtherFileResource(
-                        content_path,
-                        self.environ,
-                        content,
-                        tracim_context=self.tracim_context
-                    ))
+                elif content.type == content_type_list.File.slug:
+                    self._file_count += 1
+                    members.append(
+                        FileResource(
+                            path=content_path,
+                            environ=self.environ,
+                            content=content,
+                            tracim_context=self.tracim_context,
+                            content_api=content_api,
+                            content_loader=content_loader,
+                        ))
+                else:
+                    self._file_count += 1
+                    members.append(
+                        OtherFileResource(
+                            path=content_path,
+                            environ=self.environ,
+                            content=content,
+                            tracim_context=self.tracim_context,
+                            content_api=content_api,
+                            comments=threads_comments.get(content.content_id),
+                        ))
+            except NotImplementedError as exc:
+                pass
+
         return members
 
+    def _get_threads_comments(
+            self,
+            content_api: ContentApi,
+            children: typing.List[Content],
+    ) -> typing.Dict[int, typing.List[Content]]:
+        """
+        :return: comments of threads of given contents, by thread content_id
+        """
+        thread_ids = [
+            content.content_id for content in children
+            if content.type == content_type_list.Thread.slug
+        ]
+        threads_comments = {
+            thread_id: [] for thread_id in thread_ids
+        }
+        if not thread_ids:
+            return threads_comments
+        for comment in content_api.get_all(
+            thread_ids,
+            content_type_list.Comment.slug,
+        ):
+            threads_comments[comment.parent_id].append(comment)
+        return threads_comments
+
 
 class FolderResource(WorkspaceResource):
     """
@@ -618,10 +677,9 @@ class FolderResource(WorkspaceResource):
 
     @webdav_check_right(is_reader)
     def getMemberList(self) -> [_DAVResource]:
-        members = []
         content_api = ContentApi(
             current_user=self.user,
-            config=self.provider.app_config,
+            config=self.tracim_context.app_config,
             session=self.session,
         )
         visible_children = content_api.get_all(
@@ -629,43 +687,7 @@ class FolderResource(WorkspaceResource):
             content_type_list.Any_SLUG,
             self.workspace,
         )
-
-        for content in visible_children:
-            content_path = '%s/%s' % (self.path, webdav_convert_file_name_to_display(content.file_name))
-
-            try:
-                if content.type == content_type_list.Folder.slug:
-                    members.append(
-                        FolderResource(
-                            path=content_path,
-                            environ=self.environ,
-                            workspace=self.workspace,
-                            content=content,
-                            tracim_context=self.tracim_context
-                        )
-                    )
-                elif content.type == content_type_list.File.slug:
-                    self._file_count += 1
-                    members.append(
-                        FileResource(
-                            path=content_path,
-                            environ=self.environ,
-                            content=content,
-                            tracim_context=self.tracim_context
-                        ))
-                else:
-                    self._file_count += 1
-                    members.append(
-                        OtherFileResource(
-                            path=content_path,
-                            environ=self.environ,
-                            content=content,
-                            tracim_context=self.tracim_context
-                        ))
-            except NotImplementedError as exc:
-                pass
-
-        return members
+        return self._get_members(visible_children, content_api)
 
 
 class FileResource(DAVNonCollection):
@@ -677,18 +699,27 @@ class FileResource(DAVNonCollection):
             path: str,
             environ: dict,
             content: Content,
-            tracim_context: 'WebdavTracimContext'
+            tracim_context: 'WebdavTracimContext',
+            content_api: ContentApi = None,
+            content_loader: ContentInContextLoader = None,
     ) -> None:
+        """
+        :param content_api: ContentApi shared with other resources, default
+        one if None
+        :param content_loader: batch loader of contents listed with this one,
+        used to get file size without reading depot file metadata.
+        """
         super(FileResource, self).__init__(path, environ)
         self.tracim_context = tracim_context
         self.content = content
         self.user = tracim_context.current_user
         self.session = tracim_context.dbsession
-        self.content_api = ContentApi(
+        self.content_api = content_api or ContentApi(
             current_user=self.user,
             config=tracim_context.app_config,
             session=self.session,
         )
+        self._content_loader = content_loader
 
         # this is the property that windows client except to check if the file is read-write or read-only,
         # but i wasn't able to set this property so you'll have to look into it >.>
@@ -699,6 +730,10 @@ class FileResource(DAVNonCollection):
 
     @webdav_check_right(is_reader)
     def getContentLength(self) -> int:
+        if self._content_loader:
+            size = self._content_loader.get_size(self.content)
+            if size is not None:
+                return size
         return self.content.depot_file.file.content_length
 
     @webdav_check_right(is_reader)
@@ -724,12 +759,20 @@ class FileResource(DAVNonCollection):
         return mktime(self.content.updated.timetuple())
 
     @webdav_check_right(is_reader)
-    def getContent(self) -> typing.BinaryIO:
-        filestream = compat.BytesIO()
-        filestream.write(self.content.depot_file.file.read())
-        filestream.seek(0)
+    def getEtag(self) -> str:
+        # INFO - G.M - 2019-04-03 - depot files are content-addressed blobs,
+        # so the file id change only when the file content change.
+        return self.content.depot_file.file_id
 
-        return filestream
+    def supportRanges(self) -> bool:
+        return True
+
+    @webdav_check_right(is_reader)
+    def getContent(self) -> typing.BinaryIO:
+        return open_depot_file(
+            self.content.depot_file.file,
+            block_size=self.tracim_context.app_config.WEBDAV_BLOCK_SIZE,
+        )
 
     def beginWrite(self, contentType: str=None) -> FakeFileStream:
         return FakeFileStream(
@@ -739,6 +782,7 @@ class FileResource(DAVNonCollection):
             workspace=self.content.workspace,
             path=self.path,
             session=self.session,
+            spool_max_size=self.tracim_context.app_config.WEBDAV_SPOOL_MAX_SIZE,  # nopep8
         )
 
 
@@ -949,12 +993,31 @@ class OtherFileResource(FileResource):
     """
     FileResource resource corresponding to tracim's page and thread
     """
-    def __init__(self, path: str, environ: dict, content: Content, tracim_context: 'WebdavTracimContext'):
-        super(OtherFileResource, self).__init__(path, environ, content, tracim_context=tracim_context)
+    def __init__(
+            self,
+            path: str,
+            environ: dict,
+            content: Content,
+            tracim_context: 'WebdavTracimContext',
+            content_api: ContentApi = None,
+            comments: typing.List[Content] = None,
+    ):
+        """
+        :param comments: already loaded comments of thread, loaded by design
+        if None
+        """
+        super(OtherFileResource, self).__init__(
+            path,
+            environ,
+            content,
+            tracim_context=tracim_context,
+            content_api=content_api,
+        )
 
         self.content_revision = self.content.revision
+        self._comments = comments
 
-        self.content_designed = self.design()
+        self.content_designed = self.design().encode('utf-8')
 
         # workaround for consistent request as we have to return a resource with a path ending with .html
         # when entering folder for windows, but only once because when we select it again it would have .html.html
@@ -982,12 +1045,12 @@ class OtherFileResource(FileResource):
         return 'text/html; charset=utf-8'
 
     @webdav_check_right(is_reader)
-    def getContent(self):
-        filestream = compat.BytesIO()
+    def getEtag(self) -> str:
+        return hashlib.sha256(self.content_designed).hexdigest()
 
-        filestream.write(bytes(self.content_designed, 'utf-8'))
-        filestream.seek(0)
-        return filestream
+    @webdav_check_right(is_reader)
+    def getContent(self):
+        return compat.BytesIO(self.content_designed)
 
     @webdav_check_right(is_reader)
     def getDisplayInfo(self):
@@ -1005,10 +1068,13 @@ class OtherFileResource(FileResource):
             content_type_list.get_one_by_slug(self.content.type) ==
             content_type_list.Thread
         ):
+            comments = self._comments
+            if comments is None:
+                comments = self.content_api.get_all(
+                    [self.content.content_id], content_type_list.Comment.slug
+                )
             return design_thread(
                 self.content,
                 self.content_revision,
-                self.content_api.get_all(
-                    [self.content.content_id], content_type_list.Comment.slug
-                )
+                comments,
             )
@@ -1,13 +1,19 @@
 # -*- coding: utf-8 -*-
+import hashlib
+import io
+import os
+import typing
+from tempfile import SpooledTemporaryFile
 
 import transaction
+from depot.io.interfaces import StoredFile
+from depot.io.local import LocalStoredFile
 
 from sqlalchemy.orm import Session
 from wsgidav.dav_error import DAVError, HTTP_FORBIDDEN
 
 from tracim_backend.app_models.contents import content_type_list
 from wsgidav import util
-from wsgidav import compat
 
 from tracim_backend.exceptions import TracimException
 from tracim_backend.lib.core.content import ContentApi
@@ -30,6 +36,81 @@ class SpecialFolderExtension(object):
     History = '/.history'
 
 
+class DepotFileStream(io.RawIOBase):
+    """
+    Read-only stream over a depot stored file, given to wsgidav on GET.
+
+    wsgidav reads the returned file object in WEBDAV_BLOCK_SIZE chunks and
+    seeks it to the range start when answering a Range request, so the file
+    content is never loaded in memory at once. Storages that are not seekable
+    are seeked forward by reading and dropping blocks.
+    """
+
+    def __init__(self, stored_file: StoredFile, block_size: int) -> None:
+        super().__init__()
+        self._stored_file = stored_file
+        self._block_size = block_size
+        self._position = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._position
+
+    def read(self, size: int = -1) -> bytes:
+        data = self._stored_file.read(size)
+        self._position += len(data)
+        return data
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence != io.SEEK_SET:
+            raise io.UnsupportedOperation('only forward seek is supported')
+        if offset < self._position:
+            raise io.UnsupportedOperation('only forward seek is supported')
+        while self._position < offset:
+            if not self.read(min(self._block_size, offset - self._position)):
+                break
+        return self._position
+
+    def close(self) -> None:
+        if not self.closed:
+            self._stored_file.close()
+        super().close()
+
+
+def open_depot_file(
+        stored_file: StoredFile,
+        block_size: int
+) -> typing.BinaryIO:
+    """
+    Open a depot stored file for streaming.
+    :param stored_file: depot stored file, as given by depot_file.file
+    :param block_size: size of blocks used to seek forward when the storage
+    is not seekable.
+    :return: a readable and seekable binary file object
+    """
+    # INFO - G.M - 2019-04-03 - depot StoredFile API is not seekable. Only
+    # LocalFileStorage keep files on disk, opening it directly give a real
+    # seekable file object. Its path is not part of depot public API
+    # (checked with depot 0.5.2): if it is not available, or with other
+    # storages, fallback on forward only stream.
+    if isinstance(stored_file, LocalStoredFile):
+        file_path = getattr(stored_file, '_file_path', None)
+        if file_path and os.path.isfile(file_path):
+            return open(file_path, 'rb')
+    return DepotFileStream(stored_file, block_size)
+
+
+# INFO - G.M - 2019-04-04 - 1 MiB
+DEFAULT_SPOOL_MAX_SIZE = 1024 * 1024
+
+
 class FakeFileStream(object):
     """
     Fake a FileStream that we're giving to wsgidav to receive data and create files / new revisions
@@ -43,6 +124,11 @@ class FakeFileStream(object):
     In the first case scenario, the transfer takes two part : it first create the resource (createEmptyResource)
     then add its content (beginWrite, write, close..). If we went without this class, we would create two revision
     of the file upon creating a new file, which is not what we want.
+
+    Received data is spooled in a SpooledTemporaryFile: it's kept in memory
+    up to spool_max_size bytes then written on disk. Data is hashed while
+    written, so depot blob lookup doesn't read the file again, and the spooled
+    file is given as is to depot which copy it by blocks.
     """
 
     def __init__(
@@ -53,7 +139,8 @@ class FakeFileStream(object):
             path: str,
             file_name: str='',
             content: Content=None,
-            parent: Content=None
+            parent: Content=None,
+            spool_max_size: int=DEFAULT_SPOOL_MAX_SIZE,
     ):
         """
 
@@ -63,8 +150,12 @@ class FakeFileStream(object):
         :param file_name:
         :param content:
         :param parent:
+        :param spool_max_size: max size in bytes of received data kept in
+        memory, bigger files are written in a temporary file on disk.
         """
-        self._file_stream = compat.BytesIO()
+        self._file_stream = SpooledTemporaryFile(max_size=spool_max_size)
+        self._file_hash = hashlib.sha256()
+        self._file_size = 0
         self._session = session
         self._file_name = file_name if file_name != '' else self._content.file_name
         self._content = content
@@ -95,11 +186,13 @@ class FakeFileStream(object):
         """
         pass
 
-    def write(self, s: str):
+    def write(self, s: bytes):
         """
         Called by request_server when writing content to files, we put it inside a filestream
         """
         self._file_stream.write(s)
+        self._file_hash.update(s)
+        self._file_size += len(s)
 
     def close(self):
         """
@@ -109,12 +202,15 @@ class FakeFileStream(object):
 
         self._file_stream.seek(0)
 
-        if self._content is None:
-            self.create_file()
-        else:
-            self.update_file()
+        try:
+            if self._content is None:
+                self.create_file()
+            else:
+                self.update_file()
 
-        transaction.commit()
+            transaction.commit()
+        finally:
+            self._file_stream.close()
 
     def create_file(self):
         """
@@ -136,7 +232,9 @@ class FakeFileStream(object):
                     file,
                     self._file_name,
                     util.guessMimeType(self._file_name),
-                    self._file_stream.read()
+                    self._file_stream,
+                    new_content_hash=self._file_hash.hexdigest(),
+                    new_content_size=self._file_size,
                 )
         except TracimException as exc:
             raise DAVError(HTTP_FORBIDDEN) from exc
@@ -156,7 +254,9 @@ class FakeFileStream(object):
                     self._content,
                     self._file_name,
                     util.guessMimeType(self._content.file_name),
-                    self._file_stream.read()
+                    self._file_stream,
+                    new_content_hash=self._file_hash.hexdigest(),
+                    new_content_size=self._file_size,
                 )
         except TracimException as exc:
             raise DAVError(HTTP_FORBIDDEN) from exc
@@ -0,0 +1,71 @@
+"""add content current_revision_id
+
+Revision ID: d7162501739f
+Revises: 72b408143282
+Create Date: 2019-04-02 11:05:17.448102
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'd7162501739f'
+down_revision = '72b408143282'
+
+content = sa.Table(
+    'content',
+    sa.MetaData(),
+    sa.Column('id', sa.Integer, primary_key=True),
+    sa.Column('current_revision_id', sa.Integer, nullable=True),
+)
+
+content_revisions = sa.Table(
+    'content_revisions',
+    sa.MetaData(),
+    sa.Column('revision_id', sa.Integer, primary_key=True),
+    sa.Column('content_id', sa.Integer),
+)
+
+
+def upgrade():
+    with op.batch_alter_table('content') as batch_op:
+        batch_op.add_column(
+            sa.Column('current_revision_id', sa.Integer(), nullable=True)
+        )
+
+    # INFO - G.M - 2019-04-02 - Backfill current revision of existing
+    # contents: the current revision is the one with the highest revision_id
+    connection = op.get_bind()
+    connection.execute(
+        content.update().values(
+            current_revision_id=sa.select(
+                [sa.func.max(content_revisions.c.revision_id)]
+            ).where(
+                content_revisions.c.content_id == content.c.id
+            ).as_scalar()
+        )
+    )
+
+    with op.batch_alter_table('content') as batch_op:
+        batch_op.create_index(
+            'idx__content__current_revision_id',
+            ['current_revision_id'],
+            unique=False
+        )
+        batch_op.create_foreign_key(
+            batch_op.f('fk_content_current_revision_id_content_revisions'),
+            'content_revisions',
+            ['current_revision_id'],
+            ['revision_id'],
+            ondelete='SET NULL'
+        )
+
+
+def downgrade():
+    with op.batch_alter_table('content') as batch_op:
+        batch_op.drop_constraint(
+            'fk_content_current_revision_id_content_revisions',
+            type_='foreignkey'
+        )
+        batch_op.drop_index('idx__content__current_revision_id')
+        batch_op.drop_column('current_revision_id')
@@ -6,6 +6,7 @@ from datetime import datetime
 from enum import Enum
 
 from slugify import slugify
+from sqlalchemy import func
 from sqlalchemy.orm import Session
 
 from tracim_backend.app_models.contents import content_type_list
@@ -27,6 +28,9 @@ from tracim_backend.models.auth import Profile
 from tracim_backend.models.auth import User
 from tracim_backend.models.data import Content
 from tracim_backend.models.data import ContentRevisionRO
+from tracim_backend.models.data import DepotBlob
+from tracim_backend.models.data import RevisionPreviewMetadata
+from tracim_backend.models.data import RevisionReadStatus
 from tracim_backend.models.data import UserRoleInWorkspace
 from tracim_backend.models.data import Workspace
 from tracim_backend.models.roles import WorkspaceRoles
@@ -791,16 +795,235 @@ class UserRoleWorkspaceInContext(object):
         )
 
 
+class ContentInContextLoader(object):
+    """
+    Batch loader of data related to a list of contents. Each kind of data
+    (authors, read status, size...) is loaded for the whole list with a
+    constant number of queries the first time it is needed, then
+    ContentInContext read it from prefetched maps.
+    """
+
+    def __init__(
+            self,
+            contents: typing.List[Content],
+            dbsession: Session,
+            config: CFG,
+            user: User=None
+    ) -> None:
+        self.contents = contents
+        self.dbsession = dbsession
+        self.config = config
+        self._user = user
+        self._content_api = None
+        self._users = None  # type: typing.Dict[int, User]
+        self._author_ids = None  # type: typing.Dict[int, int]
+        self._unread_content_ids = None  # type: typing.Set[int]
+        self._sizes = None  # type: typing.Dict[int, int]
+        self._previews_metadata = None  # type: typing.Dict[int, RevisionPreviewMetadata]  # nopep8
+
+    @property
+    def content_api(self) -> 'ContentApi':
+        """
+        ContentApi shared by all contents of the list
+        """
+        if not self._content_api:
+            from tracim_backend.lib.core.content import ContentApi
+            self._content_api = ContentApi(
+                current_user=self._user,
+                session=self.dbsession,
+                config=self.config,
+                show_deleted=True,
+                show_archived=True,
+                show_active=True,
+                show_temporary=True,
+            )
+        return self._content_api
+
+    def _load_users(self) -> None:
+        """
+        Load authors (owner of first revision) and last modifiers (owner of
+        current revision) of all contents.
+        """
+        self._author_ids = {}
+        self._users = {}
+        content_ids = [content.content_id for content in self.contents]
+        if not content_ids:
+            return
+        first_revision_ids = self.dbsession.query(
+            func.min(ContentRevisionRO.revision_id)
+        ).filter(
+            ContentRevisionRO.content_id.in_(content_ids)
+        ).group_by(ContentRevisionRO.content_id)
+        self._author_ids = dict(
+            self.dbsession.query(
+                ContentRevisionRO.content_id,
+                ContentRevisionRO.owner_id,
+            ).filter(
+                ContentRevisionRO.revision_id.in_(first_revision_ids.subquery())
+            )
+        )
+        user_ids = set(self._author_ids.values())
+        user_ids.update(content.revision.owner_id for content in self.contents)
+        self._users = {
+            user.user_id: user
+            for user in self.dbsession.query(User).filter(
+                User.user_id.in_(user_ids)
+            )
+        }
+
+    def get_author(self, content: Content) -> User:
+        if self._users is None:
+            self._load_users()
+        return self._users[self._author_ids[content.content_id]]
+
+    def get_last_modifier(self, content: Content) -> User:
+        if self._users is None:
+            self._load_users()
+        return self._users[content.revision.owner_id]
+
+    def _load_read_status(self) -> None:
+        """
+        Same rules as Content.has_new_information_for(): a content is unread
+        if its current revision is not read by user or if one of its valid
+        descendants is unread. Descendants are loaded level by level, so
+        number of queries depend on tree depth, not on number of contents.
+        """
+        self._unread_content_ids = set()
+        # INFO - G.M - 2019-04-04 - contents to check, with content_ids of
+        # listed contents they are related to.
+        roots_by_content_id = {
+            content.content_id: {content.content_id}
+            for content in self.contents
+        }
+        contents = list(self.contents)
+        while contents:
+            read_revision_ids = set(
+                revision_id for revision_id, in self.dbsession.query(
+                    RevisionReadStatus.revision_id
+                ).filter(
+                    RevisionReadStatus.user_id == self._user.user_id,
+                    RevisionReadStatus.revision_id.in_(
+                        [content.revision_id for content in contents]
+                    )
+                )
+            )
+            parent_ids = []
+            for content in contents:
+                roots = roots_by_content_id[content.content_id] - self._unread_content_ids  # nopep8
+                if not roots:
+                    continue
+                if content.revision_id not in read_revision_ids:
+                    self._unread_content_ids.update(roots)
+                else:
+                    parent_ids.append(content.content_id)
+
+            children_by_parent = Content.get_children_by_parent(
+                self.dbsession,
+                parent_ids
+            )
+            next_roots_by_content_id = {}
+            contents = []
+            for parent_id, children in children_by_parent.items():
+                for child in children:
+                    if child.is_deleted or child.is_archived:
+                        continue
+                    if child.content_id not in next_roots_by_content_id:
+                        next_roots_by_content_id[child.content_id] = set()
+                        contents.append(child)
+                    next_roots_by_content_id[child.content_id].update(
+                        roots_by_content_id[parent_id]
+                    )
+            roots_by_content_id = next_roots_by_content_id
+
+    def is_read_by_user(self, content: Content) -> bool:
+        if self._unread_content_ids is None:
+            self._load_read_status()
+        return content.content_id not in self._unread_content_ids
+
+    def _load_sizes(self) -> None:
+        """
+        Load size of files of contents from their depot blob, this avoid to
+        stat each file in depot.
+        """
+        self._sizes = {}
+        blob_hashes = set(
+            content.revision.blob_hash for content in self.contents
+            if content.revision.blob_hash
+        )
+        if not blob_hashes:
+            return
+        sizes_by_blob_hash = dict(
+            self.dbsession.query(DepotBlob.blob_hash, DepotBlob.size).filter(
+                DepotBlob.blob_hash.in_(blob_hashes)
+            )
+        )
+        for content in self.contents:
+            if content.revision.blob_hash in sizes_by_blob_hash:
+                self._sizes[content.content_id] = sizes_by_blob_hash[content.revision.blob_hash]  # nopep8
+
+    def get_size(self, content: Content) -> typing.Optional[int]:
+        """
+        :return: size of content file if known from depot blob, else None
+        """
+        if self._sizes is None:
+            self._load_sizes()
+        return self._sizes.get(content.content_id)
+
+    def _load_previews_metadata(self) -> None:
+        """
+        Load preview metadata of current revision of all file contents.
+        """
+        self._previews_metadata = self.content_api.get_previews_metadata([
+            (content.revision_id, content.file_extension)
+            for content in self.contents
+            if content.depot_file
+        ])
+
+    def get_preview_metadata(
+            self,
+            content: Content
+    ) -> typing.Optional[RevisionPreviewMetadata]:
+        """
+        :return: preview metadata of current revision of content, None if
+        unavailable
+        """
+        if self._previews_metadata is None:
+            self._load_previews_metadata()
+        return self._previews_metadata.get(content.revision_id)
+
+
 class ContentInContext(object):
     """
     Interface to get Content data and Content data related to context.
     """
 
-    def __init__(self, content: Content, dbsession: Session, config: CFG, user: User=None) -> None:  # nopep8
+    def __init__(
+            self,
+            content: Content,
+            dbsession: Session,
+            config: CFG,
+            user: User=None,
+            loader: ContentInContextLoader=None,
+    ) -> None:
         self.content = content
         self.dbsession = dbsession
         self.config = config
         self._user = user
+        self._loader = loader
+
+    def _get_content_api(self) -> 'ContentApi':
+        if self._loader:
+            return self._loader.content_api
+        from tracim_backend.lib.core.content import ContentApi
+        return ContentApi(
+            current_user=self._user,
+            session=self.dbsession,
+            config=self.config,
+            show_deleted=True,
+            show_archived=True,
+            show_active=True,
+            show_temporary=True,
+        )
 
     # Default
     @property
@@ -845,16 +1068,7 @@ class ContentInContext(object):
 
     @property
     def is_editable(self) -> bool:
-        from tracim_backend.lib.core.content import ContentApi
-        content_api = ContentApi(
-            current_user=self._user,
-            session=self.dbsession,
-            config=self.config,
-            show_deleted=True,
-            show_archived=True,
-            show_active=True,
-            show_temporary=True,
-        )
+        content_api = self._get_content_api()
         return content_api.is_editable(self.content)
 
     @property
@@ -863,10 +1077,14 @@ class ContentInContext(object):
 
     @property
     def author(self) -> UserInContext:
+        if self._loader:
+            author = self._loader.get_author(self.content)
+        else:
+            author = self.content.first_revision.owner
         return UserInContext(
             dbsession=self.dbsession,
             config=self.config,
-            user=self.content.first_revision.owner
+            user=author
         )
 
     @property
@@ -887,10 +1105,14 @@ class ContentInContext(object):
 
     @property
     def last_modifier(self) -> UserInContext:
+        if self._loader:
+            last_modifier = self._loader.get_last_modifier(self.content)
+        else:
+            last_modifier = self.content.last_revision.owner
         return UserInContext(
             dbsession=self.dbsession,
             config=self.config,
-            user=self.content.last_revision.owner
+            user=last_modifier
         )
 
     # Context-related
@@ -910,6 +1132,8 @@ class ContentInContext(object):
     @property
     def read_by_user(self) -> bool:
         assert self._user
+        if self._loader:
+            return self._loader.is_read_by_user(self.content)
         return not self.content.has_new_information_for(self._user)
 
     @property
@@ -929,16 +1153,10 @@ class ContentInContext(object):
         :return: page_nb of content if available, None if unavailable
         """
         if self.content.depot_file:
-            from tracim_backend.lib.core.content import ContentApi
-            content_api = ContentApi(
-                current_user=self._user,
-                session=self.dbsession,
-                config=self.config,
-                show_deleted=True,
-                show_archived=True,
-                show_active=True,
-                show_temporary=True,
-            )
+            if self._loader:
+                metadata = self._loader.get_preview_metadata(self.content)
+                return metadata.page_nb if metadata else None
+            content_api = self._get_content_api()
             return content_api.get_preview_page_nb(
                 self.content.revision_id,
                 file_extension=self.content.file_extension
@@ -960,6 +1178,10 @@ class ContentInContext(object):
         """
         if not self.content.depot_file:
             return None
+        if self._loader:
+            size = self._loader.get_size(self.content)
+            if size is not None:
+                return size
         try:
             return self.content.depot_file.file.content_length
         except IOError as e:
@@ -985,16 +1207,10 @@ class ContentInContext(object):
         if not self.content.depot_file:
             return False
 
-        from tracim_backend.lib.core.content import ContentApi
-        content_api = ContentApi(
-            current_user=self._user,
-            session=self.dbsession,
-            config=self.config,
-            show_deleted=True,
-            show_archived=True,
-            show_active=True,
-            show_temporary=True,
-        )
+        if self._loader:
+            metadata = self._loader.get_preview_metadata(self.content)
+            return metadata.has_pdf_preview if metadata else False
+        content_api = self._get_content_api()
         return content_api.has_pdf_preview(
             self.content.revision_id,
             file_extension=self.content.file_extension
@@ -1008,16 +1224,10 @@ class ContentInContext(object):
         if not self.content.depot_file:
             return False
 
-        from tracim_backend.lib.core.content import ContentApi
-        content_api = ContentApi(
-            current_user=self._user,
-            session=self.dbsession,
-            config=self.config,
-            show_deleted=True,
-            show_archived=True,
-            show_active=True,
-            show_temporary=True,
-        )
+        if self._loader:
+            metadata = self._loader.get_preview_metadata(self.content)
+            return metadata.has_jpeg_preview if metadata else False
+        content_api = self._get_content_api()
         return content_api.has_jpeg_preview(
             self.content.revision_id,
             file_extension=self.content.file_extension
@@ -10,25 +10,32 @@ from bs4 import BeautifulSoup
 from depot.fields.sqlalchemy import UploadedFileField
 from depot.fields.upload import UploadedFile
 from depot.io.utils import FileIntent
+from depot.manager import DepotManager
 from sqlalchemy import Column
 from sqlalchemy import ForeignKey
 from sqlalchemy import Index
 from sqlalchemy import Sequence
 from sqlalchemy import and_
-from sqlalchemy import func
 from sqlalchemy import inspect
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.associationproxy import association_proxy
 from sqlalchemy.ext.hybrid import hybrid_property
+from sqlalchemy.orm import Query
 from sqlalchemy.orm import backref
+from sqlalchemy.orm import contains_eager
+from sqlalchemy.orm import make_transient_to_detached
 from sqlalchemy.orm import object_session
 from sqlalchemy.orm import relationship
+from sqlalchemy.orm import Session
 from sqlalchemy.orm.attributes import InstrumentedAttribute
 from sqlalchemy.orm.collections import attribute_mapped_collection
 from sqlalchemy.types import Boolean
 from sqlalchemy.types import DateTime
+from sqlalchemy.types import Float
 from sqlalchemy.types import Integer
 from sqlalchemy.types import Text
 from sqlalchemy.types import Unicode
+from zope.sqlalchemy import mark_changed
 
 from tracim_backend.app_models.contents import ContentStatus
 from tracim_backend.app_models.contents import ContentType
@@ -40,6 +47,7 @@ from tracim_backend.exceptions import CopyRevisionAbortedDepotCorrupted
 from tracim_backend.exceptions import NewRevisionAbortedDepotCorrupted
 from tracim_backend.lib.utils.translation import Translator
 from tracim_backend.lib.utils.translation import get_locale
+from tracim_backend.lib.utils.utils import get_file_hash
 from tracim_backend.models.auth import User
 from tracim_backend.models.meta import DeclarativeBase
 from tracim_backend.models.roles import WorkspaceRoles
@@ -564,6 +572,131 @@ class ContentChecker(object):
             return True
 
 
+class DepotBlob(DeclarativeBase):
+    """
+    Content-addressed file stored in depot. Many revisions can share the same
+    blob: a new revision (or a copy) which keep the same bytes than its
+    origin point to the existing blob instead of writing a new depot file.
+
+    Blob own the depot file: depot file is removed when blob is deleted (see
+    tracimcli depot_gc command). Revisions only own a reference to the depot
+    file of the blob, see DepotBlob.get_depot_file_reference.
+    """
+
+    __tablename__ = 'depot_blobs'
+
+    # INFO - G.M - 2019-04-01 - sha256 of file content as hexadecimal string
+    blob_hash = Column(Unicode(64), primary_key=True)
+    depot_file = Column(UploadedFileField, unique=False, nullable=False)
+    size = Column(Integer, unique=False, nullable=False, default=0)
+    # INFO - G.M - 2019-04-01 - number of revisions using this blob, updated
+    # when a revision is attached to blob and recomputed by garbage collector.
+    reference_count = Column(Integer, unique=False, nullable=False, default=0)
+    created = Column(DateTime, unique=False, nullable=False, default=datetime.utcnow)
+
+    @classmethod
+    def get_or_create(
+        cls,
+        session: Session,
+        file_content: typing.Union[bytes, typing.BinaryIO],
+        filename: str,
+        mimetype: str,
+        blob_hash: str = None,
+        size: int = None,
+    ) -> 'DepotBlob':
+        """
+        Return blob matching file_content, store file_content in depot
+        as a new blob only if no blob with same content already exist.
+        :param session: database session
+        :param file_content: bytes or readable and seekable file object
+        :param filename: filename to use if a new depot file is created
+        :param mimetype: mimetype to use if a new depot file is created
+        :param blob_hash: already known hash of file_content
+        :param size: already known size of file_content
+        :return: blob of file_content
+        """
+        if not blob_hash:
+            blob_hash, size = get_file_hash(file_content)
+        blob = session.query(cls).get(blob_hash)
+        if blob:
+            return blob
+        blob = cls(
+            blob_hash=blob_hash,
+            size=size,
+            reference_count=0,
+            created=datetime.utcnow(),
+        )
+        blob.depot_file = FileIntent(file_content, filename, mimetype)
+        # INFO - G.M - 2019-04-01 - row is inserted in a savepoint of the
+        # connection (a session savepoint would flush all pending objects):
+        # if same bytes are uploaded concurrently, insert of one upload fails
+        # without failing its whole transaction.
+        connection = session.connection()
+        try:
+            with connection.begin_nested():
+                connection.execute(cls.__table__.insert().values(
+                    blob_hash=blob.blob_hash,
+                    depot_file=blob.depot_file,
+                    size=blob.size,
+                    reference_count=blob.reference_count,
+                    created=blob.created,
+                ))
+        except IntegrityError:
+            for file_path in blob.depot_file.files:
+                depot_name, file_id = file_path.split('/', 1)
+                DepotManager.get(depot_name).delete(file_id)
+            return session.query(cls).get(blob_hash)
+        # INFO - G.M - 2019-04-01 - insert is done without ORM, tell
+        # transaction manager the session must be committed. Blob is then
+        # attached to session as a persistent object, depot still delete its
+        # file if transaction is rollbacked.
+        mark_changed(session)
+        make_transient_to_detached(blob)
+        session.add(blob)
+        return blob
+
+    @classmethod
+    def adopt(cls, session: Session, depot_file: UploadedFile) -> 'DepotBlob':
+        """
+        Return blob for an already stored depot file which is not related
+        to a blob (file stored before blob storage existence).
+        File is not copied: if no blob exist with same content, new blob only
+        reference the existing depot file without owning it.
+        :param session: database session
+        :param depot_file: depot file to adopt
+        :return: blob of depot_file content
+        """
+        stored_file = depot_file.file
+        blob_hash, size = get_file_hash(stored_file, rewind=False)
+        stored_file.close()
+        blob = session.query(cls).get(blob_hash)
+        if blob:
+            return blob
+        blob = cls(
+            blob_hash=blob_hash,
+            size=size,
+            depot_file=cls._as_reference(depot_file),
+        )
+        session.add(blob)
+        return blob
+
+    @classmethod
+    def _as_reference(cls, depot_file: UploadedFile) -> UploadedFile:
+        # INFO - G.M - 2019-04-01 - depot delete files listed in "files"
+        # when the owner row is deleted or when transaction is rollbacked.
+        # A reference with empty "files" list never delete blob file.
+        reference = dict(depot_file)
+        reference['files'] = []
+        return UploadedFile(reference)
+
+    def get_depot_file_reference(self) -> UploadedFile:
+        """
+        Return depot file usable by a revision, sharing blob file without
+        owning it.
+        """
+        return self._as_reference(self.depot_file)
+
+
 class ContentRevisionRO(DeclarativeBase):
     """
     Revision of Content. It's immutable, update or delete an existing ContentRevisionRO will throw
@@ -590,6 +723,8 @@ class ContentRevisionRO(DeclarativeBase):
     # http://depot.readthedocs.io/en/latest/#attaching-files-to-models
     # http://depot.readthedocs.io/en/latest/api.html#module-depot.fields
     depot_file = Column(UploadedFileField, unique=False, nullable=True)
+    blob_hash = Column(Unicode(64), ForeignKey('depot_blobs.blob_hash'), nullable=True)
+    blob = relationship('DepotBlob', remote_side=[DepotBlob.blob_hash])
     properties = Column('properties', Text(), unique=False, nullable=False, default='')
 
     type = Column(Unicode(32), unique=False, nullable=False)
@@ -613,6 +748,8 @@ class ContentRevisionRO(DeclarativeBase):
 
     """ List of column copied when make a new revision from another """
     _cloned_columns = (
+        'blob',
+        'blob_hash',
         'content_id',
         'created',
         'description',
@@ -678,17 +815,18 @@ class ContentRevisionRO(DeclarativeBase):
         new_rev = cls()
 
         for column_name in cls._cloned_columns:
-            column_value = getattr(revision, column_name)
+            if column_name in ('blob', 'blob_hash'):
+                # INFO - G.M - 2019-04-01 - blob is set with attach_blob(),
+                # which count the reference of new revision.
+                column_value = None
+            else:
+                column_value = getattr(revision, column_name)
             setattr(new_rev, column_name, column_value)
 
         new_rev.updated = datetime.utcnow()
         if revision.depot_file:
             try:
-                new_rev.depot_file = FileIntent(
-                    revision.depot_file.file.read(),
-                    revision.file_name,
-                    revision.file_mimetype,
-                )
+                new_rev.attach_blob(revision.get_or_adopt_blob())
             except IOError as exc:
                 raise NewRevisionAbortedDepotCorrupted(
                     "IOError. Can't create new revision by copying another one "
@@ -715,6 +853,9 @@ class ContentRevisionRO(DeclarativeBase):
                 column_value = copy.copy(parent.id)
             elif column_name == 'parent' and parent:
                 column_value = copy.copy(parent)
+            elif column_name in ('blob', 'blob_hash'):
+                # INFO - G.M - 2019-04-01 - blob is set with attach_blob()
+                continue
             else:
                 column_value = copy.copy(getattr(revision, column_name))
             setattr(copy_rev, column_name, column_value)
@@ -722,11 +863,7 @@ class ContentRevisionRO(DeclarativeBase):
         # copy attached_file
         if revision.depot_file:
             try:
-                copy_rev.depot_file = FileIntent(
-                    revision.depot_file.file.read(),
-                    revision.file_name,
-                    revision.file_mimetype,
-                )
+                copy_rev.attach_blob(revision.get_or_adopt_blob())
             except IOError as exc:
                 raise CopyRevisionAbortedDepotCorrupted(
                     "IOError. Can't create new revision by copying another one"
@@ -736,6 +873,30 @@ class ContentRevisionRO(DeclarativeBase):
                 ) from exc
         return copy_rev
 
+    def get_or_adopt_blob(self) -> DepotBlob:
+        """
+        Return blob of revision file. Revisions created before blob storage
+        have no blob: their file is adopted (hashed, not copied) as a blob.
+        """
+        if self.blob:
+            return self.blob
+        return DepotBlob.adopt(object_session(self), self.depot_file)
+
+    def attach_blob(self, blob: DepotBlob) -> None:
+        """
+        Set revision file as a reference to given blob file. Reference count
+        of blob previously attached to revision, if any, is decreased.
+        :param blob: blob to attach to revision
+        """
+        previous_blob = self.blob
+        self.blob = blob
+        self.depot_file = blob.get_depot_file_reference()
+        if previous_blob is blob:
+            return
+        if previous_blob is not None and previous_blob.reference_count:
+            previous_blob.reference_count -= 1
+        blob.reference_count = (blob.reference_count or 0) + 1
+
     def __setattr__(self, key: str, value: 'mixed'):
         """
         ContentRevisionUpdateError is raised if tried to update column and revision own identity
@@ -794,6 +955,7 @@ class ContentRevisionRO(DeclarativeBase):
 # TODO - G.M - 2018-06-177 - [author] Owner should be renamed "author"
 Index('idx__content_revisions__owner_id', ContentRevisionRO.owner_id)
 Index('idx__content_revisions__parent_id', ContentRevisionRO.parent_id)
+Index('idx__content_revisions__blob_hash', ContentRevisionRO.blob_hash)
 
 
 class Content(DeclarativeBase):
@@ -813,7 +975,8 @@ class Content(DeclarativeBase):
     # QUERY CONTENTS
 
     To query contents you will need to join your content query with ContentRevisionRO. Join
-    condition is available at tracim.lib.content.ContentApi#_get_revision_join:
+    condition (on content.current_revision_id) is available at
+    tracim.lib.content.ContentApi#_get_revision_join:
 
     content = DBSession.query(Content).join(ContentRevisionRO, ContentApi._get_revision_join())
                   .filter(Content.label == 'foo')
@@ -850,6 +1013,24 @@ class Content(DeclarativeBase):
         back_populates="parent",
         order_by='ContentRevisionRO.revision_id',
     )
+    # INFO - G.M - 2019-04-02 - Denormalized pointer to the most recent
+    # revision, kept up to date by new_revision(). It allow to join content
+    # and its current revision with a simple equi-join instead of looking
+    # for the last revision_id of each content.
+    current_revision_id = Column(
+        Integer,
+        ForeignKey(
+            'content_revisions.revision_id',
+            use_alter=True,
+            ondelete='SET NULL',
+        ),
+        nullable=True,
+    )
+    current_revision = relationship(
+        "ContentRevisionRO",
+        foreign_keys=[current_revision_id],
+        post_update=True,
+    )
 
     @hybrid_property
     def content_id(self) -> int:
@@ -1139,21 +1320,57 @@ class Content(DeclarativeBase):
         :return: list of children Content
         :rtype Content
         """
-        # TODO - G.M - 2019-02-08 - Refactor this code to be more efficient
-        all_childrens_revisions = object_session(self).query(ContentRevisionRO).filter( ContentRevisionRO.parent_id == self.content_id).all()
-        children_content_ids = set([cr.content_id for cr in all_childrens_revisions])
-        all_up_to_date_revisions_result = object_session(self).query(
-            func.max(ContentRevisionRO.revision_id)
-        ).filter(ContentRevisionRO.content_id.in_(children_content_ids))\
-            .group_by(ContentRevisionRO.content_id).all()
-
-        all_up_to_date_revisions_ids = [value[0] for value in all_up_to_date_revisions_result]
-        valid_children = []
-        for revision in all_childrens_revisions:
-            if revision.revision_id in all_up_to_date_revisions_ids:
-               valid_children.append(revision.node)
-
-        return valid_children
+        return self.get_children_query(
+            object_session(self),
+            [self.content_id],
+        ).all()
+
+    @classmethod
+    def get_children_query(
+        cls,
+        session: Session,
+        parent_ids: typing.Iterable[int],
+    ) -> Query:
+        """
+        Return query of children Content of given parents. A content is a
+        child of a parent when its current revision is in this parent.
+        Current revision of children are eager loaded.
+        :param session: database session
+        :param parent_ids: content_id of parents
+        :return: children Content query
+        """
+        return session.query(Content).join(
+            ContentRevisionRO,
+            Content.current_revision_id == ContentRevisionRO.revision_id,
+        ).filter(
+            ContentRevisionRO.parent_id.in_(parent_ids)
+        ).options(
+            contains_eager(Content.current_revision)
+        ).order_by(ContentRevisionRO.revision_id)
+
+    @classmethod
+    def get_children_by_parent(
+        cls,
+        session: Session,
+        parent_ids: typing.Iterable[int],
+    ) -> typing.Dict[int, typing.List['Content']]:
+        """
+        Bulk version of Content.children: load children of all given parents
+        with one query.
+        :param session: database session
+        :param parent_ids: content_id of parents
+        :return: dict of children Content list by parent content_id, every
+        given parent_id is a key of the dict.
+        """
+        parent_ids = set(parent_ids)
+        children_by_parent = {
+            parent_id: [] for parent_id in parent_ids
+        }  # type: typing.Dict[int, typing.List['Content']]
+        if not parent_ids:
+            return children_by_parent
+        for child in cls.get_children_query(session, parent_ids):
+            children_by_parent[child.parent_id].append(child)
+        return children_by_parent
 
     @property
     def revision(self) -> ContentRevisionRO:
@@ -1184,6 +1401,11 @@ class Content(DeclarativeBase):
         self.revision.depot_file = value
 
     def get_current_revision(self) -> ContentRevisionRO:
+        # INFO - G.M - 2019-04-03 - Use denormalized current revision when
+        # available, this avoid to load all revisions of the content.
+        if self.current_revision is not None:
+            return self.current_revision
+
         if not self.revisions:
             return self.new_revision()
 
@@ -1203,18 +1425,18 @@ class Content(DeclarativeBase):
         :return:
         """
         if not self.revisions:
-            self.revisions.append(ContentRevisionRO())
-            return self.revisions[0]
-
-        new_rev = ContentRevisionRO.new_from(self.get_current_revision())
+            new_rev = ContentRevisionRO()
+        else:
+            new_rev = ContentRevisionRO.new_from(self.get_current_revision())
         self.revisions.append(new_rev)
+        self.current_revision = new_rev
         return new_rev
 
     def get_valid_children(self, content_types: list=None) -> ['Content']:
         for child in self.children:
             if not child.is_deleted and not child.is_archived:
                 if not content_types or child.type in content_types:
-                    yield child.node
+                    yield child
 
     @hybrid_property
     def properties(self) -> dict:
@@ -1320,7 +1542,7 @@ class Content(DeclarativeBase):
         children = []
         for child in self.children:
             if content_type_list.Comment.slug == child.type and not child.is_deleted and not child.is_archived:
-                children.append(child.node)
+                children.append(child)
         return children
 
     def get_last_comment_from(self, user: User) -> 'Content':
@@ -1409,9 +1631,13 @@ class Content(DeclarativeBase):
         for rev in self.revisions:
             cpy_rev = ContentRevisionRO.copy(rev, parent)
             cpy_content.revisions.append(cpy_rev)
+            cpy_content.current_revision = cpy_rev
         return cpy_content
 
 
+Index('idx__content__current_revision_id', Content.current_revision_id)
+
+
 class RevisionReadStatus(DeclarativeBase):
 
     __tablename__ = 'revision_read_status'
@@ -1436,6 +1662,96 @@ class RevisionReadStatus(DeclarativeBase):
     ))
 
 
+class RevisionPreviewMetadata(DeclarativeBase):
+    """
+    Preview information of a revision file, as given by preview generator.
+    Revision file never change, so this information is computed once then
+    read from database.
+    """
+
+    __tablename__ = 'revision_preview_metadata'
+
+    revision_id = Column(Integer, ForeignKey('content_revisions.revision_id', ondelete='CASCADE', onupdate='CASCADE'), primary_key=True)  # nopep8
+    mimetype = Column(Unicode(255), unique=False, nullable=True)
+    # INFO - G.M - 2019-04-08 - None if preview is not available for file
+    page_nb = Column(Integer, unique=False, nullable=True)
+    has_pdf_preview = Column(Boolean, unique=False, nullable=False, default=False)  # nopep8
+    has_jpeg_preview = Column(Boolean, unique=False, nullable=False, default=False)  # nopep8
+    created = Column(DateTime, unique=False, nullable=False, default=datetime.utcnow)  # nopep8
+
+
+class NotificationDigestEvent(DeclarativeBase):
+    """
+    Content update event waiting to be notified in a digest email. Events are
+    created in the same transaction as the content update, then consumed by
+    notification_digest daemon once their workspace is due.
+    """
+
+    __tablename__ = 'notification_digest_events'
+
+    event_id = Column(Integer, autoincrement=True, primary_key=True)
+    workspace_id = Column(Integer, ForeignKey('workspaces.workspace_id', ondelete='CASCADE', onupdate='CASCADE'), unique=False, nullable=False)  # nopep8
+    content_id = Column(Integer, ForeignKey('content.id', ondelete='CASCADE', onupdate='CASCADE'), unique=False, nullable=False)  # nopep8
+    actor_id = Column(Integer, ForeignKey('users.user_id', ondelete='CASCADE', onupdate='CASCADE'), unique=False, nullable=False)  # nopep8
+    action = Column(Unicode(32), unique=False, nullable=False)
+    created = Column(DateTime, unique=False, nullable=False, default=datetime.utcnow)  # nopep8
+
+
+Index('idx__notification_digest_events__workspace_id', NotificationDigestEvent.workspace_id)  # nopep8
+
+
+class EmailOutboxMessage(DeclarativeBase):
+    """
+    Email waiting to be sent by email_outbox_relay daemon. Message is stored
+    in the same transaction as the change it notifies and deleted once sent.
+    """
+
+    __tablename__ = 'email_outbox'
+
+    message_id = Column(Integer, autoincrement=True, primary_key=True)
+    recipient = Column(Unicode(1024), unique=False, nullable=False)
+    subject = Column(Text(), unique=False, nullable=False, default='')
+    # INFO - G.M - 2019-04-12 - full message, as given by Message.as_string()
+    message = Column(Text(), unique=False, nullable=False)
+    created = Column(DateTime, unique=False, nullable=False, default=datetime.utcnow)  # nopep8
+    attempts = Column(Integer, unique=False, nullable=False, default=0)
+    # INFO - G.M - 2019-04-12 - None once relay gave up sending message
+    next_attempt = Column(DateTime, unique=False, nullable=True, default=datetime.utcnow)  # nopep8
+    last_error = Column(Text(), unique=False, nullable=True)
+
+
+Index('idx__email_outbox__next_attempt', EmailOutboxMessage.next_attempt)
+
+
+class WebdavLock(DeclarativeBase):
+    """
+    WebDAV lock, stored in database so all webdav processes share the same
+    locks (see tracim_backend.lib.webdav.lock_storage.LockStorage). Lock is
+    stored on its normalized root path, indexed, so locks of a path are found
+    without scanning all locks.
+    """
+
+    __tablename__ = 'webdav_locks'
+
+    token = Column(Unicode(255), primary_key=True, nullable=False)
+    root = Column(Unicode(1024), unique=False, nullable=False)
+    depth = Column(Unicode(32), unique=False, nullable=False, default='infinity')  # nopep8
+    type = Column(Unicode(32), unique=False, nullable=False, default='write')
+    scope = Column(Unicode(32), unique=False, nullable=False, default='exclusive')  # nopep8
+    # INFO - G.M - 2019-04-19 - xml of <owner> tag of LOCK request
+    owner = Column(Text(), unique=False, nullable=False, default='')
+    # INFO - G.M - 2019-04-19 - login of user who own the lock
+    principal = Column(Unicode(255), unique=False, nullable=True)
+    timeout = Column(Float, unique=False, nullable=False)
+    # INFO - G.M - 2019-04-19 - expiration timestamp (seconds since epoch),
+    # negative if lock never expire
+    expire = Column(Float, unique=False, nullable=False)
+
+
+Index('idx__webdav_locks__root', WebdavLock.root)
+Index('idx__webdav_locks__expire', WebdavLock.expire)
+
+
 class NodeTreeItem(object):
     """
         This class implements a model that allow to simply represents
@@ -0,0 +1,18 @@
+## -*- coding: utf-8 -*-
+<%! from mako.filters import html_escape %>
+<p>${_('Here are the latest changes in shared space <a href="{workspace_url}">{workspace_label}</a>:').format(workspace_url=html_escape(workspace_url), workspace_label=html_escape(workspace.label))|n}</p>
+
+<ul>
+% for summary in content_summaries:
+  <li>
+    <a href="${summary['url']}">${summary['label']|h}</a> (${summary['status_label']})<br/>
+    ${', '.join(summary['actions'])|h} &mdash; ${_('by {authors}').format(authors=', '.join(summary['authors']))|h}
+  </li>
+% endfor
+</ul>
+
+<pre>
+--
+${_("You're receiving this email because of your account on {website_title}.").format(website_title=config.WEBSITE_TITLE)}
+${_("If you'd like to receive fewer emails, you can <a href=\"{website_title}/ui/account\">unsubscribe from notifications</a>.").format(website_title=config.WEBSITE_BASE_URL)}
+</pre>
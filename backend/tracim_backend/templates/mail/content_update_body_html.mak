@@ -4,6 +4,8 @@
   del { background-color: #ffc0c0; }
 </style>
 
+${recipient_intro|n}
+
 % if content_intro:
 <p>${content_intro|n}</p>
 % endif
@@ -0,0 +1,3 @@
+## -*- coding: utf-8 -*-
+<p>${_('Hello {username},').format(username=user.display_name)|h}</p>
+<p><i>${_('You are {role_label} in shared space {workspace_label}.').format(role_label=_(role_label), workspace_label=workspace.label)|h}</i></p>
@@ -51,6 +51,7 @@ class TestCommands(CommandFunctionalTest):
         assert output.find('webdav start') > 0
         assert output.find('caldav start') > 0
         assert output.find('caldav calendar create') > 0
+        assert output.find('depot gc') > 0
 
     def test_func__user_create_command__ok__nominal_case(self) -> None:
         """
@@ -23,6 +23,8 @@ from tracim_backend.fixtures.content import Content as ContentFixtures
 from tracim_backend.fixtures.users_and_groups import Base as BaseFixture
 from tracim_backend.lib.core.content import ContentApi
 from tracim_backend.lib.core.workspace import WorkspaceApi
+from tracim_backend.lib.preview.daemon import PreviewGeneratorDaemon
+from tracim_backend.lib.preview.jobs import PreviewGenerationQueue
 from tracim_backend.models.setup_models import get_tm_session
 from tracim_backend.models.revision_protection import new_revision
 from tracim_backend.tests import FunctionalTest
@@ -5401,6 +5403,80 @@ class TestFiles(FunctionalTest):
         assert res.json_body['code'] == ErrorCode.INVALID_STATUS_CHANGE
 
 
+class TestFilesPreviewAsync(FunctionalTest):
+    """
+    Tests for preview generated by preview_generator daemon
+    """
+    fixtures = [BaseFixture, ContentFixtures]
+    config_section = 'functional_test_with_preview_async'
+
+    def test_api__get_jpeg_preview__ok__202_then_200__generated_by_daemon(self) -> None:  # nopep8
+        PreviewGenerationQueue(self.app_config).queue.empty()
+        dbsession = get_tm_session(self.session_factory, transaction.manager)
+        admin = dbsession.query(User) \
+            .filter(User.email == 'admin@admin.admin') \
+            .one()
+        workspace_api = WorkspaceApi(
+            current_user=admin,
+            session=dbsession,
+            config=self.app_config
+        )
+        content_api = ContentApi(
+            current_user=admin,
+            session=dbsession,
+            config=self.app_config
+        )
+        business_workspace = workspace_api.get_one(1)
+        tool_folder = content_api.get_one(1, content_type=content_type_list.Any_SLUG)
+        test_file = content_api.create(
+            content_type_slug=content_type_list.File.slug,
+            workspace=business_workspace,
+            parent=tool_folder,
+            label='Test file',
+            do_save=False,
+            do_notify=False,
+        )
+        test_file.file_extension = '.txt'
+        test_file.depot_file = FileIntent(
+            b'Test file',
+            'Test_file.txt',
+            'text/plain',
+        )
+        dbsession.flush()
+        transaction.commit()
+        content_id = int(test_file.content_id)
+        image = create_1000px_png_test_image()
+        self.testapp.authorization = (
+            'Basic',
+            (
+                'admin@admin.admin',
+                'admin@admin.admin'
+            )
+        )
+        self.testapp.put(
+            '/api/v2/workspaces/1/files/{}/raw/{}'.format(content_id, image.name),
+            upload_files=[
+                ('files', image.name, image.getvalue())
+            ],
+            status=204,
+        )
+        res = self.testapp.get(
+            '/api/v2/workspaces/1/files/{}/preview/jpg/'.format(content_id),
+            status=202
+        )
+        assert res.json_body['code'] == ErrorCode.PREVIEW_GENERATION_PENDING
+        assert res.json_body['details']['error_detail']['retry_after'] == 5
+
+        daemon = PreviewGeneratorDaemon(self.app_config, burst=True)
+        daemon.run()
+
+        res = self.testapp.get(
+            '/api/v2/workspaces/1/files/{}/preview/jpg/'.format(content_id),
+            status=200
+        )
+        assert res.content_type == 'image/jpeg'
+
+
 class TestThreads(FunctionalTest):
     """
     Tests for /api/v2/workspaces/{workspace_id}/threads/{content_id}
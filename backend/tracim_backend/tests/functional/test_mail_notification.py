@@ -17,6 +17,8 @@ from tracim_backend.app_models.contents import content_type_list
 from tracim_backend.lib.core.content import ContentApi
 from tracim_backend.lib.core.user import UserApi
 from tracim_backend.lib.core.workspace import WorkspaceApi
+from tracim_backend.lib.mail_notifier.daemon import MailSenderDaemon
+from tracim_backend.lib.mail_notifier.jobs import CONTENT_NOTIFICATION_QUEUE_NAME  # nopep8
 from tracim_backend.lib.mail_notifier.sender import EmailSender
 from tracim_backend.lib.mail_notifier.utils import SmtpConfiguration
 from tracim_backend.tests import MailHogTest
@@ -358,3 +360,87 @@ class TestNotificationsAsync(MailHogTest):
         assert headers['From'][0] == 'Tracim Notifications <test_user_from+0@localhost>'  # nopep8
         assert headers['To'][0] == 'Global manager <admin@admin.admin>'
         assert headers['Subject'][0] == '[TRACIM] A password reset has been requested'
+
+
+class TestContentNotificationsAsync(MailHogTest):
+    fixtures = [BaseFixture, ContentFixture]
+    config_section = 'mail_test_async_notification'
+
+    def _create_notified_file(self):
+        uapi = UserApi(
+            current_user=None,
+            session=self.session,
+            config=self.app_config,
+        )
+        current_user = uapi.get_one_by_email('admin@admin.admin')
+        wapi = WorkspaceApi(
+            current_user=current_user,
+            session=self.session,
+            config=self.app_config,
+        )
+        workspace = wapi.get_one_by_label('Recipes')
+        user = uapi.get_one_by_email('bob@fsf.local')
+        wapi.enable_notifications(user, workspace)
+        api = ContentApi(
+            current_user=user,
+            session=self.session,
+            config=self.app_config,
+        )
+        item = api.create(
+            content_type_list.Folder.slug,
+            workspace,
+            None,
+            'parent',
+            do_save=True,
+            do_notify=False,
+        )
+        api.create(
+            content_type_list.File.slug,
+            workspace,
+            item,
+            'file1',
+            do_save=True,
+            do_notify=True,
+        )
+
+    def test_func__create_new_content_with_notification__ok__nominal_case(self):
+        redis = get_redis_connection(
+            self.app_config
+        )
+        notification_queue = get_rq_queue(
+            redis,
+            CONTENT_NOTIFICATION_QUEUE_NAME,
+        )
+        notification_queue.empty()
+        self._create_notified_file()
+        # notification is only enqueued once content is committed
+        assert notification_queue.count == 0
+        transaction.commit()
+        assert notification_queue.count == 1
+        assert self.get_mailhog_mails() == []
+
+        # Build and send mail async from redis queues with daemon
+        daemon = MailSenderDaemon(self.app_config, burst=True)
+        daemon.run()
+        # check mail received
+        response = self.get_mailhog_mails()
+        assert len(response) == 1
+        headers = response[0]['Content']['Headers']
+        assert headers['From'][0] == '"Bob i. via Tracim" <test_user_from+3@localhost>'  # nopep8
+        assert headers['To'][0] == 'Global manager <admin@admin.admin>'
+        assert headers['Subject'][0] == '[TRACIM] [Recipes] file1 (Open)'
+        assert headers['References'][0] == 'test_user_refs+22@localhost'
+        assert headers['Reply-to'][0] == '"Bob i. & all members of Recipes" <test_user_reply+22@localhost>'  # nopep8
+
+    def test_func__create_new_content_with_notification__ok__rollback(self):
+        redis = get_redis_connection(
+            self.app_config
+        )
+        notification_queue = get_rq_queue(
+            redis,
+            CONTENT_NOTIFICATION_QUEUE_NAME,
+        )
+        notification_queue.empty()
+        self._create_notified_file()
+        transaction.abort()
+        assert notification_queue.count == 0
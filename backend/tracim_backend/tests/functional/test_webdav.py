@@ -311,6 +311,63 @@ class TestFunctionalWebdavGet(WebdavFunctionalTest):
         self.testapp.get('/{}'.format(urlencoded_webdav_workspace_label), status=200)
         self.testapp.get('/{}/{}'.format(urlencoded_webdav_workspace_label, urlencoded_webdav_content_filename), status=200)
 
+    def test_functional__webdav_access_to_content__ok__range_and_etag(self) -> None:  # nopep8
+        dbsession = get_tm_session(self.session_factory, transaction.manager)
+        admin = dbsession.query(User) \
+            .filter(User.email == 'admin@admin.admin') \
+            .one()
+        workspace_api = WorkspaceApi(
+            current_user=admin,
+            session=dbsession,
+            config=self.app_config,
+            show_deleted=True,
+        )
+        workspace = workspace_api.create_workspace('test', save_now=True)
+        api = ContentApi(
+            current_user=admin,
+            session=dbsession,
+            config=self.app_config,
+        )
+        with dbsession.no_autoflush:
+            file = api.create(
+                content_type_list.File.slug,
+                workspace,
+                None,
+                filename='myfile.txt',
+                do_save=False,
+                do_notify=False,
+            )
+            api.update_file_data(
+                file,
+                'myfile.txt',
+                'text/plain',
+                b'test_content'
+            )
+            api.save(file)
+        transaction.commit()
+
+        self.testapp.authorization = (
+            'Basic',
+            (
+                'admin@admin.admin',
+                'admin@admin.admin'
+            )
+        )
+        res = self.testapp.get('/test/myfile.txt', status=200)
+        assert res.body == b'test_content'
+        etag = res.headers['ETag']
+        res = self.testapp.get(
+            '/test/myfile.txt',
+            headers={'Range': 'bytes=5-8'},
+            status=206,
+        )
+        assert res.body == b'cont'
+        self.testapp.get(
+            '/test/myfile.txt',
+            headers={'If-None-Match': etag},
+            status=304,
+        )
+
     def test_functional__webdav_access_to_content__err__file_not_exist(self) -> None:
         dbsession = get_tm_session(self.session_factory, transaction.manager)
         admin = dbsession.query(User) \
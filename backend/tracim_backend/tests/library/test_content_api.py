@@ -1,8 +1,13 @@
 # -*- coding: utf-8 -*-
+import datetime
 import typing
+from unittest.mock import ANY
+from unittest.mock import MagicMock
+from unittest.mock import patch
 
 import pytest
 import transaction
+from depot.manager import DepotManager
 
 from tracim_backend.app_models.contents import content_status_list
 from tracim_backend.app_models.contents import ContentType
@@ -23,11 +28,15 @@ from tracim_backend.lib.core.user import UserApi
 # TODO - G.M - 28-03-2018 - [RoleApi] Re-enable RoleApi
 from tracim_backend.lib.core.workspace import RoleApi
 from tracim_backend.lib.core.workspace import WorkspaceApi
+from tracim_backend.lib.preview.jobs import PreviewGenerationQueue
+from tracim_backend.lib.preview.jobs import generate_revision_previews
 from tracim_backend.models.auth import Group
 from tracim_backend.models.auth import User
 from tracim_backend.models.data import ActionDescription
 from tracim_backend.models.data import Content
 from tracim_backend.models.data import ContentRevisionRO
+from tracim_backend.models.data import DepotBlob
+from tracim_backend.models.data import RevisionPreviewMetadata
 from tracim_backend.models.data import UserRoleInWorkspace
 from tracim_backend.models.data import Workspace
 from tracim_backend.models.revision_protection import new_revision
@@ -1448,7 +1457,7 @@ class TestContentApi(DefaultTest):
         assert text_file_copy.content_id != text_file.content_id
         assert text_file_copy.workspace_id == workspace2.workspace_id
         assert text_file_copy.depot_file.file.read() == text_file.depot_file.file.read()   # nopep8
-        assert text_file_copy.depot_file.path != text_file.depot_file.path
+        assert text_file_copy.depot_file.path == text_file.depot_file.path
         assert text_file_copy.label == 'test_file_copy'
         assert text_file_copy.type == text_file.type
         assert text_file_copy.parent.content_id == folderb.content_id
@@ -1671,7 +1680,7 @@ class TestContentApi(DefaultTest):
         assert text_file_copy.content_id != text_file.content_id
         assert text_file_copy.workspace_id == workspace2.workspace_id
         assert text_file_copy.depot_file.file.read() == text_file.depot_file.file.read()  # nopep8
-        assert text_file_copy.depot_file.path != text_file.depot_file.path
+        assert text_file_copy.depot_file.path == text_file.depot_file.path
         assert text_file_copy.label == text_file.label
         assert text_file_copy.type == text_file.type
         assert text_file_copy.parent.content_id == folderb.content_id
@@ -1777,7 +1786,7 @@ class TestContentApi(DefaultTest):
         assert text_file_copy.content_id != text_file.content_id
         assert text_file_copy.workspace_id == workspace.workspace_id
         assert text_file_copy.depot_file.file.read() == text_file.depot_file.file.read()  # nopep8
-        assert text_file_copy.depot_file.path != text_file.depot_file.path
+        assert text_file_copy.depot_file.path == text_file.depot_file.path
         assert text_file_copy.label == 'test_file_copy'
         assert text_file_copy.type == text_file.type
         assert text_file_copy.parent.content_id == foldera.content_id
@@ -2094,6 +2103,338 @@ class TestContentApi(DefaultTest):
         for rev in page_4.revisions:
             eq_(user_b in rev.read_by.keys(), True)
 
+    def test_unit__get_contents_in_context__ok__same_as_content_in_context(self):  # nopep8
+        uapi = UserApi(
+            session=self.session,
+            config=self.app_config,
+            current_user=None,
+        )
+        group_api = GroupApi(
+            current_user=None,
+            session=self.session,
+            config=self.app_config,
+        )
+        groups = [group_api.get_one(Group.TIM_USER),
+                  group_api.get_one(Group.TIM_MANAGER),
+                  group_api.get_one(Group.TIM_ADMIN)]
+        user_a = uapi.create_minimal_user(email='this.is@user',
+                                          groups=groups, save_now=True)
+        user_b = uapi.create_minimal_user(email='this.is@another.user',
+                                          groups=groups, save_now=True)
+        workspace = WorkspaceApi(
+            current_user=user_a,
+            session=self.session,
+            config=self.app_config,
+        ).create_workspace('test workspace', save_now=True)
+        RoleApi(
+            current_user=user_a,
+            session=self.session,
+            config=self.app_config,
+        ).create_one(
+            user_b,
+            workspace,
+            UserRoleInWorkspace.CONTENT_MANAGER,
+            False
+        )
+        api_a = ContentApi(
+            current_user=user_a,
+            session=self.session,
+            config=self.app_config,
+        )
+        api_b = ContentApi(
+            current_user=user_b,
+            session=self.session,
+            config=self.app_config,
+        )
+        folder = api_a.create(content_type_list.Folder.slug, workspace, None,
+                              'folder', do_save=True)
+        thread = api_a.create(content_type_list.Thread.slug, workspace,
+                              folder, 'thread', do_save=True)
+        page = api_a.create(content_type_list.Page.slug, workspace, None,
+                            'page', do_save=True)
+        file = api_a.create(content_type_list.File.slug, workspace, None,
+                            'file', do_save=True)
+        with new_revision(
+            session=self.session,
+            tm=transaction.manager,
+            content=file,
+        ):
+            api_b.update_file_data(file, 'file.txt', 'text/plain', b'foo')
+        api_b.save(file)
+        api_a.mark_read(folder, recursive=False)
+        api_a.mark_read(page)
+        api_b.create_comment(workspace, thread, 'a comment', do_save=True)
+        transaction.commit()
+
+        contents = api_a.get_all(workspace=workspace)
+        assert len(contents) == 5
+        contents_in_context = api_a.get_contents_in_context(contents)
+        assert len(contents_in_context) == 5
+        for content, content_in_context in zip(contents, contents_in_context):
+            assert content_in_context.content == content
+            expected = api_a.get_content_in_context(content)
+            assert content_in_context.author.user_id == expected.author.user_id  # nopep8
+            assert content_in_context.last_modifier.user_id == expected.last_modifier.user_id  # nopep8
+            assert content_in_context.read_by_user == expected.read_by_user
+            assert content_in_context.size == expected.size
+            assert content_in_context.page_nb == expected.page_nb
+            assert content_in_context.has_jpeg_preview == expected.has_jpeg_preview  # nopep8
+        file_in_context = contents_in_context[contents.index(file)]
+        assert file_in_context.size == 3
+        assert file_in_context.last_modifier.user_id == user_b.user_id
+        assert file_in_context.author.user_id == user_a.user_id
+        # INFO - G.M - 2019-04-04 - folder is read, but a comment of
+        # its thread isn't.
+        assert not contents_in_context[contents.index(folder)].read_by_user
+        assert contents_in_context[contents.index(page)].read_by_user
+
+    def test_unit__get_preview_metadata__ok__computed_once(self):
+        uapi = UserApi(
+            session=self.session,
+            config=self.app_config,
+            current_user=None,
+        )
+        group_api = GroupApi(
+            current_user=None,
+            session=self.session,
+            config=self.app_config,
+        )
+        groups = [group_api.get_one(Group.TIM_USER),
+                  group_api.get_one(Group.TIM_MANAGER),
+                  group_api.get_one(Group.TIM_ADMIN)]
+        user = uapi.create_minimal_user(email='this.is@user',
+                                        groups=groups, save_now=True)
+        workspace = WorkspaceApi(
+            current_user=user,
+            session=self.session,
+            config=self.app_config,
+        ).create_workspace('test workspace', save_now=True)
+        api = ContentApi(
+            current_user=user,
+            session=self.session,
+            config=self.app_config,
+        )
+        file = api.create(content_type_list.File.slug, workspace, None,
+                          'image', do_save=True)
+        with new_revision(
+            session=self.session,
+            tm=transaction.manager,
+            content=file,
+        ):
+            api.update_file_data(file, 'image.png', 'image/png', b'foo')
+        api.save(file)
+        revision_id = file.revision_id
+        transaction.commit()
+
+        # INFO - G.M - 2019-04-08 - test depot is in memory, fake preview
+        # generator answers.
+        api.get_one_revision_filepath = MagicMock(return_value='/tmp/image.png')  # nopep8
+        api.preview_manager = MagicMock()
+        api.preview_manager.get_page_nb.return_value = 1
+        api.preview_manager.has_jpeg_preview.return_value = True
+        api.preview_manager.has_pdf_preview.return_value = False
+        api.preview_manager.get_mimetype.return_value = 'image/png'
+        assert api.get_preview_page_nb(revision_id, '.png') == 1
+        assert api.has_jpeg_preview(revision_id, '.png')
+        assert not api.has_pdf_preview(revision_id, '.png')
+        assert api.preview_manager.get_page_nb.call_count == 1
+        transaction.commit()
+        metadata = self.session.query(RevisionPreviewMetadata).get(revision_id)  # nopep8
+        assert metadata.page_nb == 1
+        assert metadata.has_jpeg_preview
+        assert not metadata.has_pdf_preview
+        assert metadata.mimetype == 'image/png'
+
+        api = ContentApi(
+            current_user=user,
+            session=self.session,
+            config=self.app_config,
+        )
+        api.preview_manager = MagicMock()
+        assert api.get_preview_page_nb(revision_id, '.png') == 1
+        assert api.has_jpeg_preview(revision_id, '.png')
+        assert not api.preview_manager.get_page_nb.called
+        assert not api.preview_manager.has_jpeg_preview.called
+
+        # INFO - G.M - 2019-04-08 - metadata stored by a concurrent request
+        # since the read: existing one is used, transaction stays usable.
+        self.session.expunge_all()
+        metadata = api._store_preview_metadata(
+            RevisionPreviewMetadata(
+                revision_id=revision_id,
+                page_nb=2,
+                has_jpeg_preview=True,
+                has_pdf_preview=False,
+            )
+        )
+        assert metadata.page_nb == 1
+        transaction.commit()
+        assert self.session.query(RevisionPreviewMetadata).get(revision_id).page_nb == 1  # nopep8
+
+    def test_unit__get_preview_metadata__ok__async_stored_by_job(self):
+        uapi = UserApi(
+            session=self.session,
+            config=self.app_config,
+            current_user=None,
+        )
+        group_api = GroupApi(
+            current_user=None,
+            session=self.session,
+            config=self.app_config,
+        )
+        groups = [group_api.get_one(Group.TIM_USER),
+                  group_api.get_one(Group.TIM_MANAGER),
+                  group_api.get_one(Group.TIM_ADMIN)]
+        user = uapi.create_minimal_user(email='this.is@user',
+                                        groups=groups, save_now=True)
+        workspace = WorkspaceApi(
+            current_user=user,
+            session=self.session,
+            config=self.app_config,
+        ).create_workspace('test workspace', save_now=True)
+        api = ContentApi(
+            current_user=user,
+            session=self.session,
+            config=self.app_config,
+        )
+        file = api.create(content_type_list.File.slug, workspace, None,
+                          'document', do_save=True)
+        with new_revision(
+            session=self.session,
+            tm=transaction.manager,
+            content=file,
+        ):
+            api.update_file_data(file, 'document.odt', 'application/vnd.oasis.opendocument.text', b'foo')  # nopep8
+        api.save(file)
+        revision_id = file.revision_id
+        transaction.commit()
+
+        preview_manager = MagicMock()
+        preview_manager.get_page_nb.return_value = 3
+        preview_manager.has_jpeg_preview.return_value = True
+        preview_manager.has_pdf_preview.return_value = True
+        preview_manager.get_mimetype.return_value = 'application/vnd.oasis.opendocument.text'  # nopep8
+        with patch.object(
+            self.app_config,
+            'PREVIEW_PROCESSING_MODE',
+            self.app_config.CST.ASYNC,
+        ), patch(
+            'tracim_backend.lib.core.content.PreviewManager',
+            return_value=preview_manager,
+        ), patch(
+            'tracim_backend.lib.preview.jobs.PreviewManager',
+            return_value=preview_manager,
+        ), patch.object(
+            ContentApi,
+            'get_one_revision_filepath',
+            return_value='/tmp/document.odt',
+        ):
+            api = ContentApi(
+                current_user=user,
+                session=self.session,
+                config=self.app_config,
+            )
+            api.preview_generation_queue = MagicMock()
+            api.preview_generation_queue.is_pending.return_value = True
+            # INFO - G.M - 2019-04-08 - previews are being generated: metadata
+            # is unknown and not computed in request.
+            assert api.get_preview_page_nb(revision_id, '.odt') is None
+            assert not api.has_pdf_preview(revision_id, '.odt')
+            assert not preview_manager.get_page_nb.called
+            assert not self.session.query(RevisionPreviewMetadata).get(revision_id)  # nopep8
+
+            with patch(
+                'tracim_backend.lib.preview.jobs.get_job_session_factory'
+            ), patch(
+                'tracim_backend.lib.preview.jobs.get_tm_session',
+                return_value=self.session,
+            ):
+                generate_revision_previews(
+                    self.app_config,
+                    revision_id,
+                    '/tmp/document.odt',
+                    '.odt',
+                )
+            assert preview_manager.get_pdf_preview.call_count == 1
+            assert preview_manager.get_page_nb.call_count == 1
+
+            api.preview_generation_queue.is_pending.return_value = False
+            assert api.get_preview_page_nb(revision_id, '.odt') == 3
+            assert api.has_pdf_preview(revision_id, '.odt')
+            assert preview_manager.get_page_nb.call_count == 1
+
+    def test_unit__enqueue_preview_generation__ok__after_commit(self):
+        uapi = UserApi(
+            session=self.session,
+            config=self.app_config,
+            current_user=None,
+        )
+        group_api = GroupApi(
+            current_user=None,
+            session=self.session,
+            config=self.app_config,
+        )
+        groups = [group_api.get_one(Group.TIM_USER),
+                  group_api.get_one(Group.TIM_MANAGER),
+                  group_api.get_one(Group.TIM_ADMIN)]
+        user = uapi.create_minimal_user(email='this.is@user',
+                                        groups=groups, save_now=True)
+        workspace = WorkspaceApi(
+            current_user=user,
+            session=self.session,
+            config=self.app_config,
+        ).create_workspace('test workspace', save_now=True)
+        transaction.commit()
+
+        def create_file(label: str) -> Content:
+            api = ContentApi(
+                current_user=user,
+                session=self.session,
+                config=self.app_config,
+            )
+            file = api.create(content_type_list.File.slug, workspace, None,
+                              label, do_save=True)
+            with new_revision(
+                session=self.session,
+                tm=transaction.manager,
+                content=file,
+            ):
+                api.update_file_data(file, '{}.png'.format(label), 'image/png', b'foo')  # nopep8
+            api.save(file)
+            api.enqueue_preview_generation(file)
+            return file
+
+        with patch.object(
+            self.app_config,
+            'PREVIEW_PROCESSING_MODE',
+            self.app_config.CST.ASYNC,
+        ), patch.object(
+            ContentApi,
+            'get_one_revision_filepath',
+            return_value='/tmp/image.png',
+        ), patch.object(
+            PreviewGenerationQueue,
+            'enqueue',
+            autospec=True,
+        ) as enqueue_mock:
+            create_file('rollbacked')
+            self.session.rollback()
+            transaction.abort()
+            # INFO - G.M - 2019-04-05 - revision of rollbacked transaction
+            # never existed: its previews are not generated.
+            assert not enqueue_mock.called
+
+            file = create_file('committed')
+            revision_id = file.revision_id
+            assert not enqueue_mock.called
+            transaction.commit()
+            enqueue_mock.assert_called_once_with(
+                ANY,
+                revision_id,
+                '/tmp/image.png',
+                '.png',
+            )
+
     def test_mark_read(self):
         uapi = UserApi(
             session=self.session,
@@ -2167,6 +2508,87 @@ class TestContentApi(DefaultTest):
         for rev in page_1.revisions:
             eq_(user_b in rev.read_by.keys(), True)
 
+    def test_mark_read__ok__subtree_and_mark_unread(self):
+        uapi = UserApi(
+            session=self.session,
+            config=self.app_config,
+            current_user=None,
+        )
+        group_api = GroupApi(
+            current_user=None,
+            session=self.session,
+            config=self.app_config,
+        )
+        groups = [group_api.get_one(Group.TIM_USER),
+                  group_api.get_one(Group.TIM_MANAGER),
+                  group_api.get_one(Group.TIM_ADMIN)]
+        user_a = uapi.create_minimal_user(email='this.is@user',
+                                          groups=groups, save_now=True)
+        user_b = uapi.create_minimal_user(email='this.is@another.user',
+                                          groups=groups, save_now=True)
+        workspace = WorkspaceApi(
+            current_user=user_a,
+            session=self.session,
+            config=self.app_config,
+        ).create_workspace('test workspace', save_now=True)
+        RoleApi(
+            current_user=user_a,
+            session=self.session,
+            config=self.app_config,
+        ).create_one(
+            user_b,
+            workspace,
+            UserRoleInWorkspace.READER,
+            False
+        )
+        cont_api_a = ContentApi(
+            current_user=user_a,
+            session=self.session,
+            config=self.app_config,
+        )
+        cont_api_b = ContentApi(
+            current_user=user_b,
+            session=self.session,
+            config=self.app_config,
+        )
+        folder = cont_api_a.create(content_type_list.Folder.slug, workspace,
+                                   None, 'folder', do_save=True)
+        subfolder = cont_api_a.create(content_type_list.Folder.slug,
+                                      workspace, folder, 'subfolder',
+                                      do_save=True)
+        thread = cont_api_a.create(content_type_list.Thread.slug, workspace,
+                                   subfolder, 'thread', do_save=True)
+        comment_1 = cont_api_a.create_comment(workspace, thread, 'comment 1',
+                                              do_save=True)
+        comment_2 = cont_api_a.create_comment(workspace, thread, 'comment 2',
+                                              do_save=True)
+        other_page = cont_api_a.create(content_type_list.Page.slug, workspace,
+                                       None, 'other page', do_save=True)
+        subtree = [folder, subfolder, thread, comment_1, comment_2]
+
+        cont_api_b.mark_read(folder)
+        for content in subtree:
+            for rev in content.revisions:
+                assert user_b in rev.read_by.keys()
+        for rev in other_page.revisions:
+            assert user_b not in rev.read_by.keys()
+
+        cont_api_b.mark_unread(subfolder)
+        for content in [subfolder, thread, comment_1, comment_2]:
+            for rev in content.revisions:
+                assert user_b not in rev.read_by.keys()
+        for rev in folder.revisions:
+            assert user_b in rev.read_by.keys()
+
+        # INFO - G.M - 2019-04-05 - reading a comment mean reading its parent
+        # and sibling comments too.
+        cont_api_b.mark_read(comment_1)
+        for content in [thread, comment_1, comment_2]:
+            for rev in content.revisions:
+                assert user_b in rev.read_by.keys()
+        for rev in subfolder.revisions:
+            assert user_b not in rev.read_by.keys()
+
     def test_mark_read__all(self):
         uapi = UserApi(
             session=self.session,
@@ -2973,6 +3395,142 @@ class TestContentApi(DefaultTest):
         eq_(b'<html>hello world</html>', updated.depot_file.file.read())
         eq_(ActionDescription.REVISION, updated.revision_type)
 
+    def test_update_file_data__ok__same_content_share_blob(self):
+        uapi = UserApi(
+            session=self.session,
+            config=self.app_config,
+            current_user=None,
+        )
+        group_api = GroupApi(
+            current_user=None,
+            session=self.session,
+            config=self.app_config,
+        )
+        groups = [group_api.get_one(Group.TIM_USER),
+                  group_api.get_one(Group.TIM_MANAGER),
+                  group_api.get_one(Group.TIM_ADMIN)]
+        user = uapi.create_minimal_user(
+            email='this.is@user',
+            groups=groups,
+            save_now=True
+        )
+        workspace = WorkspaceApi(
+            current_user=user,
+            session=self.session,
+            config=self.app_config,
+        ).create_workspace(
+            'test workspace',
+            save_now=True
+        )
+        api = ContentApi(
+            current_user=user,
+            session=self.session,
+            config=self.app_config,
+        )
+        file_ids = []
+        for label in ('file_1', 'file_2'):
+            file = api.create(
+                content_type_slug=content_type_list.File.slug,
+                workspace=workspace,
+                parent=None,
+                label=label,
+                do_save=True
+            )
+            with new_revision(
+                session=self.session,
+                tm=transaction.manager,
+                content=file,
+            ):
+                api.update_file_data(
+                    file,
+                    '{}.txt'.format(label),
+                    'text/plain',
+                    b'same content'
+                )
+            api.save(file)
+            file_ids.append(file.content_id)
+        transaction.commit()
+
+        file_1 = api.get_one(file_ids[0], content_type_list.Any_SLUG)
+        file_2 = api.get_one(file_ids[1], content_type_list.Any_SLUG)
+        assert file_1.revision.blob_hash == file_2.revision.blob_hash
+        assert file_1.depot_file.path == file_2.depot_file.path
+        assert file_1.revision.blob.reference_count == 2
+        assert file_1.file_name == 'file_1.txt'
+        assert file_2.file_name == 'file_2.txt'
+        assert file_2.depot_file.file.read() == b'same content'
+
+        # INFO - G.M - 2019-04-01 - replaced blob is only referenced by
+        # previous revision of file_1 and by file_2.
+        with new_revision(
+            session=self.session,
+            tm=transaction.manager,
+            content=file_1,
+        ):
+            api.update_file_data(
+                file_1,
+                'file_1.txt',
+                'text/plain',
+                b'new content'
+            )
+        api.save(file_1)
+        transaction.commit()
+        file_1 = api.get_one(file_ids[0], content_type_list.Any_SLUG)
+        file_2 = api.get_one(file_ids[1], content_type_list.Any_SLUG)
+        assert file_1.revision.blob.reference_count == 1
+        assert file_2.revision.blob.reference_count == 2
+
+    def test_unit__depot_blob_get_or_create__ok__concurrent_creation(self):
+        blob = DepotBlob.get_or_create(
+            self.session,
+            b'same content',
+            'file_1.txt',
+            'text/plain',
+        )
+        transaction.commit()
+        blob_hash = blob.blob_hash
+        depot_files = set(DepotManager.get().list())
+        self.session.expunge_all()
+
+        # INFO - G.M - 2019-04-01 - blob is created by another request
+        # between check and insert.
+        query = self.session.query
+        blob_queries = []
+
+        def query_without_existing_blob(*entities):
+            if entities == (DepotBlob,) and not blob_queries:
+                blob_queries.append(entities)
+                return MagicMock(get=MagicMock(return_value=None))
+            return query(*entities)
+
+        with patch.object(
+            self.session,
+            'query',
+            side_effect=query_without_existing_blob,
+        ):
+            blob = DepotBlob.get_or_create(
+                self.session,
+                b'same content',
+                'file_2.txt',
+                'text/plain',
+            )
+        assert blob.blob_hash == blob_hash
+        transaction.commit()
+        assert set(DepotManager.get().list()) == depot_files
+
+        # INFO - G.M - 2019-04-01 - file of new blob is still removed if
+        # transaction is rollbacked.
+        DepotBlob.get_or_create(
+            self.session,
+            b'other content',
+            'file_3.txt',
+            'text/plain',
+        )
+        assert set(DepotManager.get().list()) != depot_files
+        self.session.rollback()
+        assert set(DepotManager.get().list()) == depot_files
+        transaction.abort()
+
     def test_update_file_data__err__content_status_closed(self):
         uapi = UserApi(
             session=self.session,
@@ -4131,6 +4689,105 @@ class TestContentApi(DefaultTest):
         # folder subcontent modification does not change folder order
         assert last_actives[0] == main_folder
 
+    def test_unit__get_last_active__ok__same_last_activity_paginated(self):
+        uapi = UserApi(
+            session=self.session,
+            config=self.app_config,
+            current_user=None,
+        )
+        group_api = GroupApi(
+            current_user=None,
+            session=self.session,
+            config=self.app_config,
+        )
+        groups = [group_api.get_one(Group.TIM_USER),
+                  group_api.get_one(Group.TIM_MANAGER),
+                  group_api.get_one(Group.TIM_ADMIN)]
+
+        user = uapi.create_minimal_user(email='this.is@user',
+                                        groups=groups, save_now=True)
+        workspace = WorkspaceApi(
+            current_user=user,
+            session=self.session,
+            config=self.app_config,
+        ).create_workspace(
+            'test workspace',
+            save_now=True
+        )
+        api = ContentApi(
+            current_user=user,
+            session=self.session,
+            config=self.app_config,
+        )
+        folder = api.create(content_type_list.Folder.slug, workspace, None, 'folder', '', True)  # nopep8
+        updated_page = api.create(content_type_list.Page.slug, workspace, folder, 'updated page', '', True)  # nopep8
+        with new_revision(
+            session=self.session,
+            tm=transaction.manager,
+            content=updated_page,
+        ):
+            updated_page.description = 'Just an update'
+        api.save(updated_page)
+        commented_page = api.create(content_type_list.Page.slug, workspace, folder, 'commented page', '', True)  # nopep8
+        comment = api.create_comment(workspace, commented_page, 'juste a super comment', True)  # nopep8
+        page = api.create(content_type_list.Page.slug, workspace, folder, 'page', '', True)  # nopep8
+        other_page = api.create(content_type_list.Page.slug, workspace, folder, 'other page', '', True)  # nopep8
+        transaction.commit()
+
+        # INFO - G.M - 2019-04-08 - set revision dates explicitly: pages
+        # have the same last activity, updated page was created before folder
+        # but updated with them, commented page is only commented after them.
+        first_date = datetime.datetime(2019, 1, 1, 12, 0, 0)
+        same_date = first_date + datetime.timedelta(hours=1)
+        comment_date = first_date + datetime.timedelta(hours=2)
+
+        def set_revision_dates(content: Content, dates: typing.List[datetime.datetime]) -> None:  # nopep8
+            revisions = self.session.query(ContentRevisionRO) \
+                .filter(ContentRevisionRO.content_id == content.content_id) \
+                .order_by(ContentRevisionRO.revision_id) \
+                .all()
+            assert len(revisions) == len(dates)
+            for revision, date in zip(revisions, dates):
+                self.session.query(ContentRevisionRO) \
+                    .filter(ContentRevisionRO.revision_id == revision.revision_id) \
+                    .update({'updated': date}, synchronize_session=False)  # nopep8
+
+        set_revision_dates(folder, [first_date])
+        set_revision_dates(updated_page, [first_date - datetime.timedelta(hours=1), same_date])  # nopep8
+        set_revision_dates(commented_page, [first_date])
+        set_revision_dates(comment, [comment_date])
+        set_revision_dates(page, [same_date])
+        set_revision_dates(other_page, [same_date])
+        transaction.commit()
+        self.session.expire_all()
+
+        last_actives = api.get_last_active(workspace=workspace)
+        # INFO - G.M - 2019-04-08 - last comment or last revision gives order,
+        # content_id breaks ties of same last activity
+        assert last_actives == [
+            commented_page,
+            other_page,
+            page,
+            updated_page,
+            folder,
+        ]
+
+        # INFO - G.M - 2019-04-08 - pages boundaries are inside contents with
+        # same last activity: no content is skipped nor repeated
+        last_actives = api.get_last_active(workspace=workspace, limit=2)
+        assert last_actives == [commented_page, other_page]
+        last_actives = api.get_last_active(workspace=workspace, limit=2, before_content=last_actives[-1])  # nopep8
+        assert last_actives == [page, updated_page]
+        last_actives = api.get_last_active(workspace=workspace, limit=2, before_content=last_actives[-1])  # nopep8
+        assert last_actives == [folder]
+        last_actives = api.get_last_active(workspace=workspace, limit=2, before_content=last_actives[-1])  # nopep8
+        assert last_actives == []
+
+        # INFO - G.M - 2019-04-08 - cursor from first content of same last
+        # activity only returns following ones
+        last_actives = api.get_last_active(workspace=workspace, limit=1, before_content=other_page)  # nopep8
+        assert last_actives == [page]
+
     def test_unit__get_last_active__ok__workspace_filter_workspace_empty(self):
         uapi = UserApi(
             session=self.session,
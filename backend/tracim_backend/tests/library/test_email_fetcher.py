@@ -1,8 +1,23 @@
 import pytest
+import transaction
 from mock import Mock, MagicMock
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.exc import OperationalError
+from tracim_backend.app_models.contents import content_type_list
 from tracim_backend.exceptions import BadStatusCode
 from tracim_backend.lib.mail_fetcher.email_fetcher import DecodedMail, \
     MailFetcher
+from tracim_backend.lib.mail_fetcher.email_fetcher import IMAP_CHECKED_FLAG
+from tracim_backend.lib.mail_fetcher.email_fetcher import IMAP_DEAD_LETTER_FLAG
+from tracim_backend.lib.mail_fetcher.email_fetcher import IMAP_SEEN_FLAG
+from tracim_backend.fixtures.users_and_groups import Base as BaseFixture
+from tracim_backend.lib.core.content import ContentApi
+from tracim_backend.lib.core.user import UserApi
+from tracim_backend.lib.core.workspace import WorkspaceApi
+from tracim_backend.lib.mail_fetcher.ingestion import MailComment
+from tracim_backend.lib.mail_fetcher.ingestion import MailCommentIngestor
+from tracim_backend.lib.mail_fetcher.sync_state import MailboxSyncState
+from tracim_backend.tests import DefaultTest
 import responses
 import requests
 
@@ -346,9 +361,6 @@ class TestMailFetcher(object):
             references_pattern='',
             user='imap_user',
         )
-        imapc_mock = MagicMock()
-        imapc_mock_add_flags = MagicMock()
-        imapc_mock.add_flags = imapc_mock_add_flags
         email_mock = MagicMock()
         auth_headers = {
             'Tracim-Api-Key': 'apikey',
@@ -361,11 +373,11 @@ class TestMailFetcher(object):
             endpoint='http://127.0.0.1:6543/api/workspaces/4/contents/1/comments',  # nopep8
             json_body_dict={'raw_content': 'CONTENT'},
             method='POST',
-            imapc=imapc_mock,
             mail=email_mock,
         )
 
-        assert imapc_mock_add_flags.call_count == 2
+        assert len(responses.calls) == 1
+        assert responses.calls[0].request.headers['Tracim-Api-Login'] == 'mymailadress@mydomain.com'  # nopep8
 
     def test_unit__notify_tracim(self):
         mf = MailFetcher(
@@ -414,16 +426,325 @@ class TestMailFetcher(object):
         mf._notify_tracim(mails=mails, imapc=imapc_mock)
         args = {
             'mail': mail,
-            'imapc': imapc_mock,
             'endpoint': 'http://127.0.0.1:6543/api/workspaces/4/contents/1/comments',  # nopep8
             'json_body_dict': {'raw_content': 'CONTENT'},
             'method': 'POST',
         }
         args2 = {
-            'mail': mail,
-            'imapc': imapc_mock,
+            'mail': mail2,
             'endpoint': 'http://127.0.0.1:6543/api/workspaces/4/contents/2/comments',  # nopep8
             'json_body_dict': {'raw_content': 'CONTENT2'},
             'method': 'POST',
         }
         assert mf._send_request.call_count == 2
+        mf._send_request.assert_any_call(**args)
+        mf._send_request.assert_any_call(**args2)
+        # INFO - G.M - 2019-04-15 - all sent mails are flagged at once
+        imapc_mock_add_flags.assert_called_once_with(
+            [mail.uid, mail2.uid],
+            (IMAP_CHECKED_FLAG, IMAP_SEEN_FLAG),
+        )
+
+    def test_unit__notify_tracim__ok__keep_order_of_same_content_mails(self):
+        mf = MailFetcher(
+            host='host_imap',
+            port='993',
+            use_ssl=True,
+            password='imap_password',
+            folder='INBOX',
+            use_idle=True,
+            use_html_parsing=True,
+            use_txt_parsing=True,
+            lockfile_path='email_fetcher.lock',
+            api_base_url='http://127.0.0.1:6543/api/',
+            burst=True,
+            api_key='apikey',
+            connection_max_lifetime=60,
+            heartbeat=60,
+            reply_to_pattern='',
+            references_pattern='',
+            user='imap_user',
+            workers=4,
+        )
+        imapc_mock = MagicMock()
+        mails = []
+        for uid, key in enumerate(['1', '2', '1', '3', '1']):
+            mail = Mock()
+            mail.uid = uid
+            mail.get_key.return_value = key
+            mails.append(mail)
+        sent_mails = []
+
+        def send_request(mail, method, endpoint, json_body_dict):
+            if mail.uid == 3:
+                raise BadStatusCode('refused')
+            sent_mails.append(mail)
+
+        mf._send_request = Mock(side_effect=send_request)
+        mf._create_comment_request = Mock(
+            return_value=('POST', 'endpoint', {'raw_content': 'CONTENT'})
+        )
+        mf._notify_tracim(mails=mails, imapc=imapc_mock)
+        assert mf._send_request.call_count == 5
+        content_1_mails = [
+            mail for mail in sent_mails if mail.get_key() == '1'
+        ]
+        assert content_1_mails == [mails[0], mails[2], mails[4]]
+        imapc_mock.add_flags.assert_called_once()
+        flagged_uids = imapc_mock.add_flags.call_args[0][0]
+        assert sorted(flagged_uids) == [0, 1, 2, 4]
+
+    @responses.activate
+    def test_unit__notify_tracim_for_mails__ok__server_errors_postponed(self):  # nopep8
+        mf = MailFetcher(
+            host='host_imap',
+            port='993',
+            use_ssl=True,
+            password='imap_password',
+            folder='INBOX',
+            use_idle=True,
+            use_html_parsing=True,
+            use_txt_parsing=True,
+            lockfile_path='email_fetcher.lock',
+            api_base_url='http://127.0.0.1:6543/api/',
+            burst=True,
+            api_key='apikey',
+            connection_max_lifetime=60,
+            heartbeat=60,
+            reply_to_pattern='',
+            references_pattern='',
+            user='imap_user',
+        )
+        # INFO - G.M - 2019-04-17 - comment endpoint status code by mail uid,
+        # 502 is an html error page of a proxy while tracim is down.
+        statuses = {1: 200, 2: 502, 3: 503, 4: 400, 5: 403}
+        for uid, status in statuses.items():
+            responses.add(
+                responses.POST,
+                'http://127.0.0.1:6543/api/workspaces/1/contents/{}/comments'.format(uid),  # nopep8
+                body='<html>Bad Gateway</html>' if status == 502 else '{}',
+                status=status,
+            )
+        mails = []
+        for uid in statuses:
+            mail = Mock()
+            mail.uid = uid
+            mail.get_from_address.return_value = 'bob@fsf.local'
+            mails.append(mail)
+        mf._create_comment_request = Mock(side_effect=lambda mail: (
+            'POST',
+            'http://127.0.0.1:6543/api/workspaces/1/contents/{}/comments'.format(mail.uid),  # nopep8
+            {'raw_content': 'CONTENT'},
+        ))
+        sent_uids, postponed_uids = mf._notify_tracim_for_mails(mails)
+        assert sent_uids == [1]
+        assert postponed_uids == [2, 3]
+
+        # INFO - G.M - 2019-04-17 - same for content info request
+        def create_comment_request(mail):
+            if mail.uid == 1:
+                raise requests.exceptions.ConnectionError('refused')
+            raise BadStatusCode('bad status', status_code=statuses[mail.uid])  # nopep8
+
+        mf._create_comment_request = Mock(side_effect=create_comment_request)
+        sent_uids, postponed_uids = mf._notify_tracim_for_mails(mails)
+        assert sent_uids == []
+        assert postponed_uids == [1, 2, 3]
+
+
+class TestMailCommentIngestor(DefaultTest):
+    fixtures = [BaseFixture]
+
+    def test_unit__create_comments__ok__only_allowed_comments(self):
+        uapi = UserApi(
+            current_user=None,
+            session=self.session,
+            config=self.app_config,
+        )
+        admin = uapi.get_one_by_email('admin@admin.admin')
+        uapi.create_user(
+            email='norole@test.test',
+            do_save=True,
+            do_notify=False,
+        )
+        workspace = WorkspaceApi(
+            current_user=admin,
+            session=self.session,
+            config=self.app_config,
+        ).create_workspace('workspace', save_now=True)
+        thread = ContentApi(
+            current_user=admin,
+            session=self.session,
+            config=self.app_config,
+        ).create(
+            content_type_list.Thread.slug,
+            workspace,
+            label='thread',
+            do_save=True,
+            do_notify=False,
+        )
+        thread_id = thread.content_id
+        transaction.commit()
+
+        ingestor = MailCommentIngestor(
+            self.app_config,
+            session_factory=None,
+            batch_size=10,
+        )
+        added_uids = ingestor.create_comments(
+            self.session,
+            [
+                MailComment(1, thread_id, 'admin@admin.admin', ' <p>reply</p> '),  # nopep8
+                MailComment(2, thread_id, 'norole@test.test', '<p>reply</p>'),
+                MailComment(3, thread_id, 'unknown@test.test', '<p>reply</p>'),  # nopep8
+                MailComment(4, 9999, 'admin@admin.admin', '<p>reply</p>'),
+                MailComment(5, thread_id, 'admin@admin.admin', ''),
+            ]
+        )
+        transaction.commit()
+        assert added_uids == [1]
+        thread = ContentApi(
+            current_user=admin,
+            session=self.session,
+            config=self.app_config,
+        ).get_one(thread_id, content_type_list.Any_SLUG)
+        comments = thread.get_comments()
+        assert len(comments) == 1
+        assert comments[0].description == '<p>reply</p>'
+        assert comments[0].owner.email == 'admin@admin.admin'
+
+    def test_unit__ingest__ok__failing_mail_not_postponed(self):
+        ingestor = MailCommentIngestor(
+            self.app_config,
+            session_factory=None,
+            batch_size=10,
+        )
+        comments = [
+            MailComment(uid, 1, 'admin@admin.admin', '<p>reply</p>')
+            for uid in (1, 2, 3)
+        ]
+
+        def ingest_batch(batch):
+            if len(batch) > 1 or batch[0].uid == 2:
+                raise IntegrityError('INSERT', {}, Exception('constraint'))
+            return [batch[0].uid]
+
+        ingestor._ingest_batch = Mock(side_effect=ingest_batch)
+        ingested_uids, postponed_uids = ingestor.ingest(comments)
+        # INFO - G.M - 2019-04-17 - mail 2 always fails: it is a failure,
+        # not postponed for ever.
+        assert ingested_uids == [1, 3]
+        assert postponed_uids == []
+
+        ingestor._ingest_batch = Mock(
+            side_effect=OperationalError('INSERT', {}, Exception('gone away'))
+        )
+        ingested_uids, postponed_uids = ingestor.ingest(comments)
+        # INFO - G.M - 2019-04-17 - unavailable database postpones whole
+        # batch without retrying mails one by one.
+        assert ingested_uids == []
+        assert postponed_uids == [1, 2, 3]
+        assert ingestor._ingest_batch.call_count == 1
+
+
+class TestMailboxSyncState(object):
+
+    def test_unit__update__ok__high_water_mark_and_dead_letter(self, tmpdir):
+        path = str(tmpdir.join('state.json'))
+        state = MailboxSyncState.load(path, 'INBOX')
+        state.set_uidvalidity(42)
+        assert state.get_uids_to_process([1, 2, 3]) == [1, 2, 3]
+        given_up_uids = state.update(
+            [1, 2, 3],
+            processed_uids=[1, 3],
+            failed_uids=[2],
+            max_attempts=2,
+        )
+        assert given_up_uids == []
+
+        state = MailboxSyncState.load(path, 'INBOX')
+        assert state.last_uid == 3
+        assert state.failures == {2: 1}
+        # INFO - G.M - 2019-04-17 - uid 1 is under high-water mark and not
+        # failed: it is processed by another fetcher.
+        assert state.get_uids_to_process([1, 2, 4]) == [2, 4]
+        given_up_uids = state.update(
+            [2, 4],
+            processed_uids=[4],
+            failed_uids=[2],
+            max_attempts=2,
+        )
+        assert given_up_uids == [2]
+        assert state.failures == {}
+        assert state.last_uid == 4
+
+        state.set_uidvalidity(43)
+        assert state.last_uid == 0
+        assert MailboxSyncState.load(path, 'other_folder').last_uid == 0
+
+    def test_unit__check_mail__ok__chunked_incremental_fetch(self, tmpdir):
+        mf = MailFetcher(
+            host='host_imap',
+            port='993',
+            use_ssl=True,
+            password='imap_password',
+            folder='INBOX',
+            use_idle=True,
+            use_html_parsing=True,
+            use_txt_parsing=True,
+            lockfile_path=str(tmpdir.join('email_fetcher.lock')),
+            api_base_url='http://127.0.0.1:6543/api/',
+            burst=True,
+            api_key='apikey',
+            connection_max_lifetime=60,
+            heartbeat=60,
+            reply_to_pattern='',
+            references_pattern='',
+            user='imap_user',
+            sync_state_path=str(tmpdir.join('state.json')),
+            fetch_chunk_size=2,
+            max_attempts=1,
+        )
+        mf.sync_state.last_uid = 10
+        imapc_mock = MagicMock()
+        imapc_mock.search.return_value = [10, 11, 12, 13]
+        imapc_mock.fetch.side_effect = lambda uids, data: {
+            uid: {b'BODY[]': b'Subject: reply\r\n\r\nreply'} for uid in uids
+        }
+        mf._notify_tracim = Mock(side_effect=[([11], []), ([], [13])])
+        mf._check_mail(imapc_mock)
+
+        search_criteria = imapc_mock.search.call_args[0][0]
+        assert search_criteria[-2:] == ['UID', '11:*']
+        assert [
+            call[0][0] for call in imapc_mock.fetch.call_args_list
+        ] == [[11, 12], [13]]
+        # INFO - G.M - 2019-04-17 - mail 12 failed, mail 13 is postponed
+        imapc_mock.add_flags.assert_called_once_with(
+            [12],
+            (IMAP_DEAD_LETTER_FLAG,),
+        )
+        assert mf.sync_state.last_uid == 13
+        assert mf.sync_state.failures == {}
+        assert mf.sync_state.postponed == {13}
+
+        # INFO - G.M - 2019-04-17 - postponed mail is searched again and
+        # retried, postponing never gives a mail up.
+        imapc_mock.search.return_value = [13]
+        mf._notify_tracim = Mock(side_effect=[([], [13])])
+        mf._check_mail(imapc_mock)
+        search_criteria = imapc_mock.search.call_args[0][0]
+        assert search_criteria[-2:] == ['UID', '13,14:*']
+        assert imapc_mock.fetch.call_args[0][0] == [13]
+        imapc_mock.add_flags.assert_called_once_with(
+            [12],
+            (IMAP_DEAD_LETTER_FLAG,),
+        )
+        assert MailboxSyncState.load(
+            str(tmpdir.join('state.json')),
+            'INBOX',
+        ).postponed == {13}
+
+        mf._notify_tracim = Mock(side_effect=[([13], [])])
+        mf._check_mail(imapc_mock)
+        assert mf.sync_state.postponed == set()
@@ -1,14 +1,48 @@
 # -*- coding: utf-8 -*-
+import datetime
 import os
 import re
+import smtplib
+import typing
+from email.mime.text import MIMEText
+from unittest.mock import MagicMock
+from unittest.mock import patch
 
+import pytest
+import transaction
 
+from tracim_backend.app_models.contents import content_type_list
+from tracim_backend.exceptions import NotificationSendingFailed
+from tracim_backend.fixtures.content import Content as ContentFixture
+from tracim_backend.fixtures.users_and_groups import Base as BaseFixture
+from tracim_backend.lib.core.content import ContentApi
 from tracim_backend.lib.core.notifications import DummyNotifier
 
 from tracim_backend.lib.core.notifications import NotifierFactory
+from tracim_backend.lib.core.user import UserApi
+from tracim_backend.lib.core.userworkspace import RoleApi
+from tracim_backend.lib.core.workspace import WorkspaceApi
+from tracim_backend.lib.mail_notifier.digest import NotificationDigest
+from tracim_backend.lib.mail_notifier.jobs import PENDING_CONTENT_NOTIFICATION_JOB_TTL  # nopep8
+from tracim_backend.lib.mail_notifier.jobs import ContentNotificationQueue
+from tracim_backend.lib.mail_notifier.jobs import dispose_job_engines
+from tracim_backend.lib.mail_notifier.jobs import get_job_session_factory
+from tracim_backend.lib.mail_notifier.jobs import notify_content_update
+from tracim_backend.lib.mail_notifier.notifier import CONTENT_UPDATE_RECIPIENT_INTRO_PLACEHOLDER  # nopep8
+from tracim_backend.lib.mail_notifier.notifier import EmailManager
 from tracim_backend.lib.mail_notifier.notifier import EmailNotifier
+from tracim_backend.lib.mail_notifier.outbox import EmailOutbox
+from tracim_backend.lib.mail_notifier.sender import SmtpConnectionPool
+from tracim_backend.lib.mail_notifier.sender import send_email_through
+from tracim_backend.lib.mail_notifier.utils import EmailTemplateLookup
+from tracim_backend.lib.mail_notifier.utils import SmtpConfiguration
+from tracim_backend.models.auth import AuthType
 from tracim_backend.models.auth import User
 from tracim_backend.models.data import Content
+from tracim_backend.models.data import EmailOutboxMessage
+from tracim_backend.models.data import NotificationDigestEvent
+from tracim_backend.models.data import UserRoleInWorkspace
+from tracim_backend.models.revision_protection import new_revision
 from tracim_backend.tests import DefaultTest
 from tracim_backend.tests import eq_
 
@@ -39,3 +73,492 @@ class TestNotifierFactory(DefaultTest):
 class TestEmailNotifier(DefaultTest):
     # TODO - G.M - 04-03-2017 -  [emailNotif] - Restore test for email Notif
     pass
+
+
+class TestEmailManager(DefaultTest):
+    fixtures = [BaseFixture, ContentFixture]
+    config_section = 'mail_test'
+
+    def test_unit__notify_content_update__ok__context_built_once_per_lang(self):  # nopep8
+        uapi = UserApi(
+            current_user=None,
+            session=self.session,
+            config=self.app_config,
+        )
+        admin = uapi.get_one_by_email('admin@admin.admin')
+        admin.lang = 'en'
+        bob = uapi.get_one_by_email('bob@fsf.local')
+        john = uapi.get_one_by_email('john-the-reader@reader.local')
+        john.lang = 'fr'
+        alice = uapi.create_user(
+            email='alice@alice.alice',
+            name='alice',
+            lang='fr',
+            auth_type=AuthType.INTERNAL,
+            do_save=True,
+            do_notify=False,
+        )
+        wapi = WorkspaceApi(
+            current_user=admin,
+            session=self.session,
+            config=self.app_config,
+        )
+        workspace = wapi.get_one_by_label('Recipes')
+        RoleApi(
+            current_user=admin,
+            session=self.session,
+            config=self.app_config,
+        ).create_one(
+            alice,
+            workspace,
+            UserRoleInWorkspace.READER,
+            with_notif=True,
+        )
+        wapi.enable_notifications(john, workspace)
+        content = ContentApi(
+            current_user=bob,
+            session=self.session,
+            config=self.app_config,
+        ).create(
+            content_type_list.Thread.slug,
+            workspace,
+            None,
+            'thread1',
+            do_save=True,
+            do_notify=False,
+        )
+        email_manager = EmailManager(
+            SmtpConfiguration(
+                self.app_config.EMAIL_NOTIFICATION_SMTP_SERVER,
+                self.app_config.EMAIL_NOTIFICATION_SMTP_PORT,
+                self.app_config.EMAIL_NOTIFICATION_SMTP_USER,
+                self.app_config.EMAIL_NOTIFICATION_SMTP_PASSWORD
+            ),
+            self.app_config,
+            self.session,
+        )
+        with patch(
+            'tracim_backend.lib.mail_notifier.notifier.send_email_through'
+        ) as send_email_mock, patch.object(
+            email_manager,
+            '_build_shared_context_for_content_update',
+            wraps=email_manager._build_shared_context_for_content_update,
+        ) as build_context_mock, patch.object(
+            email_manager,
+            '_build_email_body_for_content',
+            wraps=email_manager._build_email_body_for_content,
+        ) as build_body_mock:
+            email_manager.notify_content_update(
+                bob.user_id,
+                content.content_id,
+            )
+        assert build_context_mock.call_count == 2
+        assert build_body_mock.call_count == 2
+        recipients = [
+            call[0][2]['To'] for call in send_email_mock.call_args_list
+        ]
+        for call in send_email_mock.call_args_list:
+            message = call[0][2]
+            body_html = message.get_payload()[0].get_payload(decode=True).decode('utf-8')  # nopep8
+            username = message['To'].split(' <')[0]
+            assert CONTENT_UPDATE_RECIPIENT_INTRO_PLACEHOLDER not in body_html
+            assert username in body_html
+        assert sorted(recipients) == sorted([
+            'Global manager <admin@admin.admin>',
+            'John Reader <john-the-reader@reader.local>',
+            'alice <alice@alice.alice>',
+        ])
+
+
+class TestNotificationDigest(DefaultTest):
+    fixtures = [BaseFixture, ContentFixture]
+    config_section = 'mail_test_digest'
+
+    def test_unit__flush_workspace__ok__one_email_per_user(self):
+        uapi = UserApi(
+            current_user=None,
+            session=self.session,
+            config=self.app_config,
+        )
+        admin = uapi.get_one_by_email('admin@admin.admin')
+        bob = uapi.get_one_by_email('bob@fsf.local')
+        john = uapi.get_one_by_email('john-the-reader@reader.local')
+        wapi = WorkspaceApi(
+            current_user=admin,
+            session=self.session,
+            config=self.app_config,
+        )
+        workspace = wapi.get_one_by_label('Recipes')
+        wapi.enable_notifications(john, workspace)
+        api = ContentApi(
+            current_user=bob,
+            session=self.session,
+            config=self.app_config,
+        )
+        with patch(
+            'tracim_backend.lib.mail_notifier.digest.send_email_through'
+        ) as send_email_mock:
+            content = api.create(
+                content_type_list.Page.slug,
+                workspace,
+                None,
+                'page1',
+                do_save=True,
+            )
+            for text in ('first', 'second'):
+                with new_revision(
+                    session=self.session,
+                    tm=transaction.manager,
+                    content=content,
+                ):
+                    api.update_content(content, 'page1', text)
+                api.save(content)
+            api.create_comment(workspace, content, 'comment', do_save=True)
+            transaction.commit()
+            # INFO - G.M - 2019-04-11 - events are only stored
+            assert send_email_mock.call_count == 0
+            assert self.session.query(NotificationDigestEvent).count() == 4
+
+            digest = NotificationDigest(self.app_config, self.session)
+            now = datetime.datetime.utcnow()
+            assert digest.get_due_workspace_ids(now) == []
+            quiet_now = now + datetime.timedelta(seconds=301)
+            assert digest.get_due_workspace_ids(quiet_now) == [
+                workspace.workspace_id
+            ]
+            messages = digest.flush_workspace(workspace.workspace_id)
+            # INFO - G.M - 2019-04-11 - emails are only sent after commit
+            assert send_email_mock.call_count == 0
+            transaction.commit()
+            digest.send_emails(messages)
+
+        assert self.session.query(NotificationDigestEvent).count() == 0
+        # INFO - G.M - 2019-04-11 - bob made all updates and gets no email
+        recipients = [
+            call[0][2]['To'] for call in send_email_mock.call_args_list
+        ]
+        assert sorted(recipients) == sorted([
+            'Global manager <admin@admin.admin>',
+            'John Reader <john-the-reader@reader.local>',
+        ])
+        subject = send_email_mock.call_args_list[0][0][2]['Subject']
+        assert subject == '[TRACIM] [Recipes] 1 updated content(s)'
+
+    def test_unit__flush_workspace__ok__escaped_and_sent_after_failure(self):
+        uapi = UserApi(
+            current_user=None,
+            session=self.session,
+            config=self.app_config,
+        )
+        admin = uapi.get_one_by_email('admin@admin.admin')
+        bob = uapi.get_one_by_email('bob@fsf.local')
+        john = uapi.get_one_by_email('john-the-reader@reader.local')
+        bob.display_name = '<i>bob</i>'
+        wapi = WorkspaceApi(
+            current_user=admin,
+            session=self.session,
+            config=self.app_config,
+        )
+        workspace = wapi.get_one_by_label('Recipes')
+        workspace.label = '<b>Recipes</b>'
+        wapi.enable_notifications(john, workspace)
+        api = ContentApi(
+            current_user=bob,
+            session=self.session,
+            config=self.app_config,
+        )
+        api.create(
+            content_type_list.Page.slug,
+            workspace,
+            None,
+            'page1',
+            do_save=True,
+        )
+        transaction.commit()
+        digest = NotificationDigest(self.app_config, self.session)
+        messages = digest.flush_workspace(workspace.workspace_id)
+        transaction.commit()
+        assert len(messages) == 2
+        for message in messages:
+            body = message.get_payload()[0].get_payload(decode=True).decode()
+            assert '&lt;b&gt;Recipes&lt;/b&gt;' in body
+            assert '&lt;i&gt;bob&lt;/i&gt;' in body
+            assert '<b>' not in body
+            assert '<i>' not in body
+
+        with patch(
+            'tracim_backend.lib.mail_notifier.digest.send_email_through',
+            side_effect=[smtplib.SMTPException('fail'), None],
+        ) as send_email_mock:
+            digest.send_emails(messages)
+        # INFO - G.M - 2019-04-11 - first failure does not prevent sending to
+        # next recipient, and consumed events are not restored
+        assert send_email_mock.call_count == 2
+        assert self.session.query(NotificationDigestEvent).count() == 0
+
+    def test_unit__get_due_workspace_ids__ok__max_delay(self):
+        workspace = WorkspaceApi(
+            current_user=None,
+            session=self.session,
+            config=self.app_config,
+        ).get_one_by_label('Recipes')
+        bob = UserApi(
+            current_user=None,
+            session=self.session,
+            config=self.app_config,
+        ).get_one_by_email('bob@fsf.local')
+        content = self.session.query(Content).filter(
+            Content.workspace_id == workspace.workspace_id
+        ).first()
+        now = datetime.datetime.utcnow()
+        # INFO - G.M - 2019-04-11 - workspace is never quiet: one event each
+        # minute for more than max delay.
+        for minute in range(70):
+            self.session.add(
+                NotificationDigestEvent(
+                    workspace_id=workspace.workspace_id,
+                    content_id=content.content_id,
+                    actor_id=bob.user_id,
+                    action='edition',
+                    created=now - datetime.timedelta(minutes=minute),
+                )
+            )
+        self.session.flush()
+        digest = NotificationDigest(self.app_config, self.session)
+        assert digest.get_due_workspace_ids(now) == [workspace.workspace_id]
+
+
+class TestEmailOutbox(DefaultTest):
+    fixtures = [BaseFixture]
+    config_section = 'mail_test_outbox'
+
+    def _get_email_manager(self) -> EmailManager:
+        return EmailManager(
+            SmtpConfiguration(
+                self.app_config.EMAIL_NOTIFICATION_SMTP_SERVER,
+                self.app_config.EMAIL_NOTIFICATION_SMTP_PORT,
+                self.app_config.EMAIL_NOTIFICATION_SMTP_USER,
+                self.app_config.EMAIL_NOTIFICATION_SMTP_PASSWORD
+            ),
+            self.app_config,
+            self.session,
+        )
+
+    def test_unit__relay__ok__nominal_case(self):
+        admin = UserApi(
+            current_user=None,
+            session=self.session,
+            config=self.app_config,
+        ).get_one_by_email('admin@admin.admin')
+        with patch('smtplib.SMTP') as smtp_mock:
+            self._get_email_manager().notify_created_account(admin, 'password')
+        assert not smtp_mock.called
+        transaction.commit()
+        outbox = EmailOutbox(self.app_config, self.session)
+        assert outbox.get_metrics().pending == 1
+
+        sendmail_mock = MagicMock()
+        result = outbox.relay(sendmail_mock)
+        transaction.commit()
+        assert result.sent == 1
+        assert result.failed == 0
+        assert len(result.latencies) == 1
+        sent_message = sendmail_mock.call_args[0][0]
+        assert sent_message['To'] == 'Global manager <admin@admin.admin>'
+        assert self.session.query(EmailOutboxMessage).count() == 0
+
+    def test_unit__add__ok__rollbacked_with_transaction(self):
+        admin = UserApi(
+            current_user=None,
+            session=self.session,
+            config=self.app_config,
+        ).get_one_by_email('admin@admin.admin')
+        self._get_email_manager().notify_created_account(admin, 'password')
+        assert self.session.query(EmailOutboxMessage).count() == 1
+        self.session.rollback()
+        transaction.abort()
+        assert self.session.query(EmailOutboxMessage).count() == 0
+
+    def test_unit__send_email_through__err__no_session(self):
+        message = MIMEText('hello')
+        message['To'] = 'bob@fsf.local'
+        with pytest.raises(NotificationSendingFailed):
+            send_email_through(self.app_config, MagicMock(), message)
+
+    def test_unit__get_due_messages__ok__skip_locked_if_supported(self):
+        outbox = EmailOutbox(self.app_config, MagicMock())
+        dialect = outbox._session.get_bind.return_value.dialect
+        for name, server_version_info, skip_locked in (
+            ('postgresql', (9, 6), True),
+            ('mysql', (5, 7, 25), False),
+            ('mysql', (8, 0, 15), True),
+            ('mysql', (5, 5, 5, 10, 3, 13, 'MariaDB'), False),
+            ('mysql', (10, 6, 4, 'MariaDB'), True),
+            ('sqlite', (3, 22, 0), False),
+        ):
+            dialect.name = name
+            dialect.server_version_info = server_version_info
+            outbox.get_due_messages()
+            query = outbox._session.query.return_value
+            query.filter.return_value.order_by.return_value.limit.return_value.with_for_update.assert_called_with(  # nopep8
+                skip_locked=skip_locked
+            )
+
+    def test_unit__relay__ok__retry_with_backoff(self):
+        message = MIMEText('hello')
+        message['To'] = 'bob@fsf.local'
+        message['Subject'] = 'hello'
+        outbox = EmailOutbox(self.app_config, self.session)
+        outbox.add(message)
+        transaction.commit()
+        sendmail_mock = MagicMock(
+            side_effect=smtplib.SMTPServerDisconnected('disconnected')
+        )
+        now = datetime.datetime.utcnow() + datetime.timedelta(seconds=1)
+
+        result = outbox.relay(sendmail_mock, now)
+        assert result.failed == 1
+        outbox_message = self.session.query(EmailOutboxMessage).one()
+        assert outbox_message.attempts == 1
+        assert outbox_message.last_error == 'disconnected'
+        assert outbox_message.next_attempt == now + datetime.timedelta(seconds=60)  # nopep8
+        # INFO - G.M - 2019-04-12 - not due yet
+        assert outbox.relay(sendmail_mock, now).failed == 0
+        metrics = outbox.get_metrics(now)
+        assert metrics.pending == 1
+        assert metrics.retrying == 1
+
+        # INFO - G.M - 2019-04-12 - delay is doubled, up to max retry delay
+        now = outbox_message.next_attempt
+        assert outbox.relay(sendmail_mock, now).failed == 1
+        assert outbox_message.next_attempt == now + datetime.timedelta(seconds=100)  # nopep8
+
+        # INFO - G.M - 2019-04-12 - max attempts reached
+        now = outbox_message.next_attempt
+        assert outbox.relay(sendmail_mock, now).failed == 1
+        assert outbox_message.attempts == 3
+        assert outbox_message.next_attempt is None
+        metrics = outbox.get_metrics(now)
+        assert metrics.pending == 0
+        assert metrics.failed == 1
+        assert sendmail_mock.call_count == 3
+
+
+class TestContentNotificationQueue(DefaultTest):
+
+    def test_unit__enqueue__ok__pending_job_collapsed(self):
+        notification_queue = ContentNotificationQueue(self.app_config)
+        notification_queue._queue = MagicMock()
+        notification_queue._queue.connection.set.side_effect = [True, None]
+        notification_queue.enqueue(1, 42)
+        notification_queue.enqueue(1, 42)
+        notification_queue._queue.enqueue_call.assert_called_once_with(
+            notify_content_update,
+            args=(self.app_config, 1, 42),
+            result_ttl=0,
+        )
+        notification_queue._queue.connection.set.assert_called_with(
+            'tracim:content_notification:pending:1:42',
+            1,
+            nx=True,
+            ex=PENDING_CONTENT_NOTIFICATION_JOB_TTL,
+        )
+
+    def test_unit__get_job_session_factory__ok__shared_by_jobs(self):
+        session_factory = get_job_session_factory(self.app_config)
+        assert get_job_session_factory(self.app_config) is session_factory
+        dispose_job_engines()
+        assert get_job_session_factory(self.app_config) is not session_factory  # nopep8
+        dispose_job_engines()
+
+
+class TestEmailTemplateLookup(object):
+
+    def test_unit__get_template__ok__compiled_once(self, tmpdir):
+        template_path = tmpdir.join('body.mak')
+        template_path.write('Hello ${name}')
+        EmailTemplateLookup.clear()
+        template = EmailTemplateLookup.get_template(str(template_path))
+        assert template.render(name='bob') == 'Hello bob'
+        assert EmailTemplateLookup.get_template(str(template_path)) is template  # nopep8
+
+    def test_unit__get_template__ok__modified_template(self, tmpdir):
+        template_path = tmpdir.join('body.mak')
+        template_path.write('Hello ${name}')
+        module_dir = tmpdir.join('modules')
+        EmailTemplateLookup.clear()
+        template = EmailTemplateLookup.get_template(
+            str(template_path),
+            module_directory=str(module_dir),
+        )
+        assert template.render(name='bob') == 'Hello bob'
+        assert module_dir.listdir()
+
+        template_path.write('Bye ${name}')
+        mtime = os.path.getmtime(str(template_path))
+        os.utime(str(template_path), (mtime + 10, mtime + 10))
+        new_template = EmailTemplateLookup.get_template(
+            str(template_path),
+            module_directory=str(module_dir),
+        )
+        assert new_template is not template
+        assert new_template.render(name='bob') == 'Bye bob'
+
+
+class TestSmtpConnectionPool(object):
+
+    def _get_pool(self, **kwargs) -> typing.Tuple[SmtpConnectionPool, MagicMock]:  # nopep8
+        connection_factory = MagicMock(
+            side_effect=lambda: MagicMock(
+                send_message=MagicMock(return_value={}),
+                noop=MagicMock(return_value=(250, b'OK')),
+            )
+        )
+        pool_kwargs = {
+            'pool_size': 2,
+            'max_messages_per_connection': 100,
+            'health_check_interval': 30,
+        }
+        pool_kwargs.update(kwargs)
+        return SmtpConnectionPool(connection_factory, **pool_kwargs), connection_factory  # nopep8
+
+    def test_unit__send_message__ok__connection_reused(self):
+        pool, connection_factory = self._get_pool()
+        for _ in range(3):
+            assert pool.send_message(MIMEText('hello')) == {}
+        assert connection_factory.call_count == 1
+
+    def test_unit__send_message__ok__max_messages_per_connection(self):
+        pool, connection_factory = self._get_pool(
+            max_messages_per_connection=2
+        )
+        connections = []
+
+        def new_connection():
+            connection = MagicMock(send_message=MagicMock(return_value={}))
+            connections.append(connection)
+            return connection
+        connection_factory.side_effect = new_connection
+        for _ in range(3):
+            pool.send_message(MIMEText('hello'))
+        assert len(connections) == 2
+        assert connections[0].send_message.call_count == 2
+        assert connections[0].quit.called
+        assert connections[1].send_message.call_count == 1
+        assert not connections[1].quit.called
+
+    def test_unit__send_message__ok__reconnect(self):
+        pool, connection_factory = self._get_pool(health_check_interval=0)
+        pool.send_message(MIMEText('hello'))
+        # broken idle connection is replaced
+        broken_connection = pool.acquire()
+        broken_connection.connection.noop.return_value = (421, b'closed')
+        pool.release(broken_connection)
+        pool.send_message(MIMEText('hello'))
+        assert connection_factory.call_count == 2
+        # connection closed by server while sending is replaced
+        connection = pool.acquire()
+        connection.connection.send_message.side_effect = smtplib.SMTPServerDisconnected()  # nopep8
+        pool.release(connection)
+        assert pool.send_message(MIMEText('hello')) == {}
+        assert connection_factory.call_count == 3
@@ -18,6 +18,7 @@ from tracim_backend.lib.core.group import GroupApi
 from tracim_backend.lib.core.user import UserApi
 from tracim_backend.lib.core.userworkspace import RoleApi
 from tracim_backend.lib.core.workspace import WorkspaceApi
+from tracim_backend.lib.utils.credentials_cache import CredentialsCache
 from tracim_backend.models.auth import User
 from tracim_backend.models.auth import AuthType
 from tracim_backend.models.auth import User
@@ -923,6 +924,49 @@ class TestUserApi(DefaultTest):
         with pytest.raises(AuthenticationFailed):
             api.authenticate('test@test.test', 'test@test.test')
 
+    @pytest.mark.internal_auth
+    def test_unit__authenticate_user___ok__credentials_cache(self):
+        api = UserApi(
+            current_user=None,
+            session=self.session,
+            config=self.app_config,
+        )
+        gapi = GroupApi(
+            current_user=None,
+            session=self.session,
+            config=self.app_config,
+        )
+        groups = [gapi.get_one_with_name('users')]
+        user = api.create_user(
+            email='test@test.test',
+            password='password',
+            name='bob',
+            groups=groups,
+            timezone='Europe/Paris',
+            do_save=True,
+            do_notify=False,
+        )
+        credentials_cache = CredentialsCache(ttl=60, max_size=10)
+        assert api.authenticate('test@test.test', 'password', credentials_cache=credentials_cache) == user  # nopep8
+        assert api.authenticate('test@test.test', 'password', credentials_cache=credentials_cache) == user  # nopep8
+        assert credentials_cache.get_metrics() == (1, 1, 1)
+        with pytest.raises(AuthenticationFailed):
+            api.authenticate('test@test.test', 'wrong_password', credentials_cache=credentials_cache)  # nopep8
+
+        # INFO - G.M - 2019-04-19 - password change invalidate cached
+        # credentials
+        user.password = 'new_password'
+        self.session.flush()
+        with pytest.raises(AuthenticationFailed):
+            api.authenticate('test@test.test', 'password', credentials_cache=credentials_cache)  # nopep8
+        assert api.authenticate('test@test.test', 'new_password', credentials_cache=credentials_cache) == user  # nopep8
+
+        # INFO - G.M - 2019-04-19 - so does disabling of user
+        api.disable(user, do_save=True)
+        with pytest.raises(AuthenticationFailed):
+            api.authenticate('test@test.test', 'new_password', credentials_cache=credentials_cache)  # nopep8
+        assert credentials_cache.hits == 1
+
     @pytest.mark.internal_auth
     def test_unit__authenticate_user___err__wrong_password(self):
         api = UserApi(
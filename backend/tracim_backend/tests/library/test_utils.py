@@ -1,3 +1,6 @@
+import json
+from types import SimpleNamespace
+
 import pytest
 
 from tracim_backend.lib.utils.utils import ALLOWED_AUTOGEN_PASSWORD_CHAR
@@ -5,6 +8,10 @@ from tracim_backend.lib.utils.utils import DEFAULT_PASSWORD_GEN_CHAR_LENGTH
 from tracim_backend.lib.utils.utils import ExtendedColor
 from tracim_backend.lib.utils.utils import clamp
 from tracim_backend.lib.utils.utils import password_generator
+from tracim_backend.lib.utils.translation import TRANSLATION_FILENAME
+from tracim_backend.lib.utils.translation import Translator
+from tracim_backend.lib.utils.translation import get_translation_catalog
+from tracim_backend.lib.utils.translation import preload_translation_catalogs
 
 
 class TestPasswordGenerator(object):
@@ -67,3 +74,57 @@ class TestExtendedColor(object):
         # add X% more light to something already dark.
         assert color_darken == color_lighten
         assert color_darken.web == color.web
+
+
+class TestTranslator(object):
+
+    def _create_i18n_folder(self, tmpdir):
+        i18n_folder = tmpdir.mkdir('i18n')
+        i18n_folder.mkdir('en').join(TRANSLATION_FILENAME).write(
+            json.dumps({'Hello': 'Hello', 'Bye': 'Goodbye', 'Empty': ''})
+        )
+        i18n_folder.mkdir('fr').join(TRANSLATION_FILENAME).write(
+            json.dumps({'Hello': 'Bonjour', 'Bye': ''})
+        )
+        return str(i18n_folder)
+
+    def test_unit__get_translation__ok__nominal_case(self, tmpdir):
+        config = SimpleNamespace(
+            BACKEND_I18N_FOLDER=self._create_i18n_folder(tmpdir),
+            DEFAULT_LANG='en',
+        )
+        translator = Translator(config, default_lang='fr')
+        assert translator.get_translation('Hello') == 'Bonjour'
+        # fallback lang
+        assert translator.get_translation('Bye') == 'Goodbye'
+        assert translator.get_translation('Empty') == 'Empty'
+        assert translator.get_translation('Unknown') == 'Unknown'
+        assert translator.get_translation('Hello', lang='en') == 'Hello'
+        assert translator.get_translation('Hello', lang='de') == 'Hello'
+
+    def test_unit__get_translation__ok__catalog_loaded_once(self, tmpdir):
+        i18n_folder = self._create_i18n_folder(tmpdir)
+        config = SimpleNamespace(
+            BACKEND_I18N_FOLDER=i18n_folder,
+            DEFAULT_LANG='en',
+        )
+        preload_translation_catalogs(config)
+        catalog = get_translation_catalog(i18n_folder, 'fr')
+        assert catalog['Hello'] == 'Bonjour'
+        with pytest.raises(TypeError):
+            catalog['Hello'] = 'Salut'
+
+        tmpdir.join('i18n', 'fr', TRANSLATION_FILENAME).remove()
+        assert get_translation_catalog(i18n_folder, 'fr') is catalog
+        translator = Translator(config, default_lang='fr')
+        assert translator.get_translation('Hello') == 'Bonjour'
+
+    def test_unit__preload_translation_catalogs__ok__no_i18n_folder(self, tmpdir):  # nopep8
+        i18n_folder = tmpdir.join('missing').strpath
+        config = SimpleNamespace(
+            BACKEND_I18N_FOLDER=i18n_folder,
+            DEFAULT_LANG='en',
+        )
+        preload_translation_catalogs(config)
+        translator = Translator(config, default_lang='fr')
+        assert translator.get_translation('Hello') == 'Hello'
@@ -1,17 +1,39 @@
 # -*- coding: utf-8 -*-
+import hashlib
+import io
 from unittest.mock import MagicMock
+from unittest.mock import patch
+
+import ldap3
+import pytest
+from depot.io.local import LocalFileStorage
+from depot.io.memory import MemoryFileStorage
+from ldap3.core.exceptions import LDAPBindError
+from ldap3.core.exceptions import LDAPSocketOpenError
+from pyramid_ldap3 import Connector
+from pyramid_ldap3 import _LDAPQuery
+from wsgidav.dav_error import HTTP_LOCKED
+from wsgidav.dav_error import DAVError
 
 from wsgidav import util
 
 from tracim_backend import WebdavAppFactory
+from tracim_backend.exceptions import ContentNotFound
 from tracim_backend.fixtures.content import Content as ContentFixtures
 from tracim_backend.fixtures.users_and_groups import Base as BaseFixture
+from tracim_backend.lib.core.content import ContentApi
 from tracim_backend.lib.core.notifications import DummyNotifier
 from tracim_backend.lib.core.user import UserApi
+from tracim_backend.lib.core.workspace import WorkspaceApi
+from tracim_backend.lib.utils.authorization import RoleChecker
 from tracim_backend.lib.webdav import TracimDomainController
 from tracim_backend.lib.webdav.dav_provider import Provider
 from tracim_backend.lib.webdav.dav_provider import WebdavTracimContext
+from tracim_backend.lib.webdav.ldap_pool import PooledLDAPConnectionManager
+from tracim_backend.lib.webdav.lock_storage import LockStorage
 from tracim_backend.lib.webdav.resources import RootResource
+from tracim_backend.lib.webdav.utils import DepotFileStream
+from tracim_backend.lib.webdav.utils import open_depot_file
 from tracim_backend.models.data import Content
 from tracim_backend.models.data import ContentRevisionRO
 from tracim_backend.tests import StandardTest
@@ -271,6 +293,181 @@ class TestWebDav(StandardTest):
         assert pie, 'Apple_Pie should be found'
         eq_('Apple_Pie.txt', pie.name)
 
+    def test_unit__get_content_path_by_labels__ok__nominal_case(self):
+        user = self._get_user('bob@fsf.local')
+        workspace = WorkspaceApi(
+            current_user=user,
+            session=self.session,
+            config=self.app_config,
+        ).get_one_by_label('Recipes')
+        content_api = ContentApi(
+            current_user=user,
+            session=self.session,
+            config=self.app_config,
+        )
+        contents = content_api.get_content_path_by_labels(
+            content_label='New Fruit Salad.document.html',
+            content_parent_labels=['Desserts', 'Fruits Desserts'],
+            workspace=workspace,
+        )
+        assert [content.label for content in contents] == [
+            'Desserts',
+            'Fruits Desserts',
+            'New Fruit Salad',
+        ]
+        contents = content_api.get_content_path_by_labels(
+            content_label='new fruit salad.document.html',
+            content_parent_labels=['Fruits Desserts'],
+            workspace=workspace,
+            parent_folder=contents[0],
+        )
+        assert [content.label for content in contents] == [
+            'Fruits Desserts',
+            'New Fruit Salad',
+        ]
+        with pytest.raises(ContentNotFound):
+            content_api.get_content_path_by_labels(
+                content_label='New Fruit Salad.document.html',
+                content_parent_labels=['Salads', 'Fruits Desserts'],
+                workspace=workspace,
+            )
+
+    def test_unit__get_content_path_by_labels__ok__without_recursive_cte(self):  # nopep8
+        user = self._get_user('bob@fsf.local')
+        workspace = WorkspaceApi(
+            current_user=user,
+            session=self.session,
+            config=self.app_config,
+        ).get_one_by_label('Recipes')
+        content_api = ContentApi(
+            current_user=user,
+            session=self.session,
+            config=self.app_config,
+        )
+        with patch.object(
+            ContentApi,
+            '_support_recursive_cte',
+            return_value=False,
+        ), patch.object(
+            ContentApi,
+            '_get_content_path_by_labels_level_by_level',
+            autospec=True,
+            side_effect=ContentApi._get_content_path_by_labels_level_by_level,  # nopep8
+        ) as level_by_level_mock:
+            contents = content_api.get_content_path_by_labels(
+                content_label='New Fruit Salad.document.html',
+                content_parent_labels=['Desserts', 'Fruits Desserts'],
+                workspace=workspace,
+            )
+            assert [content.label for content in contents] == [
+                'Desserts',
+                'Fruits Desserts',
+                'New Fruit Salad',
+            ]
+            contents = content_api.get_content_path_by_labels(
+                content_label='new fruit salad.document.html',
+                content_parent_labels=['Fruits Desserts'],
+                workspace=workspace,
+                parent_folder=contents[0],
+            )
+            assert [content.label for content in contents] == [
+                'Fruits Desserts',
+                'New Fruit Salad',
+            ]
+            with pytest.raises(ContentNotFound):
+                content_api.get_content_path_by_labels(
+                    content_label='New Fruit Salad.document.html',
+                    content_parent_labels=['Salads', 'Fruits Desserts'],
+                    workspace=workspace,
+                )
+            with pytest.raises(ContentNotFound):
+                content_api.get_content_path_by_labels(
+                    content_label='Unknown.document.html',
+                    content_parent_labels=['Desserts'],
+                    workspace=workspace,
+                )
+            assert level_by_level_mock.call_count == 4
+
+    def test_unit__support_recursive_cte__ok__mysql_versions(self):
+        content_api = ContentApi(
+            current_user=None,
+            session=self.session,
+            config=self.app_config,
+        )
+        assert content_api._support_recursive_cte()
+        for version, expected in (
+            ((5, 7, 25), False),
+            ((8, 0, 15), True),
+            ((5, 5, 5, 10, 1, 38, 'MariaDB'), False),
+            ((5, 5, 5, 10, 2, 22, 'MariaDB'), True),
+        ):
+            dialect = MagicMock()
+            dialect.name = 'mysql'
+            dialect.server_version_info = version
+            with patch.object(self.session, 'get_bind') as get_bind_mock:
+                get_bind_mock.return_value.dialect = dialect
+                assert content_api._support_recursive_cte() is expected
+
+    def test_unit__get_resource_inst__ok__path_resolution_cached(self):
+        provider = self._get_provider(self.app_config)
+        environ = self._get_environ(
+            provider,
+            'bob@fsf.local',
+        )
+        salad_path = '/Recipes/Desserts/Fruits Desserts/New Fruit Salad.document.html'  # nopep8
+        pie_path = '/Recipes/Desserts/Apple_Pie.txt'
+        with patch.object(
+            ContentApi,
+            'get_content_path_by_labels',
+            autospec=True,
+            side_effect=ContentApi.get_content_path_by_labels,
+        ) as resolve_mock:
+            assert provider.exists(salad_path, environ)
+            assert provider.getResourceInst(salad_path, environ)
+            assert resolve_mock.call_count == 1
+
+            # INFO - G.M - 2019-04-18 - Desserts folder is already resolved
+            pie = provider.getResourceInst(pie_path, environ)
+            assert pie
+            assert resolve_mock.call_count == 2
+            assert resolve_mock.call_args[1]['content_parent_labels'] == []
+            assert resolve_mock.call_args[1]['parent_folder'].label == 'Desserts'  # nopep8
+
+            # INFO - G.M - 2019-04-18 - cache is dropped on database change
+            pie.delete()
+            assert not provider.exists(pie_path, environ)
+            assert resolve_mock.call_count == 3
+
+    def test_unit__get_member_list__ok__properties_batch_loaded(self):
+        provider = self._get_provider(self.app_config)
+        environ = self._get_environ(
+            provider,
+            'bob@fsf.local',
+        )
+        desserts = provider.getResourceInst('/Recipes/Desserts', environ)
+        with patch.object(
+            RoleChecker,
+            'check',
+            autospec=True,
+            side_effect=RoleChecker.check,
+        ) as check_mock:
+            members = desserts.getMemberList()
+            lengths = {
+                member.name: member.getContentLength()
+                for member in members
+                if not member.isCollection
+            }
+            for member in members:
+                member.getDisplayName()
+                member.getLastModified()
+            # INFO - G.M - 2019-04-19 - is_reader is checked once for all
+            # getters of all members
+            assert check_mock.call_count == 1
+
+        pie = [member for member in members if member.name == 'Apple_Pie.txt'][0]  # nopep8
+        assert lengths['Apple_Pie.txt'] == pie.content.depot_file.file.content_length  # nopep8
+        assert lengths['Best Cakesʔ.thread.html'] > 0
+
     def test_unit__delete_content__ok(self):
         provider = self._get_provider(self.app_config)
         pie = provider.getResourceInst(
@@ -643,3 +840,254 @@ class TestWebDav(StandardTest):
                 DummyNotifier.send_count
             ),
         )
+
+    def test_unit__create_content__ok__spooled_on_disk(self):
+        # INFO - G.M - 2019-04-04 - small spool size to force spooling
+        # received data on disk
+        self.app_config.WEBDAV_SPOOL_MAX_SIZE = 4
+        provider = self._get_provider(self.app_config)
+        environ = self._get_environ(
+            provider,
+            'bob@fsf.local',
+        )
+        parent_resource = provider.getResourceInst(
+            '/Recipes/Salads',
+            environ,
+        )
+        new_resource = parent_resource.createEmptyResource('big_salad.txt')
+        write_object = new_resource.beginWrite(
+            contentType='application/octet-stream',
+        )
+        for _ in range(10):
+            write_object.write(b'tomato\n')
+        write_object.close()
+        new_resource.endWrite(withErrors=False)
+
+        result = provider.getResourceInst(
+            '/Recipes/Salads/big_salad.txt',
+            environ,
+        )
+        assert result
+        assert result.content.depot_file.file.read() == b'tomato\n' * 10
+        assert result.content.revision.blob.size == 70
+        assert result.content.revision.blob_hash == hashlib.sha256(
+            b'tomato\n' * 10
+        ).hexdigest()
+
+
+class TestOpenDepotFile(object):
+
+    def test_unit__open_depot_file__ok__local_storage_seekable(self, tmpdir):
+        storage = LocalFileStorage(tmpdir.strpath)
+        file_id = storage.create(b'0123456789', 'file.txt')
+        with open_depot_file(storage.get(file_id), block_size=4) as file:
+            assert not isinstance(file, DepotFileStream)
+            assert file.seekable()
+            file.seek(6)
+            assert file.read(2) == b'67'
+            file.seek(2)
+            assert file.read() == b'23456789'
+
+    def test_unit__open_depot_file__ok__other_storage_fallback(self):
+        storage = MemoryFileStorage()
+        file_id = storage.create(b'0123456789', 'file.txt')
+        with open_depot_file(storage.get(file_id), block_size=4) as file:
+            assert isinstance(file, DepotFileStream)
+            assert file.seek(6) == 6
+            assert file.read(2) == b'67'
+            assert file.seek(1, io.SEEK_CUR) == 9
+            assert file.read() == b'9'
+            with pytest.raises(io.UnsupportedOperation):
+                file.seek(2)
+
+
+class TestPooledLDAPConnectionManager(object):
+
+    def _get_manager(self) -> PooledLDAPConnectionManager:
+        return PooledLDAPConnectionManager(
+            uri='ldap://localhost:3890',
+            bind='cn=admin,dc=directory,dc=fsf,dc=org',
+            passwd='toor',
+            use_pool=True,
+            pool_size=2,
+            pool_lifetime=3600,
+        )
+
+    def test_unit__connection__ok__connection_reused(self):
+        manager = self._get_manager()
+        with patch.object(
+            ldap3,
+            'Connection',
+            side_effect=lambda *args, **kwargs: MagicMock(closed=False, bound=True),  # nopep8
+        ) as connection_mock:
+            with manager.connection() as conn:
+                pass
+            with manager.connection() as conn2:
+                pass
+            assert conn is conn2
+            assert connection_mock.call_count == 1
+
+            # INFO - G.M - 2019-04-19 - closed connection is replaced
+            conn.closed = True
+            with manager.connection() as conn3:
+                pass
+            assert conn3 is not conn
+            assert connection_mock.call_count == 2
+            conn.unbind.assert_called_once_with()
+
+    def test_unit__connection__ok__broken_connection_dropped(self):
+        manager = self._get_manager()
+        with patch.object(
+            ldap3,
+            'Connection',
+            side_effect=lambda *args, **kwargs: MagicMock(closed=False, bound=True),  # nopep8
+        ) as connection_mock:
+            with pytest.raises(LDAPSocketOpenError):
+                with manager.connection() as conn:
+                    raise LDAPSocketOpenError()
+            conn.unbind.assert_called_once_with()
+            with manager.connection() as conn2:
+                pass
+            assert conn2 is not conn
+            assert connection_mock.call_count == 2
+
+    def test_unit__connection__ok__connection_reused_after_other_error(self):
+        manager = self._get_manager()
+        with patch.object(
+            ldap3,
+            'Connection',
+            side_effect=lambda *args, **kwargs: MagicMock(closed=False, bound=True),  # nopep8
+        ) as connection_mock:
+            with pytest.raises(ValueError):
+                with manager.connection() as conn:
+                    raise ValueError()
+            conn.unbind.assert_not_called()
+            with manager.connection() as conn2:
+                pass
+            assert conn2 is conn
+            assert connection_mock.call_count == 1
+
+    def test_unit__authenticate__ok__mock_server(self):
+        manager = self._get_manager()
+        connection_class = ldap3.Connection
+        mock_strategies = {
+            ldap3.SYNC: ldap3.MOCK_SYNC,
+            ldap3.ASYNC: ldap3.MOCK_ASYNC,
+        }
+
+        def mock_connection(*args, client_strategy, **kwargs):
+            # INFO - G.M - 2019-04-19 - same strategy, but with a mock server,
+            # mock strategies ignore auto_bind.
+            conn = connection_class(
+                *args,
+                client_strategy=mock_strategies[client_strategy],
+                **kwargs
+            )
+            if kwargs.get('auto_bind') and not conn.bind():
+                raise LDAPBindError()
+            return conn
+
+        dit_connection = connection_class(
+            manager.server,
+            client_strategy=ldap3.MOCK_SYNC,
+        )
+        dit_connection.strategy.add_entry(
+            'cn=admin,dc=directory,dc=fsf,dc=org',
+            {'userPassword': 'toor'},
+        )
+        dit_connection.strategy.add_entry(
+            'cn=bob,ou=people,dc=directory,dc=fsf,dc=org',
+            {
+                'objectClass': 'inetOrgPerson',
+                'mail': 'bob@fsf.local',
+                'userPassword': 'foobarbaz',
+            },
+        )
+        registry = MagicMock()
+        registry.ldap_login_query = _LDAPQuery(
+            base_dn='ou=people,dc=directory,dc=fsf,dc=org',
+            filter_tmpl='(mail=%(login)s)',
+            scope=ldap3.LEVEL,
+            attributes=ldap3.ALL_ATTRIBUTES,
+            cache_period=0,
+        )
+        connector = Connector(registry, manager)
+        with patch.object(ldap3, 'Connection', side_effect=mock_connection):
+            for _ in range(2):
+                result = connector.authenticate('bob@fsf.local', 'foobarbaz')
+                assert result[0] == 'cn=bob,ou=people,dc=directory,dc=fsf,dc=org'  # nopep8
+            assert connector.authenticate('bob@fsf.local', 'wrong') is None
+        assert manager._idle_connections.qsize() == 1
+
+
+class TestLockStorage(StandardTest):
+
+    def _get_lock(self, depth: str='infinity', scope: str='exclusive'):
+        return {
+            'depth': depth,
+            'type': 'write',
+            'scope': scope,
+            'owner': b'<owner>bob</owner>',
+            'timeout': 60,
+            'principal': 'bob@fsf.local',
+        }
+
+    def test_unit__create_get__ok__nominal_case(self):
+        storage = LockStorage(self.session_factory)
+        lock = storage.create('/w1/folder/', self._get_lock(scope='shared'))
+        assert lock['root'] == '/w1/folder'
+        assert lock['token']
+
+        stored_lock = storage.get(lock['token'])
+        assert stored_lock['root'] == '/w1/folder'
+        assert stored_lock['owner'] == b'<owner>bob</owner>'
+        assert stored_lock['principal'] == 'bob@fsf.local'
+
+        storage.create('/w1/folder/file.txt', self._get_lock(scope='shared', depth='0'))  # nopep8
+        storage.create('/w1/folder_2', self._get_lock())
+        assert storage.getLockList(
+            '/w1/folder',
+            includeRoot=True,
+            includeChildren=False,
+            tokenOnly=True,
+        ) == [lock['token']]
+        children_locks = storage.getLockList(
+            '/w1/folder',
+            includeRoot=False,
+            includeChildren=True,
+            tokenOnly=False,
+        )
+        assert [
+            child_lock['root'] for child_lock in children_locks
+        ] == ['/w1/folder/file.txt']
+
+        assert storage.delete(lock['token']) is True
+        assert storage.get(lock['token']) is None
+        assert storage.delete(lock['token']) is False
+
+    def test_unit__create__err__conflicting_lock(self):
+        storage = LockStorage(self.session_factory)
+        lock = storage.create('/w1/folder', self._get_lock())
+        # INFO - G.M - 2019-04-19 - simulate lock of another process created
+        # after LockManager conflict check.
+        with pytest.raises(DAVError) as exc_info:
+            storage.create('/w1/folder/file.txt', self._get_lock(depth='0'))
+        assert exc_info.value.value == HTTP_LOCKED
+        assert storage.getLockList(
+            '/w1/folder',
+            includeRoot=True,
+            includeChildren=True,
+            tokenOnly=True,
+        ) == [lock['token']]
+
+    def test_unit__cleanup__ok__expired_locks_purged(self):
+        storage = LockStorage(self.session_factory)
+        lock = storage.create('/w1/folder', self._get_lock())
+        expired_lock = storage.create('/w1/folder_2', self._get_lock())
+        with patch('time.time', return_value=expired_lock['expire'] + 1):
+            assert storage.get(lock['token']) is None
+            assert storage.cleanup() == 2
+        assert storage.get(lock['token']) is None
+        refreshed_lock = storage.create('/w1/folder', self._get_lock())
+        storage.refresh(refreshed_lock['token'], timeout=120)
+        assert storage.get(refreshed_lock['token'])['timeout'] == 120
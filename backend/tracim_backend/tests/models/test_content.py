@@ -166,6 +166,30 @@ class TestContent(StandardTest):
         # Created dates must be equal
         assert revision_1.created == revision_2.created == revision_3.created
 
+    def test_unit__current_revision_id__ok__follow_new_revision(self):
+        content = self.test_create()
+        first_revision_id = content.revision_id
+        eq_(first_revision_id, content.current_revision_id)
+
+        with new_revision(
+                session=self.session,
+                tm=transaction.manager,
+                content=content
+        ):
+            content.description = 'TEST_CONTENT_DESCRIPTION_1_UPDATED'
+        self.session.flush()
+
+        assert content.current_revision_id != first_revision_id
+        eq_(content.revision.revision_id, content.current_revision_id)
+        content_from_query = self.session.query(Content).join(
+            ContentRevisionRO,
+            Content.current_revision_id == ContentRevisionRO.revision_id
+        ).filter(Content.id == content.id).one()
+        eq_(
+            'TEST_CONTENT_DESCRIPTION_1_UPDATED',
+            content_from_query.description
+        )
+
     def test_creates(self):
         eq_(
             0,
@@ -366,3 +390,61 @@ class TestContent(StandardTest):
             children.parent = None
         self.session.flush()
         assert parent.children == []
+
+    def test_unit_get_children_by_parent(self):
+        user_admin = self._get_user()
+        workspace = Workspace(label="TEST_WORKSPACE_1")
+        parent_1 = self._create_content(
+            owner=user_admin,
+            workspace=workspace,
+            type=content_type_list.Folder.slug,
+            label='TEST_CONTENT_1',
+            description='TEST_CONTENT_DESCRIPTION_1',
+            revision_type=ActionDescription.CREATION,
+        )
+        parent_2 = self._create_content(
+            owner=user_admin,
+            workspace=workspace,
+            type=content_type_list.Folder.slug,
+            label='TEST_CONTENT_2',
+            description='TEST_CONTENT_DESCRIPTION_2',
+            revision_type=ActionDescription.CREATION,
+        )
+        self.session.flush()
+        child_1 = self._create_content(
+            owner=user_admin,
+            workspace=workspace,
+            type=content_type_list.Folder.slug,
+            label='TEST_CHILD_1',
+            description='TEST_CHILD_DESCRIPTION_1',
+            revision_type=ActionDescription.CREATION,
+            parent=parent_1,
+        )
+        child_2 = self._create_content(
+            owner=user_admin,
+            workspace=workspace,
+            type=content_type_list.Folder.slug,
+            label='TEST_CHILD_2',
+            description='TEST_CHILD_DESCRIPTION_2',
+            revision_type=ActionDescription.CREATION,
+            parent=parent_1,
+        )
+        self.session.flush()
+        with new_revision(
+                session=self.session,
+                tm=transaction.manager,
+                content=child_2,
+        ):
+            child_2.parent = parent_2
+        self.session.flush()
+
+        children_by_parent = Content.get_children_by_parent(
+            self.session,
+            [parent_1.content_id, parent_2.content_id, child_1.content_id],
+        )
+        assert children_by_parent == {
+            parent_1.content_id: [child_1],
+            parent_2.content_id: [child_2],
+            child_1.content_id: [],
+        }
+        assert children_by_parent[parent_2.content_id][0].revision_id == child_2.revision_id  # nopep8
@@ -63,9 +63,7 @@ class CommentController(Controller):
         )
         comments = content.get_comments()
         comments.sort(key=lambda comment: comment.created)
-        return [api.get_content_in_context(comment)
-                for comment in comments
-        ]
+        return api.get_contents_in_context(comments)
 
     @hapic.with_api_doc(tags=[SWAGGER_TAG__CONTENT_COMMENT_ENDPOINTS])
     @hapic.handle_exception(EmptyCommentContentNotAllowed, HTTPStatus.BAD_REQUEST)  # nopep8
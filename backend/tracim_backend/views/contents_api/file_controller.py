@@ -16,6 +16,7 @@ from tracim_backend.exceptions import EmptyLabelNotAllowed
 from tracim_backend.exceptions import PageOfPreviewNotFound
 from tracim_backend.exceptions import ParentNotFound
 from tracim_backend.exceptions import PreviewDimNotAllowed
+from tracim_backend.exceptions import PreviewGenerationPending
 from tracim_backend.exceptions import TracimFileNotFound
 from tracim_backend.exceptions import TracimUnavailablePreviewType
 from tracim_backend.exceptions import UnallowedSubContent
@@ -131,6 +132,7 @@ class FileController(Controller):
                 new_mimetype=_file.type,
                 new_content=_file.file,
             )
+        api.enqueue_preview_generation(content)
 
         return api.get_content_in_context(content)
 
@@ -173,6 +175,7 @@ class FileController(Controller):
                 new_content=_file.file,
             )
         api.save(content)
+        api.enqueue_preview_generation(content)
         return
 
     @hapic.with_api_doc(tags=[SWAGGER_TAG__CONTENT_FILE_ENDPOINTS])
@@ -277,6 +280,7 @@ class FileController(Controller):
     @check_right(is_file_content)
     @hapic.handle_exception(TracimUnavailablePreviewType, HTTPStatus.BAD_REQUEST)
     @hapic.handle_exception(UnavailablePreview, HTTPStatus.BAD_REQUEST)
+    @hapic.handle_exception(PreviewGenerationPending, HTTPStatus.ACCEPTED)
     @hapic.handle_exception(PageOfPreviewNotFound, HTTPStatus.BAD_REQUEST)
     @hapic.input_query(PageQuerySchema())
     @hapic.input_path(FilePathSchema())
@@ -322,6 +326,7 @@ class FileController(Controller):
     @check_right(is_file_content)
     @hapic.handle_exception(TracimUnavailablePreviewType, HTTPStatus.BAD_REQUEST)
     @hapic.handle_exception(UnavailablePreview, HTTPStatus.BAD_REQUEST)
+    @hapic.handle_exception(PreviewGenerationPending, HTTPStatus.ACCEPTED)
     @hapic.input_query(FileQuerySchema())
     @hapic.input_path(FilePathSchema())
     @hapic.output_file([])
@@ -361,6 +366,7 @@ class FileController(Controller):
     @check_right(is_file_content)
     @hapic.handle_exception(TracimUnavailablePreviewType, HTTPStatus.BAD_REQUEST)
     @hapic.handle_exception(UnavailablePreview, HTTPStatus.BAD_REQUEST)
+    @hapic.handle_exception(PreviewGenerationPending, HTTPStatus.ACCEPTED)
     @hapic.input_path(FileRevisionPathSchema())
     @hapic.input_query(FileQuerySchema())
     @hapic.output_file([])
@@ -407,6 +413,7 @@ class FileController(Controller):
     @check_right(is_file_content)
     @hapic.handle_exception(TracimUnavailablePreviewType, HTTPStatus.BAD_REQUEST)
     @hapic.handle_exception(UnavailablePreview, HTTPStatus.BAD_REQUEST)
+    @hapic.handle_exception(PreviewGenerationPending, HTTPStatus.ACCEPTED)
     @hapic.input_path(FileRevisionPathSchema())
     @hapic.input_query(PageQuerySchema())
     @hapic.output_file([])
@@ -455,6 +462,7 @@ class FileController(Controller):
     @check_right(is_reader)
     @check_right(is_file_content)
     @hapic.handle_exception(UnavailablePreview, HTTPStatus.BAD_REQUEST)
+    @hapic.handle_exception(PreviewGenerationPending, HTTPStatus.ACCEPTED)
     @hapic.handle_exception(PageOfPreviewNotFound, HTTPStatus.BAD_REQUEST)
     @hapic.input_path(FilePathSchema())
     @hapic.input_query(PageQuerySchema())
@@ -502,6 +510,7 @@ class FileController(Controller):
     @check_right(is_reader)
     @check_right(is_file_content)
     @hapic.handle_exception(UnavailablePreview, HTTPStatus.BAD_REQUEST)
+    @hapic.handle_exception(PreviewGenerationPending, HTTPStatus.ACCEPTED)
     @hapic.handle_exception(PageOfPreviewNotFound, HTTPStatus.BAD_REQUEST)
     @hapic.handle_exception(PreviewDimNotAllowed, HTTPStatus.BAD_REQUEST)
     @hapic.input_query(PageQuerySchema())
@@ -551,6 +560,7 @@ class FileController(Controller):
     @check_right(is_reader)
     @check_right(is_file_content)
     @hapic.handle_exception(UnavailablePreview, HTTPStatus.BAD_REQUEST)
+    @hapic.handle_exception(PreviewGenerationPending, HTTPStatus.ACCEPTED)
     @hapic.handle_exception(PageOfPreviewNotFound, HTTPStatus.BAD_REQUEST)
     @hapic.handle_exception(PreviewDimNotAllowed, HTTPStatus.BAD_REQUEST)
     @hapic.input_path(FileRevisionPreviewSizedPathSchema())
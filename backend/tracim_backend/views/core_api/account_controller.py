@@ -230,10 +230,7 @@ class AccountController(Controller):
             limit=content_filter.limit or None,
             before_content=before_content,
         )
-        return [
-            api.get_content_in_context(content)
-            for content in last_actives
-        ]
+        return api.get_contents_in_context(last_actives)
 
     @hapic.with_api_doc(tags=[SWAGGER_TAG__ACCOUNT_CONTENT_ENDPOINTS])
     @check_right(is_user)
@@ -265,10 +262,7 @@ class AccountController(Controller):
             before_content=None,
             content_ids=hapic_data.query.content_ids or None
         )
-        return [
-            api.get_content_in_context(content)
-            for content in last_actives
-        ]
+        return api.get_contents_in_context(last_actives)
 
     @hapic.with_api_doc(tags=[SWAGGER_TAG__ACCOUNT_CONTENT_ENDPOINTS])
     @check_right(is_user)
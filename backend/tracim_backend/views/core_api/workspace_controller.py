@@ -466,10 +466,7 @@ class WorkspaceController(Controller):
             label=content_filter.label,
             order_by_properties=[Content.label]
         )
-        contents = [
-            api.get_content_in_context(content) for content in contents
-        ]
-        return contents
+        return api.get_contents_in_context(contents)
 
     @hapic.with_api_doc(tags=[SWAGGER_TAG__CONTENT_ENDPOINTS])
     @hapic.handle_exception(EmptyLabelNotAllowed, HTTPStatus.BAD_REQUEST)